@@ -0,0 +1,169 @@
+"""asyncio 执行核心: 一个事件循环线程承载本地 Job / plan 步骤的子进程, 以及合并日志广播的 LogHub、跨线程广播的 EmitBridge
+
+Flask / Socket.IO 接口保持不变; 原来每个本地 Job、每次 plan 运行各占一个线程 (阻塞在
+communicate / subprocess.run 上), 现在都是同一事件循环中的 task, 子进程输出按块流式读取。
+paramiko 没有 asyncio 接口, SSH 执行仍在独立线程中。
+"""
+
+import queue
+import signal
+import asyncio
+import threading
+
+from process_registry import signal_group
+
+READ_SIZE = 64 * 1024
+
+
+class AsyncCore:
+    """后台事件循环线程; submit() 可从任意线程 (含 eventlet greenlet) 调用"""
+
+    def __init__(self, name='ez-aio'):
+        self.name = name
+        self.loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._active = 0
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            ready = threading.Event()
+            self._thread = threading.Thread(target=self._run, args=(ready,), name=self.name, daemon=True)
+            self._thread.start()
+            ready.wait()
+
+    def _run(self, ready):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        ready.set()
+        self.loop.run_forever()
+
+    def submit(self, coro):
+        """在事件循环中运行协程, 返回 concurrent.futures.Future; 未捕获异常会被打印"""
+        self.start()
+        with self._lock:
+            self._active += 1
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, future):
+        with self._lock:
+            self._active -= 1
+        if not future.cancelled() and future.exception() is not None:
+            exc = future.exception()
+            print(f'Async task failed: {type(exc).__name__}: {exc}')
+
+    def tasks(self):
+        """经 submit() 提交且尚未完成的协程数"""
+        return self._active
+
+
+async def run_process(cmd, env=None, cwd=None, timeout=None, on_start=None, on_output=None, grace=5):
+    """以独立进程组启动子进程, stdout/stderr 合并后按块读取
+
+    on_start(proc):   进程启动后调用 (用于登记取消)
+    on_output(text):  每次读到完整行时调用 (可能包含多行, 末尾不含换行)
+    返回 (exit_code, output, timed_out); 超时则 SIGTERM 整个进程组, 组长退出或 grace 秒后对整组 SIGKILL
+    """
+    proc = await asyncio.create_subprocess_exec(
+        *cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT,
+        env=env, cwd=cwd, start_new_session=True
+    )
+    if on_start:
+        on_start(proc)
+    parts = []
+
+    async def pump():
+        pending = b''
+        while True:
+            data = await proc.stdout.read(READ_SIZE)
+            if not data:
+                break
+            parts.append(data)
+            if on_output:
+                pending += data
+                head, sep, pending = pending.rpartition(b'\n')
+                if sep:
+                    on_output(head.decode('utf-8', errors='replace'))
+        if on_output and pending:
+            on_output(pending.decode('utf-8', errors='replace'))
+        await proc.wait()
+
+    timed_out = False
+    try:
+        await asyncio.wait_for(pump(), timeout)
+    except asyncio.TimeoutError:
+        timed_out = True
+        signal_group(proc.pid, signal.SIGTERM)
+        try:
+            await asyncio.wait_for(proc.wait(), grace)
+        except asyncio.TimeoutError:
+            pass
+        # 组长已退出时子孙进程可能仍在 (忽略 SIGTERM), 同样整组结束
+        signal_group(proc.pid, signal.SIGKILL)
+        await proc.wait()
+    return proc.returncode, b''.join(parts).decode('utf-8', errors='replace'), timed_out
+
+
+class EmitBridge:
+    """跨线程广播: eventlet (未 monkey patch) 只在 hub 所在的主线程上工作, 其他 OS 线程 (事件循环、SSH 执行线程)
+    直接 emit 会被静默丢弃。这些线程的广播排队, 由主线程中的后台任务 flush() 发送; dict 负载按调用时的内容复制。
+    """
+
+    def __init__(self, emit):
+        self.emit = emit
+        self._queue = queue.Queue()
+
+    def __call__(self, event, *args, **kwargs):
+        if threading.current_thread() is not threading.main_thread():
+            self._queue.put((event, tuple(dict(a) if isinstance(a, dict) else a for a in args), kwargs))
+            return None
+        return self.emit(event, *args, **kwargs)
+
+    def flush(self):
+        while True:
+            try:
+                event, args, kwargs = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                self.emit(event, *args, **kwargs)
+            except Exception as e:
+                print(f'Emit failed ({event}): {e}')
+
+    def pending(self):
+        return self._queue.qsize()
+
+
+class LogHub:
+    """日志扇出: 按 Job 合并两次 flush 之间的日志, 每个 Job 每次 flush 只广播一次
+
+    publish() 线程安全, 只做追加; flush() 由 Socket.IO 所在的并发模型 (eventlet 等) 中的后台任务
+    定期调用, 避免从其他 OS 线程直接向 eventlet hub 广播。emit(job_id, text) 由调用方提供。
+    """
+
+    def __init__(self, emit):
+        self.emit = emit
+        self._lock = threading.Lock()
+        self._pending = {}
+
+    def publish(self, job_id, text):
+        with self._lock:
+            chunks = self._pending.get(job_id)
+            if chunks is None:
+                chunks = self._pending[job_id] = []
+            chunks.append(text)
+
+    def flush(self):
+        if not self._pending:
+            return
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        for job_id, chunks in pending.items():
+            try:
+                self.emit(job_id, '\n'.join(chunks))
+            except Exception as e:
+                print(f'Log fan-out failed ({job_id}): {e}')
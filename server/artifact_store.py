@@ -0,0 +1,214 @@
+"""内容寻址制品存储 (.ez-server/artifacts/objects/<ab>/<sha256>)"""
+
+import os
+import json
+import shutil
+import hashlib
+from threading import Lock
+
+import transfer
+
+try:
+    import fcntl
+except ImportError:  # 非 POSIX 平台
+    fcntl = None
+
+FICLONE = 0x40049409  # Linux ioctl: reflink (btrfs / xfs)
+
+
+def _reflink(src, dst):
+    """写时复制克隆, 不支持时抛 OSError"""
+    if fcntl is None:
+        raise OSError('reflink not supported')
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+
+
+def _clone_or_copy(src, dst):
+    try:
+        _reflink(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
+class ArtifactStore:
+    """按 sha256 去重保存制品, 以 reflink / 硬链接方式取出
+
+    对象文件只读 (0444), 但 root 身份的任务仍可原地改写; 以硬链接取出的文件与对象共享 inode,
+    原地改写会污染库内对象, 因此硬链接需显式开启, 且只适合不改写输入的任务。
+    link_mode: reflink (默认, 不支持时回落复制) / hardlink (失败回落 reflink, 再回落复制) / copy
+    """
+
+    def __init__(self, root, link_mode='reflink'):
+        self.root = root
+        self.link_mode = link_mode
+        self._upload_lock = Lock()
+
+    def path(self, digest):
+        return os.path.join(self.root, 'objects', digest[:2], digest)
+
+    def has(self, digest):
+        return os.path.isfile(self.path(digest))
+
+    def verify(self, digest):
+        """对象存在且内容与 digest 一致; 内容已被改写的对象移出库 (之后按缺失处理, 重新生成时再存入)"""
+        obj = self.path(digest)
+        try:
+            if _digest_of(obj) == digest:
+                return True
+        except OSError:
+            return False
+        try:
+            os.remove(obj)
+        except OSError:
+            pass
+        return False
+
+    def put(self, src):
+        """存入文件, 返回 (digest, size); 内容已存在时不产生任何写入"""
+        digest = _digest_of(src)
+        size = os.path.getsize(src)
+        target = self.path(digest)
+        if os.path.isfile(target):
+            return digest, size
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        tmp = f'{target}.{os.getpid()}.tmp'
+        _clone_or_copy(src, tmp)
+        os.chmod(tmp, 0o444)
+        os.replace(tmp, target)
+        return digest, size
+
+    def materialize(self, digest, dest):
+        """把对象放到 dest (覆盖已有文件)"""
+        obj = self.path(digest)
+        if not os.path.isfile(obj):
+            raise FileNotFoundError(f'artifact {digest} not in store')
+        os.makedirs(os.path.dirname(dest) or '.', exist_ok=True)
+        if os.path.lexists(dest):
+            os.remove(dest)
+        if self.link_mode == 'hardlink':
+            try:
+                os.link(obj, dest)
+                return
+            except OSError:
+                pass
+        if self.link_mode in ('hardlink', 'reflink'):
+            try:
+                _reflink(obj, dest)
+                return
+            except OSError:
+                pass
+        shutil.copyfile(obj, dest)
+
+    def manifest(self, digest, chunk_size=transfer.CHUNK_SIZE):
+        """对象的分块清单 (对象不可变, 计算结果缓存到 manifests/)"""
+        cache = os.path.join(self.root, 'manifests', digest[:2], f'{digest}.{chunk_size}.json')
+        try:
+            with open(cache, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            pass
+        manifest = transfer.build_manifest(self.path(digest), chunk_size)
+        os.makedirs(os.path.dirname(cache), exist_ok=True)
+        tmp = f'{cache}.{os.getpid()}.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f)
+        os.replace(tmp, cache)
+        return manifest
+
+    # ------------------------------------------------------------------
+    # 分块上传会话: uploads/<digest>/{manifest.json, data, done}
+    # ------------------------------------------------------------------
+
+    def begin_upload(self, manifest):
+        """开始或续传上传, 返回仍缺失的块序号 (对象已存在时为空)"""
+        digest = manifest['digest']
+        if self.has(digest):
+            return []
+        session = self._session(digest)
+        with self._upload_lock:
+            os.makedirs(session, exist_ok=True)
+            saved = self._session_manifest(digest)
+            if saved != manifest:
+                # 新会话或清单变化 (如换了块大小): 重新开始
+                for name in ('data', 'done'):
+                    if os.path.exists(os.path.join(session, name)):
+                        os.remove(os.path.join(session, name))
+                with open(os.path.join(session, 'manifest.json'), 'w', encoding='utf-8') as f:
+                    json.dump(manifest, f)
+            done = self._done(digest)
+        return [i for i in range(len(manifest['chunks'])) if i not in done]
+
+    def write_upload_chunk(self, digest, index, stream):
+        """写入一块 (校验 sha256), 会话不存在抛 KeyError, 校验失败抛 ValueError"""
+        manifest = self._session_manifest(digest)
+        if manifest is None:
+            raise KeyError(digest)
+        if not 0 <= index < len(manifest['chunks']):
+            raise ValueError(f'chunk {index} out of range')
+        session = self._session(digest)
+        transfer.write_chunk(os.path.join(session, 'data'), manifest, index, stream)
+        with self._upload_lock:
+            with open(os.path.join(session, 'done'), 'a') as f:
+                f.write(f'{index}\n')
+
+    def commit_upload(self, digest):
+        """全部块到齐后校验整体 digest 并入库, 返回 size"""
+        manifest = self._session_manifest(digest)
+        if manifest is None:
+            if self.has(digest):
+                return os.path.getsize(self.path(digest))
+            raise KeyError(digest)
+        missing = [i for i in range(len(manifest['chunks'])) if i not in self._done(digest)]
+        if missing:
+            raise ValueError(f'{len(missing)} chunks missing')
+        session = self._session(digest)
+        data = os.path.join(session, 'data')
+        with open(data, 'ab') as f:
+            f.truncate(manifest['size'])
+        if _digest_of(data) != digest:
+            shutil.rmtree(session, ignore_errors=True)
+            raise ValueError('digest mismatch')
+        target = self.path(digest)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.chmod(data, 0o444)
+        os.replace(data, target)
+        shutil.rmtree(session, ignore_errors=True)
+        return manifest['size']
+
+    def _session(self, digest):
+        return os.path.join(self.root, 'uploads', digest)
+
+    def _session_manifest(self, digest):
+        try:
+            with open(os.path.join(self._session(digest), 'manifest.json'), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _done(self, digest):
+        try:
+            with open(os.path.join(self._session(digest), 'done'), 'r') as f:
+                return {int(line) for line in f if line.strip()}
+        except OSError:
+            return set()
+
+    def detach(self, path):
+        """path 若有多个硬链接 (可能指向库内对象), 换成独立副本, 避免原地写入污染对象 (root 不受 0444 限制)"""
+        try:
+            if os.stat(path).st_nlink < 2:
+                return
+        except OSError:
+            return
+        tmp = f'{path}.{os.getpid()}.tmp'
+        _clone_or_copy(path, tmp)
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, path)
+
+
+def _digest_of(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(chunk)
+    return h.hexdigest()
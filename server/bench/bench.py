@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+"""
+EZ Server 基准测试 - 热点接口耗时 (可复现, JSON 输出, 基线对比)
+
+    python3 server/bench/bench.py -o result.json
+    python3 server/bench/bench.py --baseline result.json      # 超过阈值的退化以非 0 退出
+
+在临时目录中按固定随机种子生成合成 ez.db 与 EZ_ROOT, 通过 Flask test client 调用接口,
+不经过网络栈, 结果只反映 Server 内部开销。
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+from datetime import datetime, timedelta
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+STATUSES = ['success'] * 8 + ['failed', 'error']
+
+
+# =============================================================================
+# 合成数据
+# =============================================================================
+
+def seed_root(root, n_tasks, n_inline, n_plans, rnd):
+    """生成 EZ_ROOT: Taskfile.yml 行内任务 + tasks/ 目录任务 + plans/"""
+    lines = ['version: "3"', 'tasks:']
+    for i in range(n_inline):
+        lines += [f'  inline-{i}:', f'    desc: "inline task {i}"', '    cmds:', f'      - echo {i}']
+        if i % 5 == 0:
+            lines += ['    ez-params:', '      - name: "name"', '        default: "x"']
+    with open(os.path.join(root, 'Taskfile.yml'), 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+
+    for i in range(n_tasks):
+        d = os.path.join(root, 'tasks', f'task-{i:05d}')
+        os.makedirs(d)
+        with open(os.path.join(d, 'Taskfile.yml'), 'w') as f:
+            f.write(f'version: "3"\ntasks:\n  default:\n    cmds:\n      - echo task-{i}\n')
+        with open(os.path.join(d, 'task.yml'), 'w') as f:
+            params = '\n'.join(f'  - name: p{j}\n    default: "{j}"' for j in range(rnd.randint(0, 3)))
+            f.write(f'desc: "directory task {i}"\nparams:\n{params}\n' if params else f'desc: "directory task {i}"\n')
+
+    os.makedirs(os.path.join(root, 'plans'))
+    for i in range(n_plans):
+        steps = []
+        for j in range(rnd.randint(2, 8)):
+            steps.append(f'  - name: s{j}\n    task: task-{rnd.randrange(max(n_tasks, 1)):05d}'
+                         + (f'\n    needs: [s{j - 1}]' if j else ''))
+        with open(os.path.join(root, 'plans', f'plan-{i:04d}.yml'), 'w') as f:
+            f.write(f'name: plan-{i:04d}\ndesc: "synthetic plan {i}"\nsteps:\n' + '\n'.join(steps) + '\n')
+
+
+def seed_db(server, n_jobs, n_runs, n_execs, n_tasks, rnd, now):
+    """批量写入 jobs / job_events / plan_runs / plan_run_steps / executions (时间分布在最近 30 天)"""
+    def ts(max_days=30):
+        return (now - timedelta(seconds=rnd.randint(0, max_days * 86400))).isoformat()
+
+    tasks = [f'task-{i:05d}' for i in range(max(n_tasks, 1))]
+    job_rows, event_rows = [], []
+    for _ in range(n_jobs):
+        job_id = uuid.UUID(int=rnd.getrandbits(128)).hex[:8]
+        created = ts()
+        status = rnd.choice(STATUSES)
+        job_rows.append((job_id, rnd.choice(tasks), f'node-{rnd.randrange(50)}', '{}', status,
+                         0 if status == 'success' else 1, 'log line\n' * rnd.randint(1, 50),
+                         created, created, created))
+        event_rows.append((job_id, status, None, created))
+
+    run_rows, step_rows = [], []
+    for i in range(n_runs):
+        run_id = f'run-{i:07d}'
+        created = ts()
+        status = rnd.choice(STATUSES)
+        n_steps = rnd.randint(2, 8)
+        run_rows.append((run_id, f'plan-{rnd.randrange(200):04d}', status, rnd.uniform(1, 600),
+                         n_steps, n_steps, created, created, created))
+        for j in range(n_steps):
+            step_rows.append((run_id, f's{j}', rnd.choice(tasks), status, 0, 'step log\n' * 5,
+                              created, created, rnd.uniform(0.1, 100)))
+
+    exec_rows = []
+    for _ in range(n_execs):
+        created = ts()
+        exec_rows.append((rnd.choice(tasks), rnd.choice([0, 0, 0, 1]), rnd.uniform(0.1, 300),
+                          f'host-{rnd.randrange(20)}', created, created.replace('T', ' ')))
+
+    with server.get_db() as conn:
+        conn.executemany('''INSERT INTO jobs (id, task, node_id, vars, status, exit_code, logs,
+                            started_at, finished_at, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                         job_rows)
+        conn.executemany('INSERT INTO job_events (job_id, status, node_id, created_at) VALUES (?, ?, ?, ?)',
+                         event_rows)
+        conn.executemany('''INSERT INTO plan_runs (id, plan_name, status, duration, total_steps,
+                            completed_steps, started_at, finished_at, created_at)
+                            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''', run_rows)
+        conn.executemany('''INSERT INTO plan_run_steps (run_id, step_name, task_name, status, exit_code,
+                            logs, started_at, finished_at, duration) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                         step_rows)
+        conn.executemany('''INSERT INTO executions (task, exit_code, duration, host, timestamp, created_at)
+                            VALUES (?, ?, ?, ?, ?, ?)''', exec_rows)
+        conn.commit()
+    return job_rows
+
+
+def seed_memory(server, job_rows, n_memory):
+    """把最近的 n_memory 个 Job 放入内存注册表, 模拟长时间运行的 Server"""
+    for r in sorted(job_rows, key=lambda r: r[9])[-n_memory:]:
+        server.jobs.add({'id': r[0], 'task': r[1], 'node_id': r[2], 'vars': {}, 'status': r[4],
+                         'exit_code': r[5], 'logs': r[6], 'started_at': r[7], 'finished_at': r[8],
+                         'created_at': r[9]}, notify=False)
+    for i in range(50):
+        server.nodes[f'node-{i}'] = {'id': f'node-{i}', 'name': f'node-{i}', 'status': 'online',
+                                     'tags': [], 'slots': 4, 'connection_type': 'agent',
+                                     'last_seen': datetime.now().isoformat()}
+
+
+# =============================================================================
+# 计时
+# =============================================================================
+
+def summarize(samples):
+    """耗时列表 (秒) -> 统计 (毫秒)"""
+    s = sorted(samples)
+
+    def pct(p):
+        return s[min(len(s) - 1, int(round(p / 100.0 * (len(s) - 1))))]
+
+    return {
+        'n': len(s),
+        'min_ms': round(s[0] * 1000, 3),
+        'p50_ms': round(pct(50) * 1000, 3),
+        'p90_ms': round(pct(90) * 1000, 3),
+        'p99_ms': round(pct(99) * 1000, 3),
+        'mean_ms': round(sum(s) / len(s) * 1000, 3),
+        'max_ms': round(s[-1] * 1000, 3),
+    }
+
+
+def bench_call(fn, repeat, warmup):
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+
+def get_ok(client, url):
+    def call():
+        resp = client.get(url)
+        if resp.status_code != 200:
+            raise RuntimeError(f'{url}: HTTP {resp.status_code}')
+    return call
+
+
+def bench_log_ingest(server, lines, batch):
+    """job_log 事件吞吐: 经 Socket.IO test client 发送 lines 行, 每 batch 行计一次耗时"""
+    job_id = 'bench-log'
+    server.jobs.add({'id': job_id, 'task': 'task-00000', 'node_id': 'node-0', 'vars': {}, 'status': 'running',
+                     'logs': '', 'created_at': datetime.now().isoformat()}, notify=False)
+    sio = server.socketio.test_client(server.app)
+    samples = []
+    start_all = time.perf_counter()
+    for i in range(0, lines, batch):
+        start = time.perf_counter()
+        for j in range(i, min(i + batch, lines)):
+            sio.emit('job_log', {'job_id': job_id, 'log': f'line {j} ' + 'x' * 80})
+        samples.append((time.perf_counter() - start) / max(1, min(batch, lines - i)))
+    elapsed = time.perf_counter() - start_all
+    sio.disconnect()
+    result = summarize(samples)
+    result['lines_per_sec'] = round(lines / elapsed, 1)
+    return result
+
+
+def run_benchmarks(server, args):
+    client = server.app.test_client()
+    r, w = args.repeat, args.warmup
+    results = {}
+
+    def record(name, stats):
+        results[name] = stats
+        print(f'  {name:<28} p50 {stats["p50_ms"]:>10.3f} ms   p90 {stats["p90_ms"]:>10.3f} ms'
+              + (f'   {stats["lines_per_sec"]:.0f} lines/s' if 'lines_per_sec' in stats else ''))
+
+    record('api_dashboard', bench_call(get_ok(client, '/api/v1/dashboard'), r, w))
+    record('api_list_executions', bench_call(get_ok(client, '/api/v1/executions?limit=50'), r, w))
+    record('api_list_executions_filtered',
+           bench_call(get_ok(client, '/api/v1/executions?status=failed&search=task-0001&limit=50'), r, w))
+    record('api_stats', bench_call(get_ok(client, '/api/v1/stats'), r, w))
+
+    def tree_cold():
+        server._invalidate_cache()
+        get_ok(client, '/api/v1/tasks/tree')()
+    record('api_task_tree_cold', bench_call(tree_cold, max(3, r // 5), 1))
+    record('api_task_tree_warm', bench_call(get_ok(client, '/api/v1/tasks/tree'), r, w))
+    record('api_list_plans', bench_call(get_ok(client, '/api/v1/plans'), r, w))
+    record('log_ingest', bench_log_ingest(server, args.log_lines, 100))
+    return results
+
+
+# =============================================================================
+# 基线对比
+# =============================================================================
+
+def compare(results, baseline, threshold, metric):
+    """对比 metric (默认 p50_ms), 返回退化项列表"""
+    regressions = []
+    print(f'\n{"benchmark":<30}{"baseline":>12}{"current":>12}{"change":>10}')
+    for name, stats in results.items():
+        base = baseline.get('results', {}).get(name)
+        if not base or metric not in base:
+            print(f'{name:<30}{"-":>12}{stats[metric]:>12.3f}{"new":>10}')
+            continue
+        # 吞吐量越大越好, 其余越小越好
+        higher_better = metric == 'lines_per_sec'
+        old, new = base[metric], stats[metric]
+        change = (new - old) / old if old else 0.0
+        worse = -change if higher_better else change
+        flag = '  REGRESSION' if worse > threshold else ''
+        print(f'{name:<30}{old:>12.3f}{new:>12.3f}{change * 100:>9.1f}%{flag}')
+        if worse > threshold:
+            regressions.append(name)
+    return regressions
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=SERVER_DIR,
+                              capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='EZ Server benchmark')
+    parser.add_argument('-o', '--output', help='写入 JSON 结果')
+    parser.add_argument('--baseline', help='与基线 JSON 对比, 退化超过阈值时退出码为 1')
+    parser.add_argument('--threshold', type=float, default=0.2, help='退化阈值 (比例, 默认 0.2)')
+    parser.add_argument('--metric', default='p50_ms', help='对比指标 (默认 p50_ms)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--jobs', type=int, default=50000, help='jobs 表行数')
+    parser.add_argument('--memory-jobs', type=int, default=5000, help='内存注册表中的 Job 数')
+    parser.add_argument('--plan-runs', type=int, default=5000)
+    parser.add_argument('--executions', type=int, default=100000)
+    parser.add_argument('--tasks', type=int, default=2000, help='目录任务数')
+    parser.add_argument('--inline-tasks', type=int, default=300)
+    parser.add_argument('--plans', type=int, default=200)
+    parser.add_argument('--log-lines', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=30)
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--keep', action='store_true', help='保留生成的临时目录')
+    args = parser.parse_args()
+
+    rnd = random.Random(args.seed)
+    # 固定 "现在", 使数据分布与时间窗口统计在多次运行间一致
+    now = datetime.now().replace(microsecond=0)
+    root = tempfile.mkdtemp(prefix='ez-bench-')
+    os.environ['EZ_ROOT'] = root
+    os.environ['EZ_DB_PATH'] = os.path.join(root, '.ez-server', 'ez.db')
+    os.makedirs(os.path.join(root, '.ez-server'))
+    sys.path.insert(0, SERVER_DIR)
+
+    try:
+        print(f'Seeding {root} (seed={args.seed}) ...')
+        t0 = time.perf_counter()
+        seed_root(root, args.tasks, args.inline_tasks, args.plans, rnd)
+        import main as server
+        server.init_db()
+        job_rows = seed_db(server, args.jobs, args.plan_runs, args.executions, args.tasks, rnd, now)
+        seed_memory(server, job_rows, args.memory_jobs)
+        print(f'Seeded in {time.perf_counter() - t0:.1f}s\n')
+
+        results = run_benchmarks(server, args)
+        report = {
+            'meta': {
+                'timestamp': datetime.now().isoformat(),
+                'git': git_revision(),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'params': {k: v for k, v in vars(args).items() if k not in ('output', 'baseline', 'keep')},
+            },
+            'results': results,
+        }
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(report, f, indent=2)
+            print(f'\nResults written to {args.output}')
+
+        if args.baseline:
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+            if baseline.get('meta', {}).get('params') != report['meta']['params']:
+                print('\nWarning: baseline was recorded with different parameters')
+            regressions = compare(results, baseline, args.threshold, args.metric)
+            if regressions:
+                print(f'\n{len(regressions)} regression(s) over {args.threshold * 100:.0f}%: {", ".join(regressions)}')
+                sys.exit(1)
+            print('\nNo regressions')
+    finally:
+        if args.keep:
+            print(f'Kept {root}')
+        else:
+            shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,411 @@
+#!/usr/bin/env python3
+"""
+EZ Server 负载测试 - 在单个进程中模拟大量 Agent
+
+    python3 server/bench/fleet_sim.py --server http://localhost:8080 --agents 200 --slots 2 \\
+        --jobs 2000 --submit-rate 50 --job-duration 5 --log-rate 20 -o fleet.json
+
+每个模拟 Agent 实现 agent.py 的协议: WebSocket node_register / node_ping / job_ack / job_log (带 seq),
+HTTP 上报结果 (日志序号 + digest, 缺尾时补传)。Job 以本次运行专属的标签提交, 只会派发给模拟 Agent, 不会在 Server 本地执行。
+定期抓取 /metrics 报告派发延迟、日志写入吞吐、丢失的日志行与 Server RSS 随时间的变化。
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import hashlib
+import argparse
+import threading
+from datetime import datetime
+
+try:
+    import socketio
+    import requests
+except ImportError:
+    print("Missing dependencies. Please install: pip install python-socketio requests websocket-client")
+    sys.exit(1)
+
+
+class Stats:
+    """全局计数 (线程安全)"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.submit_times = {}    # job_id -> 提交时间
+        self.assign_times = {}    # job_id -> 模拟 Agent 收到 job_assigned 的时间
+        self.latencies = []       # 派发延迟 (秒)
+        self.window_latencies = []
+        self.counts = {'submitted': 0, 'submit_failed': 0, 'assigned': 0, 'ack_failed': 0,
+                       'completed': 0, 'result_failed': 0, 'revoked': 0, 'log_sent': 0,
+                       'log_send_failed': 0, 'log_resent': 0, 'connect_failed': 0}
+
+    def inc(self, key, n=1):
+        with self.lock:
+            self.counts[key] += n
+
+    def submitted(self, job_id, t):
+        with self.lock:
+            self.counts['submitted'] += 1
+            self.submit_times[job_id] = t
+            self._match(job_id)
+
+    def assigned(self, job_id, t):
+        with self.lock:
+            self.counts['assigned'] += 1
+            self.assign_times[job_id] = t
+            self._match(job_id)
+
+    def _match(self, job_id):
+        # job_assigned 可能先于提交请求的响应到达, 两者都到齐后计算延迟
+        if job_id in self.submit_times and job_id in self.assign_times:
+            latency = self.assign_times.pop(job_id) - self.submit_times.pop(job_id)
+            self.latencies.append(latency)
+            self.window_latencies.append(latency)
+
+    def take_window(self):
+        with self.lock:
+            window, self.window_latencies = self.window_latencies, []
+            return window, dict(self.counts)
+
+
+class FakeAgent:
+    """模拟 Agent: 收到任务后 ack, 按设定速率发送日志, 持续 job_duration 秒后上报结果"""
+
+    def __init__(self, index, args, stats, tag, rnd):
+        self.node_id = f'sim-{tag.split(":")[-1]}-{index:04d}'
+        self.args = args
+        self.stats = stats
+        self.tag = tag
+        self.rnd = rnd
+        self.active = {}  # job_id -> threading.Event (置位表示停止)
+        self.sent = {}    # job_id -> 已发送日志行数 (第 seq 行内容可由 log_line 重新生成)
+        self.lock = threading.Lock()
+        self.alive = True
+        self.http = requests.Session()
+        self.sio = socketio.Client(reconnection=True, reconnection_delay=1)
+        self.sio.on('connect', self.on_connect)
+        self.sio.on('job_assigned', self.on_job_assigned)
+        self.sio.on('job_cancel', lambda data: self.stop(data.get('job_id')))
+        self.sio.on('job_revoked', self.on_job_revoked)
+        self.sio.on('job_log_resend', self.on_job_log_resend)
+
+    def headers(self):
+        return {'Authorization': f'Bearer {self.args.token}'} if self.args.token else {}
+
+    def start(self):
+        try:
+            self.sio.connect(self.args.server, headers=self.headers(),
+                             transports=[self.args.transport], wait_timeout=10)
+        except Exception as e:
+            self.stats.inc('connect_failed')
+            print(f'{self.node_id}: connect failed: {e}')
+            return False
+        threading.Thread(target=self.heartbeat_loop, daemon=True).start()
+        return True
+
+    def close(self):
+        self.alive = False
+        for event in list(self.active.values()):
+            event.set()
+        try:
+            self.sio.disconnect()
+        except Exception:
+            pass
+
+    def running(self):
+        with self.lock:
+            return list(self.active)
+
+    def on_connect(self):
+        self.sio.emit('node_register', {'id': self.node_id, 'name': self.node_id, 'tags': [self.tag],
+                                        'slots': self.args.slots, 'running': self.running()})
+
+    def on_job_assigned(self, job):
+        self.stats.assigned(job['id'], time.time())
+        threading.Thread(target=self.run_job, args=(job,), daemon=True).start()
+
+    def on_job_revoked(self, data):
+        for job_id in data.get('job_ids', []):
+            self.stats.inc('revoked')
+            self.stop(job_id)
+
+    def log_line(self, seq):
+        return f'{seq} ' + 'x' * self.args.log_size
+
+    def on_job_log_resend(self, data):
+        job_id = data.get('job_id')
+        for seq in range(data.get('from_seq', 1), self.sent.get(job_id, 0) + 1):
+            self.sio.emit('job_log', {'job_id': job_id, 'node_id': self.node_id, 'seq': seq,
+                                      'log': self.log_line(seq)})
+            self.stats.inc('log_resent')
+
+    def stop(self, job_id):
+        with self.lock:
+            event = self.active.get(job_id)
+        if event:
+            event.set()
+
+    def heartbeat_loop(self):
+        while self.alive:
+            time.sleep(self.args.heartbeat)
+            if self.sio.connected:
+                try:
+                    ids = self.running()
+                    self.sio.emit('node_ping', {'id': self.node_id, 'slots': self.args.slots,
+                                                'running': ids, 'load': {'busy': len(ids),
+                                                         'cpu': 100.0 * len(ids) / self.args.slots}})
+                except Exception:
+                    pass
+
+    def run_job(self, job):
+        job_id = job['id']
+        try:
+            ack = self.sio.call('job_ack', {'job_id': job_id, 'node_id': self.node_id}, timeout=10)
+        except Exception:
+            ack = None
+        if not ack or not ack.get('ok'):
+            self.stats.inc('ack_failed')
+            return
+
+        stop = threading.Event()
+        with self.lock:
+            self.active[job_id] = stop
+        duration = self.args.job_duration * self.rnd.uniform(0.8, 1.2)
+        interval = 1.0 / self.args.log_rate if self.args.log_rate > 0 else None
+        sha = hashlib.sha256()
+        sent = 0
+        deadline = time.time() + duration
+        while time.time() < deadline and not stop.is_set():
+            if interval is None:
+                stop.wait(deadline - time.time())
+                break
+            line = self.log_line(sent + 1)
+            sent += 1
+            self.sent[job_id] = sent
+            sha.update((line + '\n').encode())
+            try:
+                self.sio.emit('job_log', {'job_id': job_id, 'node_id': self.node_id, 'seq': sent, 'log': line})
+            except Exception:
+                self.stats.inc('log_send_failed')
+            stop.wait(interval)
+        self.stats.inc('log_sent', sent)
+
+        with self.lock:
+            self.active.pop(job_id, None)
+        result = {'node_id': self.node_id, 'status': 'cancelled' if stop.is_set() else 'success',
+                  'exit_code': 0, 'log_seq': sent, 'log_digest': sha.hexdigest()}
+        try:
+            for attempt in range(3):
+                try:
+                    resp = self.http.post(f'{self.args.server}/api/v1/jobs/{job_id}/result', json=result,
+                                          headers=self.headers(), timeout=30)
+                    if resp.status_code == 200:
+                        self.stats.inc('completed')
+                        return
+                    if resp.status_code == 409 and resp.json().get('log_from_seq'):
+                        first = resp.json()['log_from_seq']
+                        result['log_tail'] = {'from_seq': first, 'text': ''.join(
+                            self.log_line(seq) + '\n' for seq in range(first, sent + 1))}
+                        self.stats.inc('log_resent', sent + 1 - first)
+                        continue
+                except requests.RequestException:
+                    pass
+                time.sleep(1)
+            self.stats.inc('result_failed')
+        finally:
+            self.sent.pop(job_id, None)
+
+
+# =============================================================================
+# 提交 / 指标抓取 / 报告
+# =============================================================================
+
+def submit_loop(args, stats, tag, stop):
+    """按 submit_rate 提交 Job, 直到达到 jobs 数或 stop"""
+    http = requests.Session()
+    headers = {'Authorization': f'Bearer {args.token}'} if args.token else {}
+    interval = 1.0 / args.submit_rate
+    next_at = time.time()
+    n = 0
+    while not stop.is_set() and (args.jobs <= 0 or n < args.jobs):
+        t = time.time()
+        try:
+            resp = http.post(f'{args.server}/api/v1/tasks/run', headers=headers, timeout=30,
+                             json={'task': args.task, 'tags': [tag], 'vars': {'SIM_SEQ': str(n)}})
+            if resp.status_code == 200:
+                stats.submitted(resp.json()['job_id'], t)
+            else:
+                stats.inc('submit_failed')
+        except requests.RequestException:
+            stats.inc('submit_failed')
+        n += 1
+        next_at += interval
+        delay = next_at - time.time()
+        if delay > 0:
+            stop.wait(delay)
+
+
+def scrape_metrics(args):
+    """抓取 /metrics, 返回 {指标名{标签}: 值}"""
+    try:
+        resp = requests.get(f'{args.server}/metrics', timeout=10)
+    except requests.RequestException:
+        return {}
+    values = {}
+    for line in resp.text.splitlines():
+        if not line or line.startswith('#'):
+            continue
+        key, _, value = line.rpartition(' ')
+        try:
+            values[key] = float(value)
+        except ValueError:
+            pass
+    return values
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    s = sorted(values)
+    return s[min(len(s) - 1, int(round(pct / 100.0 * (len(s) - 1))))]
+
+
+def ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='EZ Server fleet simulator')
+    parser.add_argument('--server', default=os.environ.get('EZ_SERVER_URL', 'http://localhost:8080'))
+    parser.add_argument('--token', default=os.environ.get('EZ_CLIENT_TOKEN', ''))
+    parser.add_argument('--agents', type=int, default=100, help='模拟 Agent 数')
+    parser.add_argument('--slots', type=int, default=2, help='每个 Agent 的槽位数')
+    parser.add_argument('--jobs', type=int, default=1000, help='提交的 Job 总数 (0 表示持续提交直到 --duration)')
+    parser.add_argument('--submit-rate', type=float, default=20, help='每秒提交的 Job 数')
+    parser.add_argument('--job-duration', type=float, default=5, help='每个 Job 的运行秒数 (±20%%)')
+    parser.add_argument('--log-rate', type=float, default=10, help='每个 Job 每秒日志行数')
+    parser.add_argument('--log-size', type=int, default=80, help='每行日志字节数')
+    parser.add_argument('--duration', type=float, default=300, help='最长运行秒数')
+    parser.add_argument('--heartbeat', type=float, default=10, help='心跳间隔 (秒)')
+    parser.add_argument('--ramp', type=float, default=50, help='每秒建立的 Agent 连接数')
+    parser.add_argument('--report-interval', type=float, default=5)
+    parser.add_argument('--transport', default='websocket', choices=['websocket', 'polling'])
+    parser.add_argument('--task', default='fleet-sim', help='提交的任务名 (模拟 Agent 不会真正执行)')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('-o', '--output', help='写入 JSON 报告')
+    args = parser.parse_args()
+    args.server = args.server.rstrip('/')
+
+    rnd = random.Random(args.seed)
+    tag = f'fleet-sim:{uuid.uuid4().hex[:6]}'
+    stats = Stats()
+    stop = threading.Event()
+
+    base = scrape_metrics(args)
+    if not base:
+        print(f'Cannot scrape {args.server}/metrics')
+        sys.exit(1)
+    base_lines = base.get('ez_job_log_lines_total', 0)
+
+    print(f'Connecting {args.agents} agents (tag {tag}) ...')
+    agents = []
+    for i in range(args.agents):
+        agent = FakeAgent(i, args, stats, tag, random.Random(rnd.random()))
+        if agent.start():
+            agents.append(agent)
+        time.sleep(1.0 / args.ramp)
+    print(f'{len(agents)} agents connected\n')
+
+    start = time.time()
+    submitter = threading.Thread(target=submit_loop, args=(args, stats, tag, stop), daemon=True)
+    submitter.start()
+
+    timeline = []
+    prev = {'t': start, 'lines': base_lines, 'log_sent': 0, 'completed': 0}
+    header = (f'{"t(s)":>6} {"submit":>7} {"assign":>7} {"done":>7} {"pending":>8} {"disp p50":>9} '
+              f'{"disp p99":>9} {"sent/s":>8} {"ingest/s":>9} {"rss MB":>8}')
+    print(header)
+    try:
+        while True:
+            time.sleep(args.report_interval)
+            now = time.time()
+            window, counts = stats.take_window()
+            m = scrape_metrics(args)
+            lines = m.get('ez_job_log_lines_total', prev['lines'])
+            dt = now - prev['t']
+            point = {
+                't': round(now - start, 1),
+                'submitted': counts['submitted'],
+                'assigned': counts['assigned'],
+                'completed': counts['completed'],
+                'pending': m.get('ez_jobs{status="pending"}'),
+                'dispatch_p50_ms': ms(percentile(window, 50)),
+                'dispatch_p99_ms': ms(percentile(window, 99)),
+                'log_sent_per_sec': round((counts['log_sent'] - prev['log_sent']) / dt, 1),
+                'log_ingested_per_sec': round((lines - prev['lines']) / dt, 1),
+                'jobs_per_sec': round((counts['completed'] - prev['completed']) / dt, 2),
+                'server_rss_mb': round(m.get('process_resident_memory_bytes', 0) / 1048576, 1),
+            }
+            timeline.append(point)
+            prev = {'t': now, 'lines': lines, 'log_sent': counts['log_sent'], 'completed': counts['completed']}
+            print(f'{point["t"]:>6} {point["submitted"]:>7} {point["assigned"]:>7} {point["completed"]:>7} '
+                  f'{str(int(point["pending"] or 0)):>8} {str(point["dispatch_p50_ms"]):>9} '
+                  f'{str(point["dispatch_p99_ms"]):>9} {point["log_sent_per_sec"]:>8} '
+                  f'{point["log_ingested_per_sec"]:>9} {point["server_rss_mb"]:>8}')
+
+            finished = counts['completed'] + counts['result_failed'] + counts['ack_failed']
+            if now - start >= args.duration:
+                print('\nDuration reached')
+                break
+            if args.jobs > 0 and not submitter.is_alive() and finished >= counts['submitted']:
+                break
+    except KeyboardInterrupt:
+        print('\nInterrupted')
+    finally:
+        stop.set()
+
+    elapsed = time.time() - start
+    for agent in agents:
+        agent.close()
+    # 等待最后的日志送达后再统计
+    time.sleep(1)
+    final = scrape_metrics(args)
+    _, counts = stats.take_window()
+    ingested = final.get('ez_job_log_lines_total', base_lines) - base_lines
+    rss = [p['server_rss_mb'] for p in timeline if p['server_rss_mb']]
+    summary = {
+        'elapsed_sec': round(elapsed, 1),
+        'agents': len(agents),
+        'counts': counts,
+        'dispatch_latency_ms': {
+            'p50': ms(percentile(stats.latencies, 50)),
+            'p90': ms(percentile(stats.latencies, 90)),
+            'p99': ms(percentile(stats.latencies, 99)),
+            'max': ms(max(stats.latencies) if stats.latencies else None),
+        },
+        'log_lines_sent': counts['log_sent'],
+        'log_lines_ingested': int(ingested),
+        'log_lines_resent': counts['log_resent'],
+        'log_lines_dropped': int(max(0, counts['log_sent'] - ingested)),
+        'log_ingest_per_sec': round(ingested / elapsed, 1) if elapsed else None,
+        'jobs_completed_per_sec': round(counts['completed'] / elapsed, 2) if elapsed else None,
+        'server_rss_mb': {'start': rss[0] if rss else None, 'peak': max(rss) if rss else None,
+                          'end': round(final.get('process_resident_memory_bytes', 0) / 1048576, 1)},
+    }
+
+    print('\nSummary')
+    print(json.dumps(summary, indent=2))
+    if args.output:
+        report = {'meta': {'timestamp': datetime.now().isoformat(), 'tag': tag,
+                           'params': {k: v for k, v in vars(args).items() if k not in ('token', 'output')}},
+                  'summary': summary, 'timeline': timeline}
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f'Report written to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
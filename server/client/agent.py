@@ -8,10 +8,14 @@ import sys
 import json
 import time
 import signal
+import shutil
+import hashlib
 import subprocess
 import argparse
+from queue import Queue
 from datetime import datetime
-from threading import Thread
+from threading import Thread, Lock, Timer
+from concurrent.futures import ThreadPoolExecutor
 
 try:
     import socketio
@@ -20,19 +24,51 @@ except ImportError:
     print("Missing dependencies. Please install: pip install python-socketio requests")
     sys.exit(1)
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import transfer  # noqa: E402  (server/transfer.py, 分块传输公共逻辑)
+
 # 配置
 EZ_ROOT = os.environ.get('EZ_ROOT', os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 DEFAULT_SERVER = os.environ.get('EZ_SERVER_URL', 'http://localhost:8080')
 CLIENT_TOKEN = os.environ.get('EZ_CLIENT_TOKEN', '')
+KILL_GRACE = int(os.environ.get('EZ_KILL_GRACE', 5))  # 取消时 SIGTERM 到 SIGKILL 的间隔 (秒)
+REPORT_RETRIES = int(os.environ.get('EZ_AGENT_REPORT_RETRIES', 120))  # 结果上报重试次数 (间隔 5 秒)
+TRANSFER_RETRIES = 5  # 制品单块传输重试次数
+HEARTBEAT_INTERVAL = float(os.environ.get('EZ_HEARTBEAT_INTERVAL', 5))  # 心跳间隔 (秒), 与 Server 一致
+LOG_DIR = os.environ.get('EZ_AGENT_LOG_DIR', os.path.join(EZ_ROOT, '.ez-agent', 'logs'))  # 日志 / 结果 spool
+SPOOL_MAX = int(os.environ.get('EZ_AGENT_SPOOL_MAX', 256 * 1024 * 1024))  # spool 日志总量上限 (字节)
 
 # SocketIO 客户端
 sio = socketio.Client()
 
 # 全局状态
 running = True
-current_job = None
 node_id = None
 server_url = None
+pull_mode = False     # 通过 HTTP 长轮询拉取任务 (适用于 NAT 后的节点)
+http = requests.Session()
+
+# 执行槽位: 同时最多运行 slots 个 Job, 超出的在本地排队
+slots = int(os.environ.get('EZ_AGENT_SLOTS', 0)) or os.cpu_count() or 1
+executor = None
+free_slots = Queue()
+active_jobs = {}  # job_id -> slot
+processes = {}    # job_id -> Popen
+stopped = set()   # 被取消/撤销的 job_id
+active_lock = Lock()
+spool_bytes = 0   # LOG_DIR 中日志占用的字节数
+spool_lock = Lock()
+
+
+def auth_headers():
+    """认证请求头"""
+    return {'Authorization': f'Bearer {CLIENT_TOKEN}'} if CLIENT_TOKEN else {}
+
+
+def running_job_ids():
+    """本节点正在执行的 Job (用于心跳续约)"""
+    with active_lock:
+        return list(active_jobs)
 
 
 def signal_handler(sig, frame):
@@ -53,7 +89,10 @@ def connect():
     sio.emit('node_register', {
         'id': node_id,
         'name': node_id,
-        'tags': get_node_tags()
+        'tags': get_node_tags(),
+        'slots': slots,
+        'running': running_job_ids(),
+        'load': get_node_load(len(active_jobs))
     })
 
 
@@ -69,15 +108,231 @@ def on_registered(data):
     global node_id
     node_id = data.get('id', node_id)
     print(f"Registered as node: {node_id}")
+    # 断线期间的日志只写入了 spool, 从 Server 已确认的序号之后重放
+    for job_id, seq in (data.get('log_seq') or {}).items():
+        Thread(target=resend_log, args=(job_id, seq + 1), daemon=True).start()
 
 
 @sio.on('job_assigned')
 def on_job_assigned(job):
     """收到任务分配"""
-    global current_job
     print(f"Received job: {job['id']} - {job['task']}")
-    current_job = job
-    Thread(target=execute_job, args=(job,)).start()
+    if job['id'] in running_job_ids():
+        # 断线期间租约过期后又派发回本节点, 仍是同一次执行
+        ack_job(job['id'])
+        return
+    executor.submit(run_in_slot, job)
+
+
+@sio.on('job_cancel')
+def on_job_cancel(data):
+    """Server 取消任务"""
+    print(f"Cancel requested: {data.get('job_id')}")
+    stop_job(data.get('job_id'))
+
+
+@sio.on('job_log_resend')
+def on_job_log_resend(data):
+    """Server 发现日志缺口, 从 from_seq 起重发"""
+    resend_log(data.get('job_id'), data.get('from_seq', 1))
+
+
+def resend_log(job_id, from_seq):
+    """从 spool 重发 from_seq 起的日志"""
+    for seq, line in read_log_lines(job_id, from_seq):
+        if not send_log(job_id, seq, line):
+            break
+
+
+def send_log(job_id, seq, line):
+    """推送一行日志; 未连接 (或发送时断开) 返回 False, 该行留在 spool 中等待重放"""
+    if not sio.connected:
+        return False
+    try:
+        sio.emit('job_log', {'job_id': job_id, 'node_id': node_id, 'seq': seq, 'log': line})
+        return True
+    except Exception:
+        return False
+
+
+@sio.on('job_revoked')
+def on_job_revoked(data):
+    """Server 已将租约转给其他节点, 放弃这些任务"""
+    for job_id in data.get('job_ids', []):
+        print(f"Lease revoked: {job_id}")
+        stop_job(job_id)
+
+
+def ack_job(job_id):
+    """确认接收任务, 获得租约; 返回是否成功"""
+    try:
+        if pull_mode:
+            resp = http.post(f"{server_url}/api/v1/jobs/{job_id}/ack",
+                             json={'node_id': node_id}, headers=auth_headers(), timeout=10)
+            return resp.status_code == 200
+        resp = sio.call('job_ack', {'job_id': job_id, 'node_id': node_id}, timeout=10)
+        return bool(resp and resp.get('ok'))
+    except Exception as e:
+        print(f"Failed to ack job {job_id}: {e}")
+        return False
+
+
+def is_stopped(job_id):
+    with active_lock:
+        return job_id in stopped
+
+
+def stop_job(job_id):
+    """终止任务进程组: SIGTERM, KILL_GRACE 秒后对整组 SIGKILL
+
+    不看组长是否存活: 忽略 SIGTERM 的子孙进程在组长退出后仍占住输出管道。
+    """
+    with active_lock:
+        stopped.add(job_id)
+        process = processes.get(job_id)
+    if not process:
+        return
+
+    def kill(sig):
+        try:
+            os.killpg(process.pid, sig)
+        except (ProcessLookupError, PermissionError):
+            pass
+
+    kill(signal.SIGTERM)
+    timer = Timer(KILL_GRACE, kill, args=(signal.SIGKILL,))
+    timer.daemon = True
+    timer.start()
+
+
+class JobLog:
+    """Job 日志文件: 逐行编号 (seq 从 1 开始) 写入 LOG_DIR/<job_id>.log, 同时计算整体 sha256
+
+    日志只落盘不驻留内存; 断线重连、Server 发现缺口或结果上报时缺尾, 从文件按序号重发。
+    spool 总量超过 SPOOL_MAX 时丢弃新行, 恢复写入 (或结束) 时补一行丢弃说明; 序号与 digest 只覆盖写入的行。
+    """
+
+    def __init__(self, job_id):
+        os.makedirs(LOG_DIR, exist_ok=True)
+        self.path = log_path(job_id)
+        self.file = open(self.path, 'w', encoding='utf-8')
+        self.seq = 0
+        self.sha = hashlib.sha256()
+        self.dropped = 0
+
+    def append(self, line):
+        """写入一行, 返回实际写入的 [(seq, line)] (spool 已满时为空)"""
+        data = (line + '\n').encode('utf-8')
+        if not spool_reserve(len(data)):
+            self.dropped += 1
+            return []
+        records = []
+        if self.dropped:
+            records.append(self._write(self._dropped_note()))
+        records.append(self._write(line, data))
+        return records
+
+    def _write(self, line, data=None):
+        if data is None:
+            data = (line + '\n').encode('utf-8')
+            spool_reserve(len(data), force=True)
+        self.file.write(line + '\n')
+        self.file.flush()
+        self.sha.update(data)
+        self.seq += 1
+        return self.seq, line
+
+    def _dropped_note(self):
+        note = f'[ez-agent] 日志 spool 已满 (EZ_AGENT_SPOOL_MAX={SPOOL_MAX}), 丢弃 {self.dropped} 行'
+        self.dropped = 0
+        return note
+
+    def digest(self):
+        return self.sha.hexdigest()
+
+    def close(self):
+        if self.dropped:
+            self._write(self._dropped_note())
+        self.file.close()
+
+
+def log_path(job_id):
+    return os.path.join(LOG_DIR, f'{job_id}.log')
+
+
+def result_path(job_id):
+    return os.path.join(LOG_DIR, f'{job_id}.result.json')
+
+
+def spool_reserve(size, force=False):
+    """占用 spool 空间; 超过 SPOOL_MAX 时返回 False (force 时仍计入)"""
+    global spool_bytes
+    with spool_lock:
+        if not force and spool_bytes + size > SPOOL_MAX:
+            return False
+        spool_bytes += size
+        return True
+
+
+def init_spool():
+    """启动时统计 spool 占用, 返回上次未上报成功的结果 [(job_id, result)]
+
+    没有结果的日志属于 Agent 退出时仍在运行的 Job (进程已随 Agent 结束), 直接清理, 由 Server 租约过期后重新派发。
+    """
+    global spool_bytes
+    os.makedirs(LOG_DIR, exist_ok=True)
+    pending = []
+    for name in sorted(os.listdir(LOG_DIR)):
+        if not name.endswith('.result.json'):
+            continue
+        job_id = name[:-len('.result.json')]
+        try:
+            with open(result_path(job_id), encoding='utf-8') as f:
+                pending.append((job_id, json.load(f)))
+        except (OSError, ValueError):
+            remove_spool(job_id)
+    keep = {job_id for job_id, _ in pending}
+    for name in os.listdir(LOG_DIR):
+        if name.endswith('.log') and name[:-4] not in keep:
+            remove_spool(name[:-4])
+    with spool_lock:
+        spool_bytes = sum(os.path.getsize(os.path.join(LOG_DIR, n)) for n in os.listdir(LOG_DIR)
+                          if n.endswith('.log'))
+    return pending
+
+
+def save_result(job_id, result):
+    """结果先写入 spool, 上报成功 (或被明确拒绝) 后与日志一并删除; Agent 重启后继续上报"""
+    path = result_path(job_id)
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(result, f)
+    os.replace(path + '.tmp', path)
+
+
+def remove_spool(job_id):
+    """删除 Job 的日志与结果 spool, 释放占用"""
+    global spool_bytes
+    for path in (log_path(job_id), result_path(job_id)):
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except OSError:
+            continue
+        if path.endswith('.log'):
+            with spool_lock:
+                spool_bytes = max(0, spool_bytes - size)
+
+
+def read_log_lines(job_id, from_seq=1):
+    """按序号读取日志文件中 from_seq 起的行: 产出 (seq, line)"""
+    try:
+        f = open(log_path(job_id), encoding='utf-8')
+    except OSError:
+        return
+    with f:
+        for seq, line in enumerate(f, 1):
+            if seq >= from_seq:
+                yield seq, line[:-1] if line.endswith('\n') else line
 
 
 def get_node_tags():
@@ -103,15 +358,103 @@ def get_node_tags():
     return tags
 
 
-def execute_job(job):
-    """执行任务"""
-    global current_job
+_last_counters = None  # 上次采样的 (时间, CPU 总时间, CPU 空闲时间, 磁盘读字节, 磁盘写字节)
 
+
+def get_node_load(busy):
+    """心跳附带的主机负载与资源使用
+
+    loadavg、CPU 数、CPU 使用率 (%, 自上次采样)、内存总量与可用量、EZ_ROOT 所在磁盘剩余 (字节)、
+    磁盘读写速率 (字节/秒, 自上次采样)、运行中槽位数; 读不到的项省略
+    """
+    global _last_counters
+    load = {'cpus': os.cpu_count() or 1, 'busy': busy}
+    try:
+        load['loadavg'] = [round(x, 2) for x in os.getloadavg()]
+    except (OSError, AttributeError):
+        pass
+    counters = (time.time(),) + _cpu_times() + _disk_bytes()
+    prev, _last_counters = _last_counters, counters
+    if prev:
+        elapsed = counters[0] - prev[0]
+        total, idle = counters[1] - prev[1], counters[2] - prev[2]
+        if total > 0:
+            load['cpu'] = round(100.0 * (total - idle) / total, 1)
+        if elapsed > 0 and counters[3] is not None and prev[3] is not None:
+            load['disk_read'] = max(0, int((counters[3] - prev[3]) / elapsed))
+            load['disk_write'] = max(0, int((counters[4] - prev[4]) / elapsed))
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemTotal:'):
+                    load['mem_total'] = int(line.split()[1]) * 1024
+                elif line.startswith('MemAvailable:'):
+                    load['mem_free'] = int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        try:
+            load['mem_free'] = os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+        except (ValueError, OSError, AttributeError):
+            pass
+    try:
+        load['disk_free'] = shutil.disk_usage(EZ_ROOT).free
+    except OSError:
+        pass
+    return load
+
+
+def _cpu_times():
+    """/proc/stat 汇总行的 (总时间, 空闲时间), 非 Linux 为 (0, 0)"""
+    try:
+        with open('/proc/stat') as f:
+            values = [int(v) for v in f.readline().split()[1:]]
+        return sum(values), values[3] + (values[4] if len(values) > 4 else 0)
+    except (OSError, ValueError, IndexError):
+        return 0, 0
+
+
+def _disk_bytes():
+    """整块磁盘 (不含分区、loop、device-mapper) 累计读写字节, 读不到为 (None, None)"""
+    read = written = 0
+    try:
+        with open('/proc/diskstats') as f:
+            for line in f:
+                fields = line.split()
+                name = fields[2]
+                if name.startswith(('loop', 'ram', 'zram', 'dm-', 'sr', 'md')) or \
+                        not os.path.exists(f'/sys/block/{name}'):
+                    continue
+                read += int(fields[5]) * 512
+                written += int(fields[9]) * 512
+    except (OSError, ValueError, IndexError):
+        return None, None
+    return read, written
+
+
+def run_in_slot(job):
+    """占用一个空闲槽位执行任务"""
+    if not ack_job(job['id']):
+        print(f"Job {job['id']} no longer leased to this node, skipped")
+        return
+    slot = free_slots.get()
+    with active_lock:
+        active_jobs[job['id']] = slot
+    try:
+        execute_job(job, slot)
+    finally:
+        with active_lock:
+            active_jobs.pop(job['id'], None)
+            processes.pop(job['id'], None)
+            stopped.discard(job['id'])
+        free_slots.put(slot)
+
+
+def execute_job(job, slot=0):
+    """执行任务"""
     job_id = job['id']
     task = job['task']
     task_vars = job.get('vars', {})
 
-    print(f"Executing job {job_id}: {task}")
+    print(f"Executing job {job_id} in slot {slot}: {task}")
 
     # 构建命令
     ez_cmd = os.path.join(EZ_ROOT, 'ez')
@@ -119,69 +462,241 @@ def execute_job(job):
     for k, v in task_vars.items():
         cmd.append(f'{k}={v}')
 
-    # 执行并实时推送日志
+    # 执行并实时推送日志 (带序号, 同时写入日志文件)
+    log = JobLog(job_id)
+
+    def log_line(line):
+        print(f"  [{job_id}] {line}")
+        for seq, text in log.append(line):
+            send_log(job_id, seq, text)
+
     try:
-        process = subprocess.Popen(
-            cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            text=True,
-            bufsize=1
-        )
-
-        logs = []
-        for line in process.stdout:
-            line = line.rstrip()
-            logs.append(line)
-            print(f"  [{job_id}] {line}")
-            # 推送日志
-            sio.emit('job_log', {'job_id': job_id, 'log': line})
-
-        process.wait()
-        exit_code = process.returncode
-
-        # 上报结果
+        # 等待槽位或下载输入期间到达的取消 / 撤销只记入 stopped, 启动前检查, 不再执行
+        process = None
+        for inp in job.get('inputs') or []:
+            if is_stopped(job_id):
+                break
+            download_artifact(inp['digest'], root_path(inp['path']))
+
+        if not is_stopped(job_id):
+            process = subprocess.Popen(
+                cmd,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                text=True,
+                bufsize=1,
+                start_new_session=True
+            )
+            with active_lock:
+                processes[job_id] = process
+                late = job_id in stopped
+            # Popen 期间到达的取消找不到进程, 在此补上
+            if late:
+                stop_job(job_id)
+
+        if process is None:
+            log_line('[ez-agent] Cancelled before start')
+            exit_code = -1
+        else:
+            for line in process.stdout:
+                log_line(line.rstrip())
+
+            process.wait()
+            exit_code = process.returncode
+
+        outputs = {}
+        if exit_code == 0 and job_id not in stopped:
+            for art in job.get('artifacts') or []:
+                try:
+                    path = root_path(art['path'])
+                    if not os.path.isfile(path):
+                        continue
+                    outputs[art['name']] = upload_artifact(path)
+                except Exception as e:
+                    log_line(f"Artifact upload failed ({art['name']}): {e}")
+
+        # 上报结果 (日志只带最后序号与 digest, Server 缺尾时再按需重发)
         result = {
-            'status': 'success' if exit_code == 0 else 'failed',
+            'node_id': node_id,
+            'status': 'cancelled' if job_id in stopped else ('success' if exit_code == 0 else 'failed'),
             'exit_code': exit_code,
-            'logs': '\n'.join(logs)
+            'outputs': outputs
         }
 
     except Exception as e:
+        log_line(str(e))
         result = {
+            'node_id': node_id,
             'status': 'error',
-            'exit_code': -1,
-            'logs': str(e)
+            'exit_code': -1
         }
+    finally:
+        log.close()
 
-    # 发送结果到服务器
-    try:
-        requests.post(
-            f"{server_url}/api/v1/jobs/{job_id}/result",
-            json=result,
-            headers={'Authorization': f'Bearer {CLIENT_TOKEN}'} if CLIENT_TOKEN else {},
-            timeout=10
-        )
-    except Exception as e:
-        print(f"Failed to report result: {e}")
+    result.update(log_seq=log.seq, log_digest=log.digest())
+    # 发送结果到服务器 (先写入 spool, 断线或 Agent 重启后继续上报)
+    save_result(job_id, result)
+    report_result(job_id, result)
 
     print(f"Job {job_id} completed: {result['status']}")
-    current_job = None
+
+
+def root_path(path):
+    """Job 中的制品路径 (相对 EZ_ROOT) -> 绝对路径; 绝对路径或解析后超出 EZ_ROOT 时抛出 ValueError"""
+    if not isinstance(path, str) or not path or os.path.isabs(path):
+        raise ValueError(f'Invalid artifact path: {path!r}')
+    full = os.path.normpath(os.path.join(EZ_ROOT, path))
+    root = os.path.realpath(EZ_ROOT)
+    if os.path.commonpath([root, os.path.realpath(full)]) != root:
+        raise ValueError(f'Artifact path escapes EZ_ROOT: {path}')
+    return full
+
+
+def download_artifact(digest, dest):
+    """分块下载制品: 复用 <dest>.part (或旧的 dest) 中一致的块, 缺失块用 HTTP Range 获取并逐块校验"""
+    resp = http.get(f"{server_url}/api/v1/artifacts/{digest}/manifest",
+                    headers=auth_headers(), timeout=30)
+    resp.raise_for_status()
+    manifest = resp.json()
+
+    os.makedirs(os.path.dirname(dest) or '.', exist_ok=True)
+    part = dest + '.part'
+    if not os.path.exists(part) and os.path.exists(dest):
+        os.replace(dest, part)
+    for index in transfer.missing_chunks(part, manifest):
+        offset, length = transfer.chunk_span(manifest, index)
+        headers = dict(auth_headers(), Range=f'bytes={offset}-{offset + length - 1}')
+        for attempt in range(TRANSFER_RETRIES):
+            try:
+                with http.get(f"{server_url}/api/v1/artifacts/{digest}", headers=headers,
+                              stream=True, timeout=60) as r:
+                    if r.status_code != 206:
+                        raise IOError(f'HTTP {r.status_code}')
+                    transfer.write_chunk(part, manifest, index, r.raw)
+                break
+            except (requests.RequestException, IOError, ValueError):
+                if attempt == TRANSFER_RETRIES - 1:
+                    raise
+                time.sleep(2)
+    transfer.finalize(part, dest, manifest)
+
+
+def upload_artifact(path):
+    """分块上传制品, 只发送 Server 缺失的块 (中断后重新调用即续传); 返回 digest"""
+    manifest = transfer.build_manifest(path)
+    resp = http.post(f"{server_url}/api/v1/artifacts/uploads", json=manifest,
+                     headers=auth_headers(), timeout=30)
+    resp.raise_for_status()
+    digest = manifest['digest']
+    with open(path, 'rb') as f:
+        for index in resp.json().get('missing', []):
+            offset, length = transfer.chunk_span(manifest, index)
+            for attempt in range(TRANSFER_RETRIES):
+                f.seek(offset)
+                try:
+                    r = http.put(f"{server_url}/api/v1/artifacts/uploads/{digest}/chunks/{index}",
+                                 data=f.read(length), headers=auth_headers(), timeout=60)
+                    if r.status_code == 200:
+                        break
+                    error = f'HTTP {r.status_code}'
+                except requests.RequestException as e:
+                    error = str(e)
+                if attempt == TRANSFER_RETRIES - 1:
+                    raise IOError(f'chunk {index}: {error}')
+                time.sleep(2)
+    resp = http.post(f"{server_url}/api/v1/artifacts/uploads/{digest}/commit",
+                     headers=auth_headers(), timeout=300)
+    resp.raise_for_status()
+    return digest
+
+
+def report_result(job_id, result):
+    """上报结果; Server 不可达 (如重启中) 时重试, 直到被接收或明确拒绝
+
+    Server 返回 409 + log_from_seq 表示日志缺尾, 附带该序号起的日志立即重新上报。
+    """
+    attempt = 0
+    while attempt < REPORT_RETRIES:
+        try:
+            resp = http.post(
+                f"{server_url}/api/v1/jobs/{job_id}/result",
+                json=result,
+                headers=auth_headers(),
+                timeout=30
+            )
+            resend_from = resp.json().get('log_from_seq') if resp.status_code == 409 else None
+            if resend_from and resend_from != (result.get('log_tail') or {}).get('from_seq'):
+                result = dict(result, log_tail=log_tail(job_id, resend_from))
+                continue
+            if resp.status_code < 500:
+                if resp.status_code != 200:
+                    print(f"Result for {job_id} rejected: HTTP {resp.status_code}")
+                remove_spool(job_id)
+                return
+        except Exception as e:
+            print(f"Failed to report result: {e}")
+        attempt += 1
+        time.sleep(5)
+    print(f"Giving up reporting result for {job_id} (kept in spool until restart)")
+
+
+def log_tail(job_id, from_seq):
+    """结果补传用的日志尾: {from_seq, text}"""
+    return {'from_seq': from_seq,
+            'text': ''.join(line + '\n' for _, line in read_log_lines(job_id, from_seq))}
 
 
 def heartbeat_loop():
-    """心跳循环"""
+    """心跳循环 (携带运行中的 Job 以续约, 以及主机负载)"""
     while running:
         try:
-            if sio.connected:
-                sio.emit('node_ping', {'id': node_id})
+            ids = running_job_ids()
+            if pull_mode:
+                resp = http.post(f"{server_url}/api/v1/nodes/{node_id}/ping",
+                                 json={'slots': slots, 'running': ids, 'load': get_node_load(len(ids))},
+                                 headers=auth_headers(), timeout=10)
+                for job_id in resp.json().get('revoked', []):
+                    print(f"Lease revoked: {job_id}")
+                    stop_job(job_id)
+            elif sio.connected:
+                sio.emit('node_ping', {'id': node_id, 'slots': slots, 'running': ids,
+                                       'load': get_node_load(len(ids))})
         except:
             pass
-        time.sleep(5)
+        time.sleep(HEARTBEAT_INTERVAL)
+
+
+def pull_loop():
+    """Pull 模式: 注册后长轮询拉取任务"""
+    registered = False
+    while running:
+        try:
+            if not registered:
+                http.post(f"{server_url}/api/v1/nodes/register",
+                          json={'id': node_id, 'name': node_id, 'tags': get_node_tags(), 'slots': slots},
+                          headers=auth_headers(), timeout=10).raise_for_status()
+                registered = True
+                print(f"Registered as node: {node_id} (pull)")
+            if free_slots.empty():
+                time.sleep(1)
+                continue
+            resp = http.get(f"{server_url}/api/v1/nodes/{node_id}/jobs/next",
+                            params={'wait': 30}, headers=auth_headers(), timeout=40)
+            if resp.status_code == 404:
+                registered = False
+                continue
+            job = resp.json().get('job')
+            if job:
+                print(f"Received job: {job['id']} - {job['task']}")
+                executor.submit(run_in_slot, job)
+        except Exception as e:
+            print(f"Poll failed: {e}")
+            registered = False
+            time.sleep(5)
 
 
 def main():
-    global node_id, server_url
+    global node_id, server_url, slots, executor, pull_mode
 
     parser = argparse.ArgumentParser(description='EZ Client Agent')
     parser.add_argument('--server', '-s', default=DEFAULT_SERVER,
@@ -190,15 +705,41 @@ def main():
                         help='Node name')
     parser.add_argument('--token', '-t', default=CLIENT_TOKEN,
                         help='Authentication token')
+    parser.add_argument('--slots', type=int, default=slots,
+                        help='Concurrent job slots (default: CPU count or EZ_AGENT_SLOTS)')
+    parser.add_argument('--pull', action='store_true',
+                        default=os.environ.get('EZ_AGENT_PULL', '') in ('1', 'true'),
+                        help='Long-poll the server over HTTP instead of WebSocket push (for NAT)')
+    parser.add_argument('--async', dest='use_async', action='store_true',
+                        default=os.environ.get('EZ_AGENT_ASYNC', '') in ('1', 'true'),
+                        help='Run on a single asyncio event loop (needs aiohttp)')
 
     args = parser.parse_args()
 
     node_id = args.name
     server_url = args.server.rstrip('/')
+    slots = max(1, args.slots)
+    pull_mode = args.pull
+
+    if args.use_async:
+        import aio_agent
+        print(f"EZ Client Agent (asyncio)")
+        print(f"  Server: {server_url}")
+        print(f"  Node:   {node_id}")
+        print(f"  Slots:  {slots}")
+        print(f"  EZ Root: {EZ_ROOT}")
+        print()
+        aio_agent.run(server_url, node_id, slots, token=args.token, pull=pull_mode)
+        return
+
+    executor = ThreadPoolExecutor(max_workers=slots, thread_name_prefix='ez-slot')
+    for i in range(slots):
+        free_slots.put(i)
 
     print(f"EZ Client Agent")
     print(f"  Server: {server_url}")
     print(f"  Node:   {node_id}")
+    print(f"  Slots:  {slots}")
     print(f"  EZ Root: {EZ_ROOT}")
     print()
 
@@ -206,10 +747,19 @@ def main():
     signal.signal(signal.SIGINT, signal_handler)
     signal.signal(signal.SIGTERM, signal_handler)
 
+    # 上次未上报成功的结果
+    for job_id, result in init_spool():
+        print(f"Replaying spooled result: {job_id}")
+        Thread(target=report_result, args=(job_id, result), daemon=True).start()
+
     # 启动心跳线程
     heartbeat_thread = Thread(target=heartbeat_loop, daemon=True)
     heartbeat_thread.start()
 
+    if pull_mode:
+        pull_loop()
+        return
+
     # 连接服务器
     while running:
         try:
@@ -0,0 +1,420 @@
+"""
+EZ Client - asyncio 模式 (agent.py --async)
+
+单线程事件循环内完成 Socket.IO 通信、心跳、日志推送与 Job 执行:
+- socketio.AsyncClient 与结果上报 / 制品传输共用一个 aiohttp keep-alive 会话
+- 每个 Job 是一个 asyncio task, ez run 为 asyncio 子进程, 并发数由槽位信号量限制
+- 只有制品清单计算 / 分块读写等磁盘操作放到线程池
+"""
+
+import os
+import io
+import sys
+import signal
+import asyncio
+
+try:
+    import aiohttp
+    import socketio
+except ImportError:
+    print("Async mode needs aiohttp. Please install: pip install aiohttp python-socketio")
+    sys.exit(1)
+
+from agent import (transfer, get_node_tags, get_node_load, JobLog, read_log_lines, log_tail, init_spool, save_result,
+                   remove_spool, root_path, EZ_ROOT, KILL_GRACE, REPORT_RETRIES, TRANSFER_RETRIES,
+                   HEARTBEAT_INTERVAL)
+
+LINE_LIMIT = 1024 * 1024  # 单行日志上限, 超出部分丢弃
+
+
+class AsyncAgent:
+    """asyncio Agent; 协议与同步模式相同 (node_register / job_ack / job_log / 结果 POST)"""
+
+    def __init__(self, server_url, node_id, slots, token='', pull=False):
+        self.server_url = server_url
+        self.node_id = node_id
+        self.slots = slots
+        self.pull = pull
+        self.headers = {'Authorization': f'Bearer {token}'} if token else {}
+        self.running = True
+        self.http = None
+        self.sio = None
+        self.free = asyncio.Semaphore(slots)
+        self.active = {}      # job_id -> asyncio Process (启动前为 None)
+        self.stopped = set()  # 被取消/撤销的 job_id
+
+    def url(self, path):
+        return f'{self.server_url}{path}'
+
+    # ------------------------------------------------------------------
+    # 连接与事件
+    # ------------------------------------------------------------------
+
+    async def run(self):
+        connector = aiohttp.TCPConnector(limit=max(8, self.slots * 2), keepalive_timeout=60)
+        async with aiohttp.ClientSession(connector=connector, headers=self.headers) as http:
+            self.http = http
+            heartbeat = asyncio.create_task(self.heartbeat_loop())
+            # 上次未上报成功的结果
+            for job_id, result in await asyncio.to_thread(init_spool):
+                print(f"Replaying spooled result: {job_id}")
+                asyncio.create_task(self.report_result(job_id, result))
+            try:
+                if self.pull:
+                    await self.pull_loop()
+                else:
+                    await self.push_loop()
+            finally:
+                heartbeat.cancel()
+                if self.sio and self.sio.connected:
+                    await self.sio.disconnect()
+
+    async def push_loop(self):
+        """WebSocket 推送模式; 断线由 AsyncClient 自动重连, 首次连接失败时每 5 秒重试"""
+        self.sio = socketio.AsyncClient(http_session=self.http)
+        self.sio.on('connect', self.on_connect)
+        self.sio.on('disconnect', lambda: print("Disconnected from server"))
+        self.sio.on('registered', self.on_registered)
+        self.sio.on('job_assigned', self.on_job_assigned)
+        self.sio.on('job_cancel', lambda data: self.stop_job(data.get('job_id')))
+        self.sio.on('job_revoked', self.on_job_revoked)
+        self.sio.on('job_log_resend', self.on_job_log_resend)
+        while self.running:
+            try:
+                print(f"Connecting to {self.server_url}...")
+                await self.sio.connect(self.server_url, headers=self.headers)
+                await self.sio.wait()
+            except socketio.exceptions.ConnectionError as e:
+                print(f"Connection failed: {e}")
+                if self.running:
+                    print("Reconnecting in 5 seconds...")
+                    await asyncio.sleep(5)
+
+    async def on_connect(self):
+        print("Connected to server")
+        await self.sio.emit('node_register', {
+            'id': self.node_id, 'name': self.node_id, 'tags': get_node_tags(),
+            'slots': self.slots, 'running': list(self.active), 'load': get_node_load(len(self.active))
+        })
+
+    async def on_registered(self, data):
+        self.node_id = data.get('id', self.node_id)
+        print(f"Registered as node: {self.node_id}")
+        # 断线期间的日志只写入了 spool, 从 Server 已确认的序号之后重放
+        for job_id, seq in (data.get('log_seq') or {}).items():
+            asyncio.create_task(self.resend_log(job_id, seq + 1))
+
+    async def on_job_assigned(self, job):
+        print(f"Received job: {job['id']} - {job['task']}")
+        if job['id'] in self.active:
+            # 断线期间租约过期后又派发回本节点, 仍是同一次执行
+            await self.ack_job(job['id'])
+            return
+        asyncio.create_task(self.run_in_slot(job))
+
+    async def on_job_revoked(self, data):
+        for job_id in data.get('job_ids', []):
+            print(f"Lease revoked: {job_id}")
+            self.stop_job(job_id)
+
+    async def on_job_log_resend(self, data):
+        """Server 发现日志缺口, 从 from_seq 起重发"""
+        await self.resend_log(data.get('job_id'), data.get('from_seq', 1))
+
+    async def resend_log(self, job_id, from_seq):
+        """从 spool 重发 from_seq 起的日志"""
+        for seq, line in read_log_lines(job_id, from_seq):
+            if not await self.send_log(job_id, seq, line):
+                break
+
+    async def send_log(self, job_id, seq, line):
+        """推送一行日志; 未连接 (或发送时断开) 返回 False, 该行留在 spool 中等待重放"""
+        if not (self.sio and self.sio.connected):
+            return False
+        try:
+            await self.sio.emit('job_log', {'job_id': job_id, 'node_id': self.node_id, 'seq': seq, 'log': line})
+            return True
+        except Exception:
+            return False
+
+    async def heartbeat_loop(self):
+        """心跳 (携带运行中的 Job 以续约, 以及主机负载)"""
+        while self.running:
+            try:
+                ids = list(self.active)
+                if self.pull:
+                    async with self.http.post(self.url(f'/api/v1/nodes/{self.node_id}/ping'),
+                                              json={'slots': self.slots, 'running': ids,
+                                                    'load': get_node_load(len(ids))},
+                                              timeout=aiohttp.ClientTimeout(total=10)) as resp:
+                        for job_id in (await resp.json()).get('revoked', []):
+                            print(f"Lease revoked: {job_id}")
+                            self.stop_job(job_id)
+                elif self.sio and self.sio.connected:
+                    await self.sio.emit('node_ping', {'id': self.node_id, 'slots': self.slots,
+                                                      'running': ids, 'load': get_node_load(len(ids))})
+            except Exception:
+                pass
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+
+    async def pull_loop(self):
+        """Pull 模式: 注册后长轮询拉取任务"""
+        registered = False
+        while self.running:
+            try:
+                if not registered:
+                    async with self.http.post(self.url('/api/v1/nodes/register'),
+                                              json={'id': self.node_id, 'name': self.node_id,
+                                                    'tags': get_node_tags(), 'slots': self.slots},
+                                              timeout=aiohttp.ClientTimeout(total=10)) as resp:
+                        resp.raise_for_status()
+                    registered = True
+                    print(f"Registered as node: {self.node_id} (pull)")
+                if len(self.active) >= self.slots:
+                    await asyncio.sleep(1)
+                    continue
+                async with self.http.get(self.url(f'/api/v1/nodes/{self.node_id}/jobs/next'),
+                                         params={'wait': 30}, timeout=aiohttp.ClientTimeout(total=40)) as resp:
+                    if resp.status == 404:
+                        registered = False
+                        continue
+                    job = (await resp.json()).get('job')
+                if job:
+                    print(f"Received job: {job['id']} - {job['task']}")
+                    asyncio.create_task(self.run_in_slot(job))
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                print(f"Poll failed: {e}")
+                registered = False
+                await asyncio.sleep(5)
+
+    # ------------------------------------------------------------------
+    # Job 执行
+    # ------------------------------------------------------------------
+
+    async def ack_job(self, job_id):
+        """确认接收任务, 获得租约; 返回是否成功"""
+        try:
+            if self.pull:
+                async with self.http.post(self.url(f'/api/v1/jobs/{job_id}/ack'), json={'node_id': self.node_id},
+                                          timeout=aiohttp.ClientTimeout(total=10)) as resp:
+                    return resp.status == 200
+            resp = await self.sio.call('job_ack', {'job_id': job_id, 'node_id': self.node_id}, timeout=10)
+            return bool(resp and resp.get('ok'))
+        except Exception as e:
+            print(f"Failed to ack job {job_id}: {e}")
+            return False
+
+    async def run_in_slot(self, job):
+        """占用一个空闲槽位执行任务"""
+        job_id = job['id']
+        if not await self.ack_job(job_id):
+            print(f"Job {job_id} no longer leased to this node, skipped")
+            return
+        async with self.free:
+            self.active[job_id] = None
+            try:
+                await self.execute_job(job)
+            finally:
+                self.active.pop(job_id, None)
+                self.stopped.discard(job_id)
+
+    def stop_job(self, job_id):
+        """终止任务进程组: SIGTERM, KILL_GRACE 秒后对整组 SIGKILL (组长已退出时子孙进程可能仍在)"""
+        self.stopped.add(job_id)
+        proc = self.active.get(job_id)
+        if proc is None:
+            return
+
+        def kill(sig):
+            try:
+                os.killpg(proc.pid, sig)
+            except (ProcessLookupError, PermissionError):
+                pass
+
+        kill(signal.SIGTERM)
+        asyncio.get_running_loop().call_later(KILL_GRACE, kill, signal.SIGKILL)
+
+    async def execute_job(self, job):
+        job_id = job['id']
+        print(f"Executing job {job_id}: {job['task']}")
+        cmd = [os.path.join(EZ_ROOT, 'ez'), 'run', job['task']]
+        for k, v in job.get('vars', {}).items():
+            cmd.append(f'{k}={v}')
+
+        log = JobLog(job_id)
+
+        async def log_line(line):
+            print(f"  [{job_id}] {line}")
+            for seq, text in log.append(line):
+                await self.send_log(job_id, seq, text)
+
+        try:
+            # 等待槽位或下载输入期间到达的取消 / 撤销只记入 stopped, 启动前检查, 不再执行
+            proc = None
+            for inp in job.get('inputs') or []:
+                if job_id in self.stopped:
+                    break
+                await self.download_artifact(inp['digest'], root_path(inp['path']))
+
+            if job_id not in self.stopped:
+                proc = await asyncio.create_subprocess_exec(
+                    *cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT,
+                    start_new_session=True, limit=LINE_LIMIT
+                )
+                self.active[job_id] = proc
+                if job_id in self.stopped:
+                    self.stop_job(job_id)
+
+            if proc is None:
+                await log_line('[ez-agent] Cancelled before start')
+                exit_code = -1
+            else:
+                while True:
+                    try:
+                        line = await proc.stdout.readline()
+                    except ValueError:
+                        line = b'[ez-agent] line too long, truncated'
+                    if not line:
+                        break
+                    await log_line(line.decode('utf-8', errors='replace').rstrip())
+                exit_code = await proc.wait()
+
+            outputs = {}
+            if exit_code == 0 and job_id not in self.stopped:
+                for art in job.get('artifacts') or []:
+                    try:
+                        path = root_path(art['path'])
+                        if not os.path.isfile(path):
+                            continue
+                        outputs[art['name']] = await self.upload_artifact(path)
+                    except Exception as e:
+                        await log_line(f"Artifact upload failed ({art['name']}): {e}")
+
+            result = {
+                'node_id': self.node_id,
+                'status': 'cancelled' if job_id in self.stopped else ('success' if exit_code == 0 else 'failed'),
+                'exit_code': exit_code,
+                'outputs': outputs
+            }
+        except Exception as e:
+            await log_line(str(e))
+            result = {'node_id': self.node_id, 'status': 'error', 'exit_code': -1}
+        finally:
+            log.close()
+
+        result.update(log_seq=log.seq, log_digest=log.digest())
+        save_result(job_id, result)
+        await self.report_result(job_id, result)
+        print(f"Job {job_id} completed: {result['status']}")
+
+    async def report_result(self, job_id, result):
+        """上报结果; Server 不可达时重试, 直到被接收或明确拒绝; 409 + log_from_seq 时补传日志尾"""
+        attempt = 0
+        while attempt < REPORT_RETRIES:
+            try:
+                async with self.http.post(self.url(f'/api/v1/jobs/{job_id}/result'), json=result,
+                                          timeout=aiohttp.ClientTimeout(total=30)) as resp:
+                    resend_from = (await resp.json()).get('log_from_seq') if resp.status == 409 else None
+                    if resend_from and resend_from != (result.get('log_tail') or {}).get('from_seq'):
+                        result = dict(result, log_tail=await asyncio.to_thread(log_tail, job_id, resend_from))
+                        continue
+                    if resp.status < 500:
+                        if resp.status != 200:
+                            print(f"Result for {job_id} rejected: HTTP {resp.status}")
+                        remove_spool(job_id)
+                        return
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                print(f"Failed to report result: {e}")
+            attempt += 1
+            await asyncio.sleep(5)
+        print(f"Giving up reporting result for {job_id} (kept in spool until restart)")
+
+    # ------------------------------------------------------------------
+    # 制品传输 (与同步模式相同的分块协议)
+    # ------------------------------------------------------------------
+
+    async def download_artifact(self, digest, dest):
+        """分块下载制品: 复用 <dest>.part 中一致的块, 缺失块用 HTTP Range 获取并逐块校验"""
+        async with self.http.get(self.url(f'/api/v1/artifacts/{digest}/manifest'),
+                                 timeout=aiohttp.ClientTimeout(total=30)) as resp:
+            resp.raise_for_status()
+            manifest = await resp.json()
+
+        os.makedirs(os.path.dirname(dest) or '.', exist_ok=True)
+        part = dest + '.part'
+        if not os.path.exists(part) and os.path.exists(dest):
+            os.replace(dest, part)
+        for index in await asyncio.to_thread(transfer.missing_chunks, part, manifest):
+            offset, length = transfer.chunk_span(manifest, index)
+            headers = {'Range': f'bytes={offset}-{offset + length - 1}'}
+            for attempt in range(TRANSFER_RETRIES):
+                try:
+                    async with self.http.get(self.url(f'/api/v1/artifacts/{digest}'), headers=headers,
+                                             timeout=aiohttp.ClientTimeout(total=60)) as r:
+                        if r.status != 206:
+                            raise IOError(f'HTTP {r.status}')
+                        data = await r.read()
+                    await asyncio.to_thread(transfer.write_chunk, part, manifest, index, io.BytesIO(data))
+                    break
+                except (aiohttp.ClientError, asyncio.TimeoutError, IOError, ValueError):
+                    if attempt == TRANSFER_RETRIES - 1:
+                        raise
+                    await asyncio.sleep(2)
+        transfer.finalize(part, dest, manifest)
+
+    async def upload_artifact(self, path):
+        """分块上传制品, 只发送 Server 缺失的块; 返回 digest"""
+        manifest = await asyncio.to_thread(transfer.build_manifest, path)
+        digest = manifest['digest']
+        async with self.http.post(self.url('/api/v1/artifacts/uploads'), json=manifest,
+                                  timeout=aiohttp.ClientTimeout(total=30)) as resp:
+            resp.raise_for_status()
+            missing = (await resp.json()).get('missing', [])
+        for index in missing:
+            offset, length = transfer.chunk_span(manifest, index)
+            data = await asyncio.to_thread(_read_span, path, offset, length)
+            for attempt in range(TRANSFER_RETRIES):
+                try:
+                    async with self.http.put(self.url(f'/api/v1/artifacts/uploads/{digest}/chunks/{index}'),
+                                             data=data, timeout=aiohttp.ClientTimeout(total=60)) as r:
+                        if r.status == 200:
+                            break
+                        error = f'HTTP {r.status}'
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    error = str(e)
+                if attempt == TRANSFER_RETRIES - 1:
+                    raise IOError(f'chunk {index}: {error}')
+                await asyncio.sleep(2)
+        async with self.http.post(self.url(f'/api/v1/artifacts/uploads/{digest}/commit'),
+                                  timeout=aiohttp.ClientTimeout(total=300)) as resp:
+            resp.raise_for_status()
+        return digest
+
+
+def _read_span(path, offset, length):
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        return f.read(length)
+
+
+def run(server_url, node_id, slots, token='', pull=False):
+    """运行 asyncio Agent 直到 SIGINT / SIGTERM"""
+
+    async def main():
+        agent_ = AsyncAgent(server_url, node_id, slots, token=token, pull=pull)
+        task = asyncio.current_task()
+
+        def shutdown():
+            print("\nShutting down...")
+            agent_.running = False
+            task.cancel()
+
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, shutdown)
+        try:
+            await agent_.run()
+        except asyncio.CancelledError:
+            pass
+
+    asyncio.run(main())
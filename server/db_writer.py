@@ -0,0 +1,131 @@
+"""单写线程组提交: 所有数据库写入排队后由一个线程合并成批, 每批一个事务、一次 commit
+
+调用方提交后立即返回 concurrent.futures.Future (提交所在的批次 commit 后完成, 结果为 lastrowid 或函数返回值),
+只在需要持久化保证时 (如响应 Agent 之前) 才等待。队列中的写入按提交顺序执行; 每条写入在 SAVEPOINT 中执行,
+单条失败只回滚该条并把异常交给对应的 Future, 不影响同批其余写入。
+注意: 等待 Future 时不能持有 lock, 否则写线程无法取得锁。
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+_STOP = object()
+
+
+class DBWriter:
+    """connect(): 返回 sqlite3 连接; lock: 每批执行期间持有的锁 (与其他直接访问数据库的代码互斥)
+
+    window: 收到第一条写入后最多再等待的秒数; max_batch: 每批最多写入条数
+    on_commit(ops, seconds): 每批 commit 后回调 (统计)
+    """
+
+    def __init__(self, connect, lock, window=0.005, max_batch=500, on_commit=None, name='ez-db-writer'):
+        self.connect = connect
+        self.lock = lock
+        self.window = window
+        self.max_batch = max_batch
+        self.on_commit = on_commit
+        self.name = name
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+
+    def execute(self, sql, params=()):
+        """排队一条语句, Future 结果为 lastrowid"""
+        return self._submit(lambda conn: conn.execute(sql, params).lastrowid)
+
+    def executemany(self, sql, rows):
+        """排队一条批量语句, Future 结果为影响行数"""
+        return self._submit(lambda conn: conn.executemany(sql, rows).rowcount)
+
+    def call(self, fn):
+        """排队 fn(conn), 在写线程的事务中执行, Future 结果为其返回值"""
+        return self._submit(fn)
+
+    def barrier(self):
+        """此前提交的写入全部 commit 后完成的 Future"""
+        return self._submit(None)
+
+    def close(self, timeout=5):
+        """写完已排队的写入后停止写线程"""
+        if self._thread is not None:
+            self._queue.put(_STOP)
+            self._thread.join(timeout)
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def _submit(self, fn):
+        self.start()
+        future = Future()
+        self._queue.put((fn, future))
+        return future
+
+    def _run(self):
+        conn = self.connect()
+        conn.isolation_level = None  # 事务由写线程显式控制
+        stopping = False
+        while not stopping:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                try:
+                    batch.append(self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if _STOP in batch:
+                stopping = True
+                batch = [op for op in batch if op is not _STOP]
+                while True:
+                    try:
+                        op = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if op is not _STOP:
+                        batch.append(op)
+            if batch:
+                self._commit(conn, batch)
+        conn.close()
+
+    def _commit(self, conn, batch):
+        results = []
+        start = time.perf_counter()
+        with self.lock:
+            try:
+                conn.execute('BEGIN IMMEDIATE')
+                for fn, future in batch:
+                    if fn is None:
+                        results.append((future, None, None))
+                        continue
+                    conn.execute('SAVEPOINT op')
+                    try:
+                        value = fn(conn)
+                    except Exception as e:
+                        conn.execute('ROLLBACK TO op')
+                        results.append((future, None, e))
+                    else:
+                        results.append((future, value, None))
+                    conn.execute('RELEASE op')
+                conn.commit()
+            except Exception as e:
+                # 整批失败 (如磁盘已满): 所有 Future 都报告该错误
+                if conn.in_transaction:
+                    conn.rollback()
+                print(f'DB group commit failed: {type(e).__name__}: {e}')
+                results = [(future, None, e) for _, future in batch]
+        if self.on_commit:
+            self.on_commit(len(batch), time.perf_counter() - start)
+        for future, value, error in results:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(value)
@@ -0,0 +1,169 @@
+"""内存 Job 注册表 (带 task / node / status 二级索引)"""
+
+from threading import RLock
+
+
+class JobRegistry:
+    """job_id -> job dict, 同时维护按 task、node、status 的二级索引
+
+    索引用 dict 作有序集合 (插入顺序 = 创建顺序), 查询成本为 O(结果数)。
+    所有会改变索引字段 (task / node_id / status) 的写操作必须通过 add / update。
+
+    listener(job, changes) 在新增 (changes=None) 或索引字段变化后调用, 用于持久化状态迁移;
+    changes 为 {字段: (旧值, 新值)}, 在锁内取得 — listener 在锁外执行, 此时 job 可能已被后续更新改变。
+    """
+
+    INDEXED = ('task', 'node_id', 'status')
+
+    def __init__(self, listener=None):
+        self._lock = RLock()
+        self._jobs = {}
+        self._index = {field: {} for field in self.INDEXED}
+        self.listener = listener
+
+    # ------------------------------------------------------------------
+    # dict 兼容接口 (只读)
+    # ------------------------------------------------------------------
+
+    def __contains__(self, job_id):
+        return job_id in self._jobs
+
+    def __getitem__(self, job_id):
+        return self._jobs[job_id]
+
+    def __len__(self):
+        return len(self._jobs)
+
+    def get(self, job_id, default=None):
+        return self._jobs.get(job_id, default)
+
+    def items(self):
+        with self._lock:
+            return list(self._jobs.items())
+
+    def values(self):
+        with self._lock:
+            return list(self._jobs.values())
+
+    # ------------------------------------------------------------------
+    # 写操作
+    # ------------------------------------------------------------------
+
+    def add(self, job, notify=True):
+        """登记新 Job (notify=False 用于从持久化存储恢复)"""
+        with self._lock:
+            job_id = job['id']
+            if job_id in self._jobs:
+                self._unindex(self._jobs[job_id])
+            self._jobs[job_id] = job
+            self._reindex(job)
+        if notify and self.listener:
+            self.listener(job, None)
+        return job
+
+    def update(self, job_id, **fields):
+        """更新 Job 字段, 索引字段变化时同步维护索引; 返回 job (不存在则 None)"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            changes = {f: (job.get(f), fields[f]) for f in self.INDEXED if f in fields and fields[f] != job.get(f)}
+            for f, (old, _) in changes.items():
+                self._discard(f, old, job_id)
+            job.update(fields)
+            for f, (_, new) in changes.items():
+                self._put(f, new, job_id)
+        if changes and self.listener:
+            self.listener(job, changes)
+        return job
+
+    def remove(self, job_id):
+        """从注册表移除 Job"""
+        with self._lock:
+            job = self._jobs.pop(job_id, None)
+            if job is not None:
+                self._unindex(job)
+            return job
+
+    # ------------------------------------------------------------------
+    # 索引查询
+    # ------------------------------------------------------------------
+
+    def by_task(self, task, limit=None):
+        """某任务的 Job, 按创建时间倒序"""
+        return self._lookup('task', [task], limit)
+
+    def by_node(self, node_id, *statuses):
+        """某节点上的 Job (可按状态过滤), 按创建时间正序"""
+        with self._lock:
+            ids = list(self._index['node_id'].get(node_id, {}))
+            result = [self._jobs[i] for i in ids]
+        if statuses:
+            result = [j for j in result if j.get('status') in statuses]
+        return result
+
+    def by_status(self, *statuses):
+        """处于指定状态的 Job, 按创建时间正序"""
+        with self._lock:
+            result = []
+            for s in statuses:
+                result.extend(self._jobs[i] for i in self._index['status'].get(s, {}))
+        if len(statuses) > 1:
+            result.sort(key=lambda j: j.get('created_at', ''))
+        return result
+
+    def count_status(self, status):
+        """某状态的 Job 数量"""
+        return len(self._index['status'].get(status, {}))
+
+    def first(self, node_id, status):
+        """某节点上最早进入指定状态的 Job"""
+        with self._lock:
+            on_node = self._index['node_id'].get(node_id, {})
+            in_status = self._index['status'].get(status, {})
+            small, large = (on_node, in_status) if len(on_node) <= len(in_status) else (in_status, on_node)
+            for job_id in small:
+                if job_id in large:
+                    return self._jobs[job_id]
+        return None
+
+    def recent(self):
+        """按创建时间倒序遍历 (调用方可在越过时间窗口后提前 break)"""
+        with self._lock:
+            ids = list(self._jobs)
+        for job_id in reversed(ids):
+            job = self._jobs.get(job_id)
+            if job is not None:
+                yield job
+
+    # ------------------------------------------------------------------
+    # 内部
+    # ------------------------------------------------------------------
+
+    def _lookup(self, field, keys, limit):
+        with self._lock:
+            result = []
+            for key in keys:
+                for job_id in reversed(self._index[field].get(key, {})):
+                    result.append(self._jobs[job_id])
+                    if limit is not None and len(result) >= limit:
+                        return result
+            return result
+
+    def _put(self, field, key, job_id):
+        self._index[field].setdefault(key, {})[job_id] = None
+
+    def _discard(self, field, key, job_id):
+        bucket = self._index[field].get(key)
+        if bucket is not None:
+            bucket.pop(job_id, None)
+            if not bucket:
+                del self._index[field][key]
+
+    def _reindex(self, job):
+        for f in self.INDEXED:
+            self._put(f, job.get(f), job['id'])
+
+    def _unindex(self, job):
+        for f in self.INDEXED:
+            self._discard(f, job.get(f), job['id'])
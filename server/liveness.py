@@ -0,0 +1,104 @@
+"""节点存活检测: 哈希时间轮 + 心跳负载解析
+
+心跳通常只推迟截止时间 (一次 dict 写入), 不移动槽位; 槽位到期时再核对截止时间, 未到期的重新挂到对应槽位。
+巡检每次只处理流逝的槽位, 开销与节点总数无关。
+"""
+
+import math
+import threading
+
+
+class TimerWheel:
+    """tick 秒一格、size 格的时间轮; 超出一圈的截止时间在槽位到期时重新挂入"""
+
+    def __init__(self, tick=1.0, size=64):
+        self.tick = tick
+        self.size = size
+        self._slots = [set() for _ in range(size)]
+        self._deadlines = {}   # key -> 截止时间
+        self._scheduled = {}   # key -> 所在槽位的绝对 tick
+        self._cursor = None    # 已处理到的绝对 tick
+        self._lock = threading.Lock()
+
+    def touch(self, key, timeout, now):
+        """(重新) 设置 key 在 now + timeout 到期"""
+        deadline = now + timeout
+        with self._lock:
+            if self._cursor is None:
+                self._cursor = int(now / self.tick)
+            self._deadlines[key] = deadline
+            tick = self._scheduled.get(key)
+            if tick is None:
+                self._schedule(key, deadline)
+            elif math.ceil(deadline / self.tick) < tick:
+                # 截止时间提前 (超时变短) 时才需要移动槽位
+                self._slots[tick % self.size].discard(key)
+                self._schedule(key, deadline)
+
+    def remove(self, key):
+        with self._lock:
+            self._deadlines.pop(key, None)
+            tick = self._scheduled.pop(key, None)
+            if tick is not None:
+                self._slots[tick % self.size].discard(key)
+
+    def advance(self, now):
+        """推进到 now, 返回已到期的 key (到期后即移出时间轮)"""
+        expired = []
+        with self._lock:
+            if self._cursor is None:
+                return expired
+            target = int(now / self.tick)
+            # 停顿超过一圈时每个槽位只需处理一次
+            if target - self._cursor > self.size:
+                self._cursor = target - self.size
+            while self._cursor < target:
+                self._cursor += 1
+                slot = self._slots[self._cursor % self.size]
+                for key in [k for k in slot if self._scheduled[k] <= self._cursor]:
+                    slot.discard(key)
+                    del self._scheduled[key]
+                    deadline = self._deadlines[key]
+                    if deadline <= now:
+                        del self._deadlines[key]
+                        expired.append(key)
+                    else:
+                        self._schedule(key, deadline)
+        return expired
+
+    def __len__(self):
+        return len(self._deadlines)
+
+    def _schedule(self, key, deadline):
+        tick = max(math.ceil(deadline / self.tick), self._cursor + 1)
+        self._scheduled[key] = tick
+        self._slots[tick % self.size].add(key)
+
+
+LOAD_FIELDS = ('cpus', 'cpu', 'mem_free', 'mem_total', 'disk_free', 'disk_read', 'disk_write', 'busy')
+
+
+def parse_load(value):
+    """规范化心跳中的负载信息, 丢弃未知或非数值字段
+
+    {loadavg: [1m, 5m, 15m], cpus, cpu (使用率 %), mem_free / mem_total / disk_free (字节),
+     disk_read / disk_write (字节/秒), busy (运行中槽位)}
+    """
+    if not isinstance(value, dict):
+        return None
+    load = {}
+    avg = value.get('loadavg')
+    if isinstance(avg, (list, tuple)) and avg and all(isinstance(x, (int, float)) for x in avg[:3]):
+        load['loadavg'] = [float(x) for x in avg[:3]]
+    for name in LOAD_FIELDS:
+        v = value.get(name)
+        if isinstance(v, (int, float)) and not isinstance(v, bool) and v >= 0:
+            load[name] = v
+    return load or None
+
+
+def cpu_pressure(load):
+    """每 CPU 的 1 分钟 loadavg, 未上报时为 0"""
+    if not load or not load.get('loadavg'):
+        return 0.0
+    return load['loadavg'][0] / max(1, load.get('cpus') or 1)
@@ -9,20 +9,41 @@ import json
 import sys
 import time
 import uuid
+import shutil
+import asyncio
+import hashlib
 import sqlite3
 import subprocess
+import atexit
 from datetime import datetime, timedelta
+from itertools import islice
 from pathlib import Path
 from threading import Lock, Thread
+from concurrent.futures import Future
 
 # 确保 server/ 目录在导入路径中
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 import yaml
 
-from flask import Flask, render_template, jsonify, request, Response, redirect
+from flask import Flask, render_template, jsonify, request, Response, redirect, send_file, g
 from flask_cors import CORS
-from flask_socketio import SocketIO, emit
+from flask_socketio import SocketIO, emit, join_room
+
+from job_registry import JobRegistry
+from process_registry import ProcessRegistry
+from scheduler import parse_selectors, select_node
+from plan_schedule import critical_ranks, simulate, median
+from liveness import TimerWheel, parse_load, cpu_pressure
+from telemetry import Telemetry, FIELDS as TELEMETRY_FIELDS, TIERS as TELEMETRY_TIERS, sample_from_load, pick_tier
+from step_cache import StepCache, step_key
+from artifact_store import ArtifactStore
+import transfer
+from metrics import Registry, TimedLock, timed_connection, FAST_BUCKETS, LONG_BUCKETS
+from aio_core import AsyncCore, EmitBridge, LogHub, run_process
+from db_writer import DBWriter
+from retention import Archive, Retention, TABLES as RETENTION_TABLES, parse_policies
+from profiling import LatencyTracker, SlowLog, sample_stacks, collapsed, to_pstats
 
 # 配置
 EZ_ROOT = os.environ.get('EZ_ROOT', os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -30,6 +51,12 @@ DB_PATH = os.environ.get('EZ_DB_PATH', os.path.join(EZ_ROOT, '.ez-server', 'ez.d
 SERVER_TOKEN = os.environ.get('EZ_SERVER_TOKEN', '')
 HTTP_PORT = int(os.environ.get('EZ_HTTP_PORT', 8080))
 API_PORT = int(os.environ.get('EZ_API_PORT', 9090))
+SERVER_DATA_DIR = os.path.dirname(DB_PATH)  # .ez-server/ (缓存等运行数据)
+RETENTION = os.environ.get('EZ_RETENTION', '')  # 保留策略, 见 retention.py; 默认不删除任何历史
+RETENTION_INTERVAL = float(os.environ.get('EZ_RETENTION_INTERVAL', 3600))  # 保留策略执行间隔 (秒), 0 关闭
+DB_AUTO_VACUUM = os.environ.get('EZ_DB_AUTO_VACUUM', '0') == '1'  # 已有数据库切换为增量 auto_vacuum (启动时一次完整 VACUUM)
+DB_COMMIT_WINDOW = float(os.environ.get('EZ_DB_COMMIT_WINDOW_MS', 5)) / 1000  # 组提交合并窗口
+PLAN_CONCURRENCY = int(os.environ.get('EZ_PLAN_CONCURRENCY', 1))  # 单次 plan 运行的并行步骤数, 默认按顺序执行, 0 不限
 YQ = os.path.join(EZ_ROOT, 'dep', 'yq')
 if not os.path.isfile(YQ):
     # Docker 环境: yq 安装在系统路径
@@ -125,18 +152,85 @@ app.config['SECRET_KEY'] = os.environ.get('EZ_SECRET_KEY', 'ez-secret-key')
 CORS(app)
 socketio = SocketIO(app, cors_allowed_origins="*")
 
+# =============================================================================
+# 运行指标 (/metrics)
+# =============================================================================
+
+metrics = Registry()
+M_QUEUE_WAIT = metrics.histogram('ez_job_queue_wait_seconds', '提交到派发的等待时间',
+                                 buckets=(0.01, 0.1, 0.5, 1, 5, 15, 60, 300, 900, 3600))
+M_JOB_DURATION = metrics.histogram('ez_job_duration_seconds', 'Job 执行时长', ('task', 'status'), LONG_BUCKETS)
+M_JOBS_FINISHED = metrics.counter('ez_jobs_finished_total', '结束的 Job 数', ('status',))
+M_DB_QUERY = metrics.histogram('ez_db_query_seconds', 'SQLite 语句执行耗时 (不含取行)', ('op',), FAST_BUCKETS)
+M_DB_LOCK_WAIT = metrics.histogram('ez_db_lock_wait_seconds', 'db_lock 等待时间', buckets=FAST_BUCKETS)
+M_DB_BATCH = metrics.histogram('ez_db_commit_batch_size', '组提交每批写入条数',
+                               buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500))
+M_EMITS = metrics.counter('ez_socketio_emits_total', 'Socket.IO 广播次数', ('event',))
+M_EMIT_BYTES = metrics.counter('ez_socketio_emit_bytes_total', 'Socket.IO 广播负载字节数 (JSON)', ('event',))
+M_SSE_STREAMS = metrics.gauge('ez_sse_streams_active', '活动的 SSE 日志流')
+M_SSE_STREAMS.set(0)
+M_TREE_CACHE = metrics.counter('ez_task_tree_cache_total', '任务树 YAML 缓存查询', ('result',))
+M_STEP_CACHE = metrics.counter('ez_step_cache_total', 'Plan 步骤结果缓存查询', ('result',))
+M_JOBS = metrics.gauge('ez_jobs', '内存中的 Job 数', ('status',))
+M_NODES = metrics.gauge('ez_nodes', '节点数', ('status',))
+M_NODE_SLOTS = metrics.gauge('ez_node_slots', '节点槽位数', ('node',))
+M_NODE_SLOTS_USED = metrics.gauge('ez_node_slots_used', '节点已占用槽位', ('node',))
+M_ARCHIVED = metrics.counter('ez_archived_rows_total', '按保留策略归档并删除的行数', ('table',))
+M_NODES_OFFLINE = metrics.counter('ez_nodes_offline_total', '心跳超时被标记离线的次数')
+M_LOG_LINES = metrics.counter('ez_job_log_lines_total', '经 WebSocket 接收的 Job 日志行数')
+M_RSS = metrics.gauge('process_resident_memory_bytes', 'Server 进程常驻内存')
+M_ASYNC_TASKS = metrics.gauge('ez_async_tasks', '执行事件循环中未完成的 task (本地 Job / plan 运行)')
+M_HTTP = metrics.histogram('ez_http_request_seconds', 'HTTP 请求耗时 (流式响应为首字节时间)',
+                           ('route', 'method', 'status'))
+
+# 请求耗时分位数与慢请求 / 慢查询日志 (/api/v1/debug/*)
+SLOW_REQUEST_MS = float(os.environ.get('EZ_SLOW_REQUEST_MS', 1000))
+SLOW_QUERY_MS = float(os.environ.get('EZ_SLOW_QUERY_MS', 100))
+# 未设置 EZ_SERVER_TOKEN 时 /debug/* 默认关闭 (剖析会暴露调用栈并占用 CPU), 设为 1 才允许无 Token 访问
+DEBUG_API = os.environ.get('EZ_DEBUG_API', '0') == '1'
+route_latency = LatencyTracker(window=int(os.environ.get('EZ_LATENCY_WINDOW', 1024)))
+slow_requests = SlowLog('request', SLOW_REQUEST_MS)
+slow_queries = SlowLog('query', SLOW_QUERY_MS)
+
+_socketio_emit = socketio.emit
+
+
+def _counted_emit(event, *args, **kwargs):
+    """socketio.emit 包装: 统计广播次数与负载大小"""
+    M_EMITS.inc(event=event)
+    if args:
+        M_EMIT_BYTES.inc(len(json.dumps(args[0], default=str)), event=event)
+    return _socketio_emit(event, *args, **kwargs)
+
+
+# 服务端广播统一调用 emit_bridge: 主线程直接发送; 其他 OS 线程 (asyncio 事件循环、SSH 执行线程、
+# DBWriter 回调) 的广播排队, 由 _log_flush_loop 在主线程发送。不要直接调用 socketio.emit
+emit_bridge = EmitBridge(_counted_emit)
+_DBConnection = timed_connection(M_DB_QUERY, slow_queries)
+
 # 数据库锁
-db_lock = Lock()
+db_lock = TimedLock(M_DB_LOCK_WAIT)
 
 # 内存中的节点状态
 nodes = {}  # node_id -> {name, status, last_seen, tags, ...}
-jobs = {}   # job_id -> {task, node, status, logs, ...}
+jobs = JobRegistry()  # job_id -> {task, node, status, logs, ...}, 带 task/node/status 索引, 状态迁移写入 DB
 
 
 def init_db():
     """初始化数据库"""
     os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
     with sqlite3.connect(DB_PATH) as conn:
+        # 增量 VACUUM (保留策略删除后分步归还空间): 新数据库直接开启;
+        # 已有数据库需一次阻塞的完整 VACUUM 才能切换, 只在设置 EZ_DB_AUTO_VACUUM=1 时执行
+        if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+            if not conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'table'").fetchone()[0]:
+                conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+            elif DB_AUTO_VACUUM:
+                conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+                print('Converting database to incremental auto_vacuum (one-time VACUUM)...')
+                conn.execute('VACUUM')
+        # WAL: 读不阻塞写, 每次 commit 只追加并 fsync 一次 WAL
+        conn.execute('PRAGMA journal_mode = WAL')
         conn.execute('''
             CREATE TABLE IF NOT EXISTS nodes (
                 id TEXT PRIMARY KEY,
@@ -161,6 +255,16 @@ def init_db():
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
         ''')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS job_events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                job_id TEXT NOT NULL,
+                status TEXT,
+                node_id TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_job_events_job ON job_events (job_id)')
         conn.execute('''
             CREATE TABLE IF NOT EXISTS charts (
                 id TEXT PRIMARY KEY,
@@ -215,6 +319,48 @@ def init_db():
                 duration REAL
             )
         ''')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS plan_run_artifacts (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                run_id TEXT NOT NULL,
+                step_name TEXT NOT NULL,
+                name TEXT NOT NULL,
+                path TEXT,
+                digest TEXT NOT NULL,
+                size INTEGER,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_plan_run_artifacts_run ON plan_run_artifacts (run_id)')
+        # 列表 (ORDER BY created_at)、按任务/plan 查询、步骤查询与保留策略扫描用的索引
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_jobs_created ON jobs (created_at)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_jobs_task_created ON jobs (task, created_at)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_jobs_status_finished ON jobs (status, finished_at)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_plan_runs_created ON plan_runs (created_at)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_plan_runs_plan_created ON plan_runs (plan_name, created_at)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_plan_runs_status_finished ON plan_runs (status, finished_at)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_plan_run_steps_run ON plan_run_steps (run_id, step_name)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_plan_run_steps_task ON plan_run_steps (task_name, status)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_executions_created ON executions (created_at)')
+        # 节点资源遥测: 每个 (node_id, tier) 固定 slot 数的环形缓冲 (见 telemetry.py)
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS node_metrics (
+                node_id TEXT NOT NULL,
+                tier INTEGER NOT NULL,
+                slot INTEGER NOT NULL,
+                ts INTEGER NOT NULL,
+                samples INTEGER,
+                cpu REAL,
+                mem REAL,
+                load REAL,
+                disk_read REAL,
+                disk_write REAL,
+                disk_free REAL,
+                busy REAL,
+                jobs REAL,
+                PRIMARY KEY (node_id, tier, slot)
+            ) WITHOUT ROWID
+        ''')
         # Migrate: add columns if missing
         try:
             conn.execute('SELECT trigger_type FROM plan_runs LIMIT 1')
@@ -241,21 +387,128 @@ def init_db():
             ('ssh_password', 'TEXT'),
             ('ssh_key_path', 'TEXT'),
             ('connection_type', "TEXT DEFAULT 'agent'"),
+            ('slots', 'INTEGER'),
         ]:
             try:
                 conn.execute(f'SELECT {col} FROM nodes LIMIT 1')
             except sqlite3.OperationalError:
                 conn.execute(f'ALTER TABLE nodes ADD COLUMN {col} {col_def}')
+        try:
+            conn.execute('SELECT parent_run_id FROM plan_runs LIMIT 1')
+        except sqlite3.OperationalError:
+            conn.execute('ALTER TABLE plan_runs ADD COLUMN parent_run_id TEXT')
+        # Migrate: plan 步骤的执行节点与 Job (分布式 plan)
+        for col in ('node_id', 'job_id'):
+            try:
+                conn.execute(f'SELECT {col} FROM plan_run_steps LIMIT 1')
+            except sqlite3.OperationalError:
+                conn.execute(f'ALTER TABLE plan_run_steps ADD COLUMN {col} TEXT')
+        try:
+            conn.execute('SELECT prev_status FROM job_events LIMIT 1')
+        except sqlite3.OperationalError:
+            conn.execute('ALTER TABLE job_events ADD COLUMN prev_status TEXT')
+        # Migrate: jobs 调度/租约字段 (持久化队列)
+        for col, col_def in [
+            ('selectors', 'TEXT'),
+            ('target_node', 'TEXT'),
+            ('tried_nodes', 'TEXT'),
+            ('attempts', 'INTEGER DEFAULT 0'),
+            ('files', 'TEXT'),
+        ]:
+            try:
+                conn.execute(f'SELECT {col} FROM jobs LIMIT 1')
+            except sqlite3.OperationalError:
+                conn.execute(f'ALTER TABLE jobs ADD COLUMN {col} {col_def}')
         conn.commit()
 
 
 def get_db():
     """获取数据库连接"""
-    conn = sqlite3.connect(DB_PATH)
+    conn = sqlite3.connect(DB_PATH, factory=_DBConnection)
     conn.row_factory = sqlite3.Row
     return conn
 
 
+# 写入统一经 db_writer 排队, 由单个写线程按 DB_COMMIT_WINDOW 合并为组提交 (见 db_writer.py);
+# 只在确认前需要持久化保证时 (如 Agent 收到 200 后删除本地暂存的结果) 才等待返回的 Future, 等待时不能持有 db_lock
+db_writer = DBWriter(get_db, db_lock, window=DB_COMMIT_WINDOW,
+                     on_commit=lambda ops, seconds: M_DB_BATCH.observe(ops))
+
+
+def _wait_write(future, poll=0.002):
+    """在请求 / Socket.IO 处理中等待写入提交, 返回其结果
+
+    处理函数运行在 eventlet greenlet 中 (未 monkey patch), Future.result() 会阻塞整个 hub:
+    所有连接停顿一个合并窗口加一次 fsync, 等待期间其他请求的写入也无法并入同一批。
+    这里轮询 done() 并用 socketio.sleep 让出, 其他 greenlet 照常运行。
+    """
+    while not future.done():
+        socketio.sleep(poll)
+    return future.result()
+
+
+def _journal_job(job, changes):
+    """持久化 Job 当前状态并记录状态迁移 (JobRegistry listener, 只排入写队列不等待)
+
+    迁移记录取 changes 中触发本次回调的 旧状态 -> 新状态, 而不是 job 的当前状态 (可能已被后续更新改变)
+    """
+    row = (job['id'], job['task'], job.get('node_id'), json.dumps(job.get('vars', {})),
+           job.get('status'), job.get('exit_code'), job.get('logs'),
+           job.get('started_at'), job.get('finished_at'), job.get('created_at'),
+           json.dumps(job.get('selectors') or []), job.get('target_node'),
+           json.dumps(job.get('tried_nodes') or []), job.get('attempts', 0),
+           json.dumps({k: job.get(k) for k in ('inputs', 'artifacts', 'outputs', 'plan_step') if job.get(k)}))
+    changes = changes or {}
+    prev_status, status = changes.get('status', (None, job.get('status')))
+    event = (job['id'], prev_status, status, changes.get('node_id', (None, job.get('node_id')))[1])
+
+    def write(conn):
+        conn.execute('''
+            INSERT OR REPLACE INTO jobs (id, task, node_id, vars, status, exit_code, logs,
+                started_at, finished_at, created_at, selectors, target_node, tried_nodes, attempts, files)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', row)
+        conn.execute('INSERT INTO job_events (job_id, prev_status, status, node_id) VALUES (?, ?, ?, ?)', event)
+
+    return db_writer.call(write)
+
+
+JOB_FINISHED = ('success', 'failed', 'error', 'timeout', 'cancelled')
+_job_waiters = {}  # job_id -> [Future], Job 结束时完成 (plan 远程步骤等待)
+_job_waiters_lock = Lock()
+
+
+def _watch_job(job_id):
+    """Job 结束 (JOB_FINISHED) 时完成的 Future, 结果为 job"""
+    future = Future()
+    with _job_waiters_lock:
+        job = jobs.get(job_id)
+        if job is None or job.get('status') in JOB_FINISHED:
+            future.set_result(job)
+        else:
+            _job_waiters.setdefault(job_id, []).append(future)
+    return future
+
+
+def _on_job_change(job, changes):
+    """JobRegistry listener: 持久化状态迁移; plan 步骤的 Job 同步执行节点, 结束时唤醒等待方"""
+    _journal_job(job, changes)
+    node_id = (changes or {}).get('node_id', (None, None))[1]
+    if job.get('plan_step') and node_id:
+        run_id, step_name = job['plan_step']
+        _update_step(run_id, step_name, 'running', node_id=node_id)
+        emit_bridge('plan_step_update', {'run_id': run_id, 'step_name': step_name, 'status': 'running',
+                                         'job_id': job['id'], 'node_id': node_id})
+    if (changes or {}).get('status', (None, job.get('status')))[1] in JOB_FINISHED:
+        with _job_waiters_lock:
+            waiters = _job_waiters.pop(job['id'], [])
+        for future in waiters:
+            future.set_result(job)
+
+
+jobs.listener = _on_job_change
+
+
 def verify_token():
     """验证 API Token"""
     if not SERVER_TOKEN:
@@ -350,6 +603,138 @@ def charts_redirect():
     return redirect('/settings', code=301)
 
 
+# =============================================================================
+# Metrics / 性能诊断
+# =============================================================================
+
+@app.before_request
+def _request_timer_start():
+    g.request_start = time.perf_counter()
+
+
+@app.after_request
+def _request_timer_stop(response):
+    """按路由模板 (而非实际路径) 记录耗时"""
+    start = g.pop('request_start', None)
+    if start is not None:
+        elapsed = time.perf_counter() - start
+        route = request.url_rule.rule if request.url_rule else '<unmatched>'
+        M_HTTP.observe(elapsed, route=route, method=request.method, status=response.status_code)
+        route_latency.record(f'{request.method} {route}', elapsed)
+        slow_requests.check(elapsed, method=request.method, path=request.full_path.rstrip('?'),
+                            status=response.status_code)
+    return response
+
+
+JOB_STATUSES = ('pending', 'assigned', 'running', 'success', 'failed', 'error', 'timeout', 'cancelled')
+
+
+@metrics.collector
+def _collect_scheduler_metrics():
+    """导出前刷新队列与节点槽位 gauge"""
+    for status in JOB_STATUSES:
+        M_JOBS.set(jobs.count_status(status), status=status)
+    M_NODES.clear()
+    M_NODE_SLOTS.clear()
+    M_NODE_SLOTS_USED.clear()
+    counts = {}
+    for node_id, node in list(nodes.items()):
+        counts[node.get('status')] = counts.get(node.get('status'), 0) + 1
+        M_NODE_SLOTS.set(_node_capacity(node_id), node=node_id)
+        M_NODE_SLOTS_USED.set(_node_load(node_id), node=node_id)
+    for status, n in counts.items():
+        M_NODES.set(n, status=status)
+    M_RSS.set(_process_rss())
+    M_ASYNC_TASKS.set(aio.tasks())
+
+
+def _process_rss():
+    """当前进程 RSS (字节); 非 Linux 时退化为峰值 RSS"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus 文本格式指标"""
+    return Response(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def _debug_denied():
+    """/debug/* 的访问检查, 拒绝时返回错误响应: 未配置 Token 且未显式开启时 403, Token 不符时 401"""
+    if not SERVER_TOKEN and not DEBUG_API:
+        return jsonify({'error': 'Debug API disabled: set EZ_SERVER_TOKEN (or EZ_DEBUG_API=1)'}), 403
+    if not verify_token():
+        return jsonify({'error': 'Unauthorized'}), 401
+    return None
+
+
+@app.route('/api/v1/debug/routes', methods=['GET'])
+def api_debug_routes():
+    """各路由耗时分位数 (毫秒)"""
+    denied = _debug_denied()
+    if denied:
+        return denied
+    return jsonify({'window': route_latency.window, 'routes': route_latency.snapshot()})
+
+
+@app.route('/api/v1/debug/slow', methods=['GET'])
+def api_debug_slow():
+    """最近的慢请求与慢查询"""
+    denied = _debug_denied()
+    if denied:
+        return denied
+    return jsonify({
+        'thresholds_ms': {'request': SLOW_REQUEST_MS, 'query': SLOW_QUERY_MS},
+        'requests': slow_requests.entries(),
+        'queries': slow_queries.entries(),
+    })
+
+
+_profile_lock = Lock()
+
+
+@app.route('/api/v1/debug/profile', methods=['GET'])
+def api_debug_profile():
+    """对运行中的 Server 采样剖析 seconds 秒
+
+    format=collapsed (默认, 折叠栈文本, 可直接喂给 flamegraph.pl / speedscope) 或 pstats (python -m pstats 加载)
+    """
+    denied = _debug_denied()
+    if denied:
+        return denied
+    seconds = min(max(request.args.get('seconds', 10, type=float), 0.1), 120)
+    interval = min(max(request.args.get('interval', 5, type=float), 1), 1000) / 1000.0
+    fmt = request.args.get('format', 'collapsed')
+    if fmt not in ('collapsed', 'pstats'):
+        return jsonify({'error': 'format must be collapsed or pstats'}), 400
+    if not _profile_lock.acquire(False):
+        return jsonify({'error': 'Profile already running'}), 409
+    try:
+        # 采样在真实 OS 线程中进行, 请求处理协程让出等待, 不阻塞事件循环
+        result = {}
+        sampler = Thread(target=lambda: result.update(samples=sample_stacks(seconds, interval)), daemon=True)
+        sampler.start()
+        while sampler.is_alive():
+            socketio.sleep(0.1)
+    finally:
+        _profile_lock.release()
+    samples = result.get('samples')
+    if samples is None:
+        return jsonify({'error': 'Profiling failed'}), 500
+    stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+    if fmt == 'pstats':
+        return Response(to_pstats(samples, interval), mimetype='application/octet-stream',
+                        headers={'Content-Disposition': f'attachment; filename=ez-server-{stamp}.pstats'})
+    return Response(collapsed(samples), mimetype='text/plain',
+                    headers={'Content-Disposition': f'inline; filename=ez-server-{stamp}.collapsed.txt'})
+
+
 # =============================================================================
 # API Routes - Nodes
 # =============================================================================
@@ -366,6 +751,9 @@ def api_list_nodes():
             'tags': node.get('tags', []),
             'last_seen': node.get('last_seen'),
             'current_job': node.get('current_job'),
+            'slots': _node_capacity(nid),
+            'running_jobs': _node_load(nid),
+            'load': node.get('load'),
             'connection_type': node.get('connection_type', 'agent'),
             'host': node.get('host'),
         })
@@ -380,6 +768,35 @@ def api_get_node(node_id):
     return jsonify(nodes[node_id])
 
 
+@app.route('/api/v1/nodes/<node_id>/metrics', methods=['GET'])
+def api_node_metrics(node_id):
+    """节点资源时间序列: ?range=1h|6h|1d|7d|30d (或秒数), 自动选择覆盖该范围的最细粒度层"""
+    if node_id not in nodes:
+        return jsonify({'error': 'Node not found'}), 404
+    seconds = _parse_range(request.args.get('range', '1h'))
+    if seconds is None:
+        return jsonify({'error': 'Invalid range'}), 400
+    step, _ = pick_tier(seconds, TELEMETRY_TIERS)
+    now = time.time()
+    with db_lock:
+        with get_db() as conn:
+            series = telemetry.query(conn, node_id, step, now, since=now - seconds)
+    return jsonify({'node_id': node_id, 'step': step, 'fields': list(TELEMETRY_FIELDS), 'series': series})
+
+
+def _parse_range(value):
+    """解析时间范围: 纯数字为秒, 或带 m / h / d 后缀"""
+    units = {'m': 60, 'h': 3600, 'd': 86400}
+    try:
+        if value and value[-1] in units:
+            seconds = float(value[:-1]) * units[value[-1]]
+        else:
+            seconds = float(value)
+    except (TypeError, ValueError):
+        return None
+    return seconds if seconds > 0 else None
+
+
 @app.route('/api/v1/nodes/register', methods=['POST'])
 def api_register_node():
     """注册节点"""
@@ -387,26 +804,27 @@ def api_register_node():
     node_id = data.get('id') or str(uuid.uuid4())[:8]
     name = data.get('name', node_id)
     tags = data.get('tags', [])
+    slots = _parse_slots(data.get('slots'))
 
     nodes[node_id] = {
         'id': node_id,
         'name': name,
         'status': 'online',
         'tags': tags,
+        'slots': slots,
         'last_seen': datetime.now().isoformat(),
         'current_job': None
     }
+    _node_seen(node_id, data.get('load'))
 
     # 持久化到数据库
-    with db_lock:
-        with get_db() as conn:
-            conn.execute('''
-                INSERT OR REPLACE INTO nodes (id, name, tags, status, last_seen)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (node_id, name, json.dumps(tags), 'online', datetime.now()))
-            conn.commit()
+    db_writer.execute('''
+        INSERT OR REPLACE INTO nodes (id, name, tags, status, last_seen, slots)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', (node_id, name, json.dumps(tags), 'online', datetime.now(), slots))
 
-    socketio.emit('node_update', nodes[node_id])
+    emit_bridge('node_update', nodes[node_id])
+    _dispatch_pending()
     return jsonify({'id': node_id, 'status': 'registered'})
 
 
@@ -416,17 +834,35 @@ def api_ping_node(node_id):
     if node_id not in nodes:
         return jsonify({'error': 'Node not found'}), 404
 
-    nodes[node_id]['last_seen'] = datetime.now().isoformat()
-    nodes[node_id]['status'] = 'online'
+    data = request.get_json(silent=True) or {}
+    was_online = _node_seen(node_id, data.get('load'))
+    revoked = _renew_leases(node_id, data.get('running'))
+    if not was_online:
+        _dispatch_pending()
 
-    # 返回待执行的任务
-    pending_job = None
-    for job_id, job in jobs.items():
-        if job.get('node_id') == node_id and job.get('status') == 'pending':
-            pending_job = job
-            break
+    # 心跳只续约, 不投递 Job: Pull 模式的 Job 只经 /jobs/next 长轮询取出 (取出即进入租约)
+    return jsonify({'status': 'ok', 'revoked': revoked})
+
+
+@app.route('/api/v1/nodes/<node_id>/jobs/next', methods=['GET'])
+def api_poll_node_job(node_id):
+    """长轮询拉取任务 (NAT 后的 Agent): 最多等待 wait 秒"""
+    if not verify_token():
+        return jsonify({'error': 'Unauthorized'}), 401
+    if node_id not in nodes:
+        return jsonify({'error': 'Node not found'}), 404
 
-    return jsonify({'status': 'ok', 'pending_job': pending_job})
+    wait = min(request.args.get('wait', 30, type=int), 120)
+    deadline = time.time() + wait
+    while True:
+        if node_id not in nodes:
+            return jsonify({'error': 'Node not found'}), 404
+        if not _node_seen(node_id):
+            _dispatch_pending()
+        job = _take_assigned(node_id)
+        if job or time.time() >= deadline:
+            return jsonify({'job': job, 'lease_ttl': JOB_LEASE_TTL})
+        socketio.sleep(0.5)
 
 
 @app.route('/api/v1/nodes/<node_id>', methods=['DELETE'])
@@ -434,10 +870,10 @@ def api_remove_node(node_id):
     """移除节点"""
     if node_id in nodes:
         del nodes[node_id]
-    with db_lock:
-        with get_db() as conn:
-            conn.execute('DELETE FROM nodes WHERE id = ?', (node_id,))
-            conn.commit()
+    node_liveness.remove(node_id)
+    telemetry.forget(node_id)
+    db_writer.execute('DELETE FROM nodes WHERE id = ?', (node_id,))
+    db_writer.execute('DELETE FROM node_metrics WHERE node_id = ?', (node_id,))
     return jsonify({'status': 'removed'})
 
 
@@ -453,6 +889,7 @@ def api_register_ssh_node():
     password = data.get('password', '')
     key_path = data.get('key_path', '')
     tags = data.get('tags', [])
+    slots = _parse_slots(data.get('slots'))
 
     if not name or not host or not ssh_user:
         return jsonify({'error': 'name, host, ssh_user required'}), 400
@@ -470,6 +907,7 @@ def api_register_ssh_node():
         'name': name,
         'status': 'online',
         'tags': tags,
+        'slots': slots,
         'last_seen': datetime.now().isoformat(),
         'current_job': None,
         'connection_type': 'ssh',
@@ -483,17 +921,15 @@ def api_register_ssh_node():
     nodes[node_id] = node_data
 
     # 持久化
-    with db_lock:
-        with get_db() as conn:
-            conn.execute('''
-                INSERT OR REPLACE INTO nodes (id, name, tags, status, last_seen,
-                    host, port, ssh_user, auth_type, ssh_password, ssh_key_path, connection_type)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (node_id, name, json.dumps(tags), 'online', datetime.now(),
-                  host, int(port), ssh_user, auth_type, password, key_path, 'ssh'))
-            conn.commit()
-
-    socketio.emit('node_update', node_data)
+    db_writer.execute('''
+        INSERT OR REPLACE INTO nodes (id, name, tags, status, last_seen,
+            host, port, ssh_user, auth_type, ssh_password, ssh_key_path, connection_type, slots)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (node_id, name, json.dumps(tags), 'online', datetime.now(),
+          host, int(port), ssh_user, auth_type, password, key_path, 'ssh', slots))
+
+    emit_bridge('node_update', node_data)
+    _dispatch_pending()
     return jsonify({'id': node_id, 'status': 'registered', 'connection_type': 'ssh'})
 
 
@@ -625,15 +1061,14 @@ def api_task_history(task_name):
     limit = request.args.get('limit', 20, type=int)
     history = []
 
-    # 从 jobs (内存)
-    for jid, job in sorted(jobs.items(), key=lambda x: x[1].get('created_at', ''), reverse=True):
-        if job.get('task') == task_name:
-            history.append({
-                'id': jid, 'type': 'task',
-                'name': job.get('task'), 'status': job.get('status'),
-                'started_at': job.get('started_at'), 'finished_at': job.get('finished_at'),
-                'created_at': job.get('created_at')
-            })
+    # 从 jobs (内存, task 索引)
+    for job in jobs.by_task(task_name, limit):
+        history.append({
+            'id': job['id'], 'type': 'task',
+            'name': job.get('task'), 'status': job.get('status'),
+            'started_at': job.get('started_at'), 'finished_at': job.get('finished_at'),
+            'created_at': job.get('created_at')
+        })
     # 从 jobs (DB)
     with db_lock:
         with get_db() as conn:
@@ -665,48 +1100,366 @@ def api_run_task():
     task = data.get('task')
     node_id = data.get('node')
     task_vars = data.get('vars', {})
+    selectors = parse_selectors(data.get('tags'))
+    inputs = data.get('inputs') or []
+    artifacts = data.get('artifacts') or []
 
     if not task:
         return jsonify({'error': 'Task name required'}), 400
+    if not isinstance(inputs, list) or not isinstance(artifacts, list):
+        return jsonify({'error': 'inputs / artifacts must be lists'}), 400
+    for inp in inputs:
+        if (not isinstance(inp, dict) or not _valid_digest(inp.get('digest'))
+                or not artifact_store.has(inp['digest']) or _relative_path_error(inp.get('path'))):
+            return jsonify({'error': f'Invalid input artifact: {inp}'}), 400
+    for art in artifacts:
+        if not isinstance(art, dict) or not art.get('name') or _relative_path_error(art.get('path')):
+            return jsonify({'error': f'Invalid output artifact: {art}'}), 400
 
     # 如果指定了节点，检查节点是否存在
     if node_id and node_id not in nodes:
         return jsonify({'error': f'Node {node_id} not found'}), 404
 
-    # 创建 Job
+    job = _submit_job(task, task_vars, node_id=node_id, selectors=selectors,
+                      inputs=inputs, artifacts=artifacts)
+    return jsonify({'job_id': job['id'], 'status': job['status'], 'node_id': job.get('node_id')})
+
+
+# =============================================================================
+# 调度 - 节点选择与排队
+# =============================================================================
+
+NODE_DEFAULT_SLOTS = int(os.environ.get('EZ_NODE_SLOTS', 1))
+HEARTBEAT_INTERVAL = float(os.environ.get('EZ_HEARTBEAT_INTERVAL', 5))  # Agent 心跳间隔 (秒)
+NODE_MISS_LIMIT = int(os.environ.get('EZ_NODE_MISS_LIMIT', 3))          # 连续错过几次心跳判定离线
+JOB_LEASE_TTL = int(os.environ.get('EZ_JOB_LEASE_TTL', 30))        # Agent Job 租约时长 (秒)
+JOB_MAX_ATTEMPTS = int(os.environ.get('EZ_JOB_MAX_ATTEMPTS', 3))   # 租约过期后最多投递次数
+KILL_GRACE = int(os.environ.get('EZ_KILL_GRACE', 5))               # 取消时 SIGTERM 到 SIGKILL 的间隔 (秒)
+
+procs = ProcessRegistry(grace=KILL_GRACE)  # 正在执行的进程, 用于取消
+
+# 本地 Job 与 plan 运行共用一个 asyncio 事件循环线程 (见 aio_core.py)
+aio = AsyncCore()
+
+# job_log_update 按 Job 合并后由 _log_flush_loop 定期广播
+LOG_FLUSH_MS = float(os.environ.get('EZ_LOG_FLUSH_MS', 100))      # 日志广播合并窗口 (毫秒)
+log_hub = LogHub(lambda job_id, text: emit_bridge('job_log_update', {'job_id': job_id, 'log': text}))
+
+
+def _log_flush_loop():
+    """后台任务: 每 LOG_FLUSH_MS 广播一次合并后的日志, 并发送其他线程排队的广播"""
+    while True:
+        socketio.sleep(LOG_FLUSH_MS / 1000.0)
+        log_hub.flush()
+        emit_bridge.flush()
+
+
+_sched_lock = Lock()
+node_liveness = TimerWheel()  # Agent 节点的心跳截止时间 (SSH 节点不参与)
+telemetry = Telemetry()       # 节点资源时间序列 (心跳样本降采样)
+TELEMETRY_FLUSH = 10          # 已结束的遥测桶写入间隔 (秒)
+
+
+def _node_load(node_id):
+    """节点当前占用数 (已分配未结束的 Job)"""
+    return len(jobs.by_node(node_id, 'assigned', 'running'))
+
+
+def _node_capacity(node_id):
+    """节点容量 (Agent 注册时上报的槽位数)"""
+    return max(1, int(nodes.get(node_id, {}).get('slots') or NODE_DEFAULT_SLOTS))
+
+
+def _node_has_capacity(node_id):
+    """节点在线且仍有空闲槽位"""
+    node = nodes.get(node_id)
+    return bool(node) and node.get('status') == 'online' and _node_load(node_id) < _node_capacity(node_id)
+
+
+def _node_pressure(node_id):
+    """心跳上报的每 CPU 负载 (loadavg 1m / cpus), 用于同等槽位占用率下的节点排序"""
+    return round(cpu_pressure(nodes.get(node_id, {}).get('load')), 1)
+
+
+def _node_seen(node_id, load=None):
+    """收到节点心跳 / 注册 / 轮询: 刷新 last_seen 与存活截止时间, 返回此前是否在线"""
+    node = nodes[node_id]
+    was_online = node.get('status') == 'online'
+    node['last_seen'] = datetime.now().isoformat()
+    node['status'] = 'online'
+    load = parse_load(load)
+    if load:
+        node['load'] = load
+        telemetry.record(node_id, sample_from_load(load, _node_load(node_id)), time.time())
+    node_liveness.touch(node_id, HEARTBEAT_INTERVAL * NODE_MISS_LIMIT, time.time())
+    return was_online
+
+
+def _mark_offline(node_id):
+    """心跳超时: 节点标记 offline, 其租约中的 Job 立即重新排队 (节点恢复后仍可在心跳中收回)"""
+    node = nodes.get(node_id)
+    if not node or node.get('status') != 'online':
+        return
+    node['status'] = 'offline'
+    M_NODES_OFFLINE.inc()
+    print(f'Node {node_id} offline (no heartbeat since {node.get("last_seen")})')
+    for job in jobs.by_node(node_id, 'assigned', 'running'):
+        _requeue_job(job['id'], f'节点 {node_id} 连续 {NODE_MISS_LIMIT} 次心跳超时, 重新投递')
+    emit_bridge('node_update', node)
+
+
+def _parse_slots(value):
+    """解析节点上报的槽位数, 非法值回落到默认值"""
+    try:
+        return max(1, int(value))
+    except (TypeError, ValueError):
+        return NODE_DEFAULT_SLOTS
+
+
+def _submit_job(task, task_vars, node_id=None, selectors=None, inputs=None, artifacts=None, plan_step=None):
+    """创建 Job 并调度
+
+    - 指定 node: 分配到该节点, 节点无空闲槽位时排队等待该节点
+    - 指定 tags 选择器: 选负载最低的匹配在线节点, 暂无空闲则排队 (pending, node_id 为空)
+    - 都没有: 在 Server 本地执行
+
+    inputs:    [{digest, path}] 执行前放到执行节点的制品 (path 相对 EZ_ROOT / SSH 家目录)
+    artifacts: [{name, path}] 执行成功后收回制品库, digest 记入 job['outputs']
+    plan_step: (run_id, step_name) plan 步骤派发的 Job, 执行节点变化时同步到 plan_run_steps
+    """
     job_id = str(uuid.uuid4())[:8]
     job = {
         'id': job_id,
         'task': task,
-        'node_id': node_id,
+        'node_id': None,
+        'target_node': node_id,
+        'selectors': selectors or [],
         'vars': task_vars,
-        'status': 'pending' if node_id else 'running',
+        'status': 'pending',
         'logs': '',
         'created_at': datetime.now().isoformat()
     }
-    jobs[job_id] = job
+    if plan_step:
+        job['plan_step'] = list(plan_step)
+    if inputs:
+        job['inputs'] = [{'digest': i['digest'], 'path': i['path']} for i in inputs]
+    if artifacts:
+        job['artifacts'] = [{'name': a['name'], 'path': a['path']} for a in artifacts
+                            if isinstance(a, dict) and a.get('name') and a.get('path')]
+    jobs.add(job)
+
+    if node_id or selectors:
+        _dispatch_pending()
+    else:
+        M_QUEUE_WAIT.observe(0.0)
+        jobs.update(job_id, status='running')
+        aio.submit(_execute_job_local(job_id))
+    return job
+
+
+def _dispatch_job(job_id, node_id):
+    """把 Job 分配给节点执行
 
-    # 如果没有指定节点，在本地执行
-    if not node_id:
-        Thread(target=_execute_job_local, args=(job_id,), daemon=True).start()
-    elif nodes.get(node_id, {}).get('connection_type') == 'ssh':
-        job['status'] = 'running'
+    SSH 节点由 Server 直接执行; Agent 节点以租约方式分配 (assigned), Agent 确认后转为 running,
+    并通过心跳续约, 租约过期未续则重新排队投递。Push (job_assigned) 与 Pull (长轮询) 共用同一租约。
+    """
+    job = jobs.get(job_id)
+    tried = list(job.get('tried_nodes') or [])
+    # 再次派发给同一节点时保留原日志起点: 若该节点其实仍在执行 (断线期间租约过期), 重放后日志保持完整
+    same_node = bool(tried) and tried[-1] == node_id and job.get('log_base') is not None
+    if node_id not in tried:
+        tried.append(node_id)
+    fields = {'node_id': node_id, 'tried_nodes': tried, 'attempts': job.get('attempts', 0) + 1}
+    M_QUEUE_WAIT.observe(_seconds_since(job.get('created_at')))
+    if nodes.get(node_id, {}).get('connection_type') == 'ssh':
+        jobs.update(job_id, status='running', **fields)
         Thread(target=_execute_job_ssh, args=(job_id,), daemon=True).start()
     else:
-        socketio.emit('job_assigned', job, room=node_id)
+        jobs.update(job_id, status='assigned', delivered=False,
+                    lease_expires=time.time() + JOB_LEASE_TTL,
+                    log_seq=0, log_base=job['log_base'] if same_node else len(job.get('logs') or ''),
+                    log_resend_from=None, **fields)
+        procs.register_agent(job_id, lambda: emit_bridge('job_cancel', {'job_id': job_id}, to=node_id))
+        emit_bridge('job_assigned', job, to=node_id)
+        emit_bridge('job_update', job)
+
+
+def _dispatch_pending():
+    """为排队中的 Job 按创建顺序分配空闲槽位"""
+    with _sched_lock:
+        for job in jobs.by_node(None, 'pending'):
+            target = job.get('target_node')
+            if target:
+                node_id = target if _node_has_capacity(target) else None
+            else:
+                selectors = job.get('selectors') or []
+                # 重投时优先换一个节点
+                node_id = (select_node(nodes, selectors, _node_load, _node_capacity,
+                                       exclude=job.get('tried_nodes'), pressure_of=_node_pressure)
+                           or select_node(nodes, selectors, _node_load, _node_capacity,
+                                          pressure_of=_node_pressure))
+            if node_id:
+                _dispatch_job(job['id'], node_id)
+
+
+def _ack_job(job_id, node_id):
+    """Agent 确认接收 Job: assigned -> running; 租约不属于该节点时拒绝"""
+    job = jobs.get(job_id)
+    if not job or job.get('node_id') != node_id or job.get('status') not in ('assigned', 'running'):
+        return False
+    if job['status'] == 'assigned':
+        jobs.update(job_id, status='running', started_at=datetime.now().isoformat(),
+                    lease_expires=time.time() + JOB_LEASE_TTL)
+        emit_bridge('job_update', job)
+    return True
+
+
+def _renew_leases(node_id, job_ids):
+    """心跳续约, 返回节点仍在运行但租约已不属于它的 Job (应放弃)
+
+    断线期间租约过期、已重新排队但尚未派发给其他节点 (或又派发回该节点) 的 Job 由原节点收回继续执行,
+    避免重跑; 收回后日志序号归零, Agent 从 seq 1 重放 (覆盖期间追加的排队说明)。
+    """
+    revoked = []
+    expires = time.time() + JOB_LEASE_TTL
+    for job_id in job_ids or []:
+        job = jobs.get(job_id)
+        if job and job.get('node_id') == node_id and job.get('status') == 'assigned':
+            # 节点只在 ack 之后上报运行中的 Job, 仍为 assigned 说明是重新派发回来的同一次执行
+            jobs.update(job_id, status='running', lease_expires=expires, delivered=True,
+                        log_seq=0, log_resend_from=None)
+            emit_bridge('job_update', job)
+        elif job and job.get('node_id') == node_id and job.get('status') == 'running':
+            jobs.update(job_id, lease_expires=expires)
+        elif job and _reclaim_job(job, node_id, expires):
+            print(f'Job {job_id} reclaimed by {node_id}')
+        else:
+            revoked.append(job_id)
+    return revoked
+
+
+def _reclaim_job(job, node_id, expires):
+    """原节点收回已重新排队的 Job; 返回是否成功"""
+    with _sched_lock:
+        if job.get('status') != 'pending' or (job.get('tried_nodes') or [])[-1:] != [node_id]:
+            return False
+        jobs.update(job['id'], status='running', node_id=node_id, lease_expires=expires,
+                    delivered=True, log_seq=0, log_resend_from=None)
+    procs.register_agent(job['id'], lambda: emit_bridge('job_cancel', {'job_id': job['id']}, to=node_id))
+    emit_bridge('job_update', job)
+    return True
+
+
+def _log_offsets(node_id, job_ids):
+    """节点上运行中的 Job 已确认接收的日志序号 {job_id: seq}, 供 Agent 重连后从 seq + 1 重放"""
+    offsets = {}
+    for job_id in job_ids or []:
+        job = jobs.get(job_id)
+        if job and job.get('node_id') == node_id and job.get('status') in ('assigned', 'running'):
+            offsets[job_id] = job.get('log_seq', 0)
+    return offsets
+
+
+def _take_assigned(node_id):
+    """取出分配给节点但尚未投递的 Job (Pull 模式)"""
+    with _sched_lock:
+        for job in jobs.by_node(node_id, 'assigned'):
+            if not job.get('delivered'):
+                jobs.update(job['id'], delivered=True)
+                return job
+    return None
+
+
+def _requeue_job(job_id, reason):
+    """租约过期: 重新排队, 超过最大投递次数则标记 error"""
+    job = jobs.get(job_id)
+    if not job or job.get('status') not in ('assigned', 'running'):
+        return
+    note = f'[ez-server] {reason}\n'
+    procs.unregister(job_id)
+    if job.get('attempts', 0) >= JOB_MAX_ATTEMPTS:
+        _finish_job(job_id, status='error', logs=(job.get('logs') or '') + note + '[ez-server] 超过最大投递次数\n')
+        return
+    jobs.update(job_id, status='pending', node_id=None, lease_expires=None,
+                logs=(job.get('logs') or '') + note)
+    emit_bridge('job_update', job)
+
+
+def _sweep_leases():
+    """回收过期租约"""
+    now = time.time()
+    expired = [j['id'] for j in jobs.by_status('assigned', 'running')
+               if j.get('lease_expires') and j['lease_expires'] < now]
+    for job_id in expired:
+        _requeue_job(job_id, f'节点 {jobs[job_id].get("node_id")} 租约过期, 重新投递')
+    if expired:
+        _dispatch_pending()
+
+
+def _sweep_nodes():
+    """心跳超时的节点标记离线"""
+    offline = node_liveness.advance(time.time())
+    for node_id in offline:
+        _mark_offline(node_id)
+    if offline:
+        _dispatch_pending()
+
+
+def _flush_telemetry():
+    """遥测桶批量写入 node_metrics"""
+    db_writer.call(lambda conn: telemetry.flush(conn, time.time()))
 
-    return jsonify({'job_id': job_id, 'status': job['status']})
+
+def _sweeper_loop():
+    """后台巡检"""
+    last_flush = time.time()
+    while True:
+        try:
+            _sweep_nodes()
+            _sweep_leases()
+            if time.time() - last_flush >= TELEMETRY_FLUSH:
+                last_flush = time.time()
+                _flush_telemetry()
+        except Exception as e:
+            print(f'Sweeper error: {e}')
+        socketio.sleep(1)
+
+
+def _finish_job(job_id, **outcome):
+    """记录执行结果; 已取消的 Job 保持 cancelled 状态"""
+    job = jobs.get(job_id)
+    if job.get('status') == 'cancelled':
+        outcome['status'] = 'cancelled'
+    # 状态迁移由 JobRegistry listener 持久化
+    jobs.update(job_id, finished_at=job.get('finished_at') or datetime.now().isoformat(),
+                lease_expires=None, **outcome)
+    status = job.get('status')
+    M_JOBS_FINISHED.inc(status=status)
+    if job.get('started_at'):
+        M_JOB_DURATION.observe(_seconds_since(job['started_at']), task=job.get('task'), status=status)
+    emit_bridge('job_update', job)
+
+
+def _seconds_since(iso_time):
+    """ISO 时间距今秒数 (解析失败为 0)"""
+    try:
+        return max(0.0, (datetime.now() - datetime.fromisoformat(iso_time)).total_seconds())
+    except (TypeError, ValueError):
+        return 0.0
 
 
-def _execute_job_local(job_id):
-    """在本地执行任务"""
+async def _execute_job_local(job_id):
+    """在本地执行任务 (事件循环中的 asyncio 子进程, 输出边读边追加到日志并广播)
+
+    状态迁移只排入写队列 (db_writer), 制品读写放到线程池, 不阻塞事件循环。
+    """
     job = jobs.get(job_id)
-    if not job:
+    # 协程开始前已取消的不再执行
+    if not job or job.get('status') == 'cancelled':
         return
 
-    job['status'] = 'running'
-    job['started_at'] = datetime.now().isoformat()
-    socketio.emit('job_update', job)
+    jobs.update(job_id, status='running', started_at=datetime.now().isoformat())
+    emit_bridge('job_update', job)
 
     task_bin = _get_task_bin()
     cmd = [task_bin, '-t', os.path.join(EZ_ROOT, 'Taskfile.yml'), job['task']]
@@ -714,31 +1467,41 @@ def _execute_job_local(job_id):
     for k, v in job.get('vars', {}).items():
         env[k] = v
 
+    def on_output(text):
+        job['logs'] += text + '\n'
+        log_hub.publish(job_id, text)
+
+    def on_start(proc):
+        procs.register_local(job_id, proc)
+        # 进程启动与登记之间到达的取消找不到进程, 在此补上
+        if job.get('status') == 'cancelled':
+            procs.cancel(job_id)
+
     try:
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=3600, env=env, cwd=EZ_ROOT)
-        job['logs'] = result.stdout + result.stderr
-        job['exit_code'] = result.returncode
-        job['status'] = 'success' if result.returncode == 0 else 'failed'
-    except subprocess.TimeoutExpired:
-        job['status'] = 'timeout'
-        job['logs'] = 'Task execution timed out'
+        for inp in job.get('inputs') or []:
+            await asyncio.to_thread(artifact_store.materialize, inp['digest'], _root_path(inp['path']))
+        if job.get('status') == 'cancelled':
+            # 放置输入制品期间已取消
+            _finish_job(job_id, logs=job['logs'] + 'Cancelled before start\n')
+            return
+        # 独立进程组, 取消/超时时整组终止
+        exit_code, _, timed_out = await run_process(
+            cmd, env=env, cwd=EZ_ROOT, timeout=3600, grace=KILL_GRACE,
+            on_start=on_start, on_output=on_output
+        )
+        if timed_out:
+            outcome = {'status': 'timeout', 'logs': job['logs'] + 'Task execution timed out\n'}
+        else:
+            outcome = {'logs': job['logs'], 'exit_code': exit_code,
+                       'status': 'success' if exit_code == 0 else 'failed'}
+            if exit_code == 0 and job.get('artifacts'):
+                outcome['outputs'] = await asyncio.to_thread(_capture_artifacts, {'artifacts': job['artifacts']})
     except Exception as e:
-        job['status'] = 'error'
-        job['logs'] = str(e)
-
-    job['finished_at'] = datetime.now().isoformat()
-    socketio.emit('job_update', job)
+        outcome = {'status': 'error', 'logs': job['logs'] + f'{e}\n'}
+    finally:
+        procs.unregister(job_id)
 
-    # 持久化
-    with db_lock:
-        with get_db() as conn:
-            conn.execute('''
-                INSERT OR REPLACE INTO jobs (id, task, node_id, vars, status, exit_code, logs, started_at, finished_at)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (job_id, job['task'], job.get('node_id'), json.dumps(job.get('vars', {})),
-                  job['status'], job.get('exit_code'), job.get('logs'),
-                  job.get('started_at'), job.get('finished_at')))
-            conn.commit()
+    _finish_job(job_id, **outcome)
 
 
 def _execute_job_ssh(job_id):
@@ -751,15 +1514,22 @@ def _execute_job_ssh(job_id):
 
     node = nodes.get(job.get('node_id'))
     if not node:
-        job['status'] = 'error'
-        job['logs'] = 'SSH node not found'
-        job['finished_at'] = datetime.now().isoformat()
-        socketio.emit('job_update', job)
+        jobs.update(job_id, status='error', logs='SSH node not found',
+                    finished_at=datetime.now().isoformat())
+        emit_bridge('job_update', job)
         return
 
-    job['status'] = 'running'
-    job['started_at'] = datetime.now().isoformat()
-    socketio.emit('job_update', job)
+    # 线程启动前已取消的不再连接 (派发时已置为 running, 取消后为 cancelled)
+    if job.get('status') == 'cancelled':
+        return
+    jobs.update(job_id, started_at=datetime.now().isoformat())
+    emit_bridge('job_update', job)
+
+    def on_start(client, channel):
+        procs.register_ssh(job_id, client, channel)
+        # 连接 / 上传输入期间到达的取消找不到通道, 在此补上
+        if job.get('status') == 'cancelled':
+            procs.cancel(job_id)
 
     # 构造远程命令
     task_bin = 'task'  # 假设远程机器上有 task 命令
@@ -767,33 +1537,35 @@ def _execute_job_ssh(job_id):
     for k, v in job.get('vars', {}).items():
         task_cmd = f'{k}={v} {task_cmd}'
 
+    # 制品经 SFTP 分块传输; 收回的文件先落到 transfer/<job_id>/ (可续传) 再入库
+    staging = os.path.join(SERVER_DATA_DIR, 'transfer', job_id)
+    uploads = [(artifact_store.path(i['digest']), i['path']) for i in job.get('inputs') or []]
+    downloads = [(a['path'], os.path.join(staging, a['name'])) for a in job.get('artifacts') or []]
+
     exit_code, logs = execute_via_ssh(
         host=node['host'], port=node.get('port', 22),
         user=node['ssh_user'], auth_type=node.get('auth_type', 'password'),
         task_cmd=task_cmd,
-        password=node.get('ssh_password'), key_path=node.get('ssh_key_path')
+        password=node.get('ssh_password'), key_path=node.get('ssh_key_path'),
+        on_start=on_start, cancelled=lambda: job.get('status') == 'cancelled',
+        uploads=uploads, downloads=downloads
     )
+    procs.unregister(job_id)
+
+    outputs = {}
+    for art in job.get('artifacts') or []:
+        local_path = os.path.join(staging, art['name'])
+        if os.path.isfile(local_path):
+            outputs[art['name']], _ = artifact_store.put(local_path)
+    shutil.rmtree(staging, ignore_errors=True)
 
-    job['logs'] = logs
-    job['exit_code'] = exit_code
-    job['status'] = 'success' if exit_code == 0 else 'failed'
-    job['finished_at'] = datetime.now().isoformat()
-    socketio.emit('job_update', job)
+    _finish_job(job_id, logs=logs, exit_code=exit_code, outputs=outputs,
+                status='success' if exit_code == 0 else 'failed')
 
     # 更新节点状态
     if job.get('node_id') and job['node_id'] in nodes:
         nodes[job['node_id']]['current_job'] = None
-
-    # 持久化
-    with db_lock:
-        with get_db() as conn:
-            conn.execute('''
-                INSERT OR REPLACE INTO jobs (id, task, node_id, vars, status, exit_code, logs, started_at, finished_at)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (job_id, job['task'], job.get('node_id'), json.dumps(job.get('vars', {})),
-                  job['status'], job.get('exit_code'), job.get('logs'),
-                  job.get('started_at'), job.get('finished_at')))
-            conn.commit()
+    _dispatch_pending()
 
 
 # =============================================================================
@@ -803,10 +1575,8 @@ def _execute_job_ssh(job_id):
 @app.route('/api/v1/jobs', methods=['GET'])
 def api_list_jobs():
     """列出执行记录"""
-    job_list = list(jobs.values())
     # 按创建时间倒序
-    job_list.sort(key=lambda x: x.get('created_at', ''), reverse=True)
-    return jsonify({'jobs': job_list[:50]})
+    return jsonify({'jobs': list(islice(jobs.recent(), 50))})
 
 
 @app.route('/api/v1/jobs/<job_id>', methods=['GET'])
@@ -820,9 +1590,25 @@ def api_get_job(job_id):
             row = conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
     if row:
         return jsonify(dict(row))
+    # 已按保留策略归档
+    archived = archive.query('jobs', id=job_id, limit=1, logs=True)
+    if archived:
+        return jsonify(dict(archived[0], archived=True))
     return jsonify({'error': 'Job not found'}), 404
 
 
+@app.route('/api/v1/jobs/<job_id>/events', methods=['GET'])
+def api_job_events(job_id):
+    """获取 Job 状态迁移记录"""
+    with db_lock:
+        with get_db() as conn:
+            rows = conn.execute(
+                'SELECT prev_status, status, node_id, created_at FROM job_events WHERE job_id = ? ORDER BY id ASC',
+                (job_id,)
+            ).fetchall()
+    return jsonify({'events': [dict(r) for r in rows]})
+
+
 @app.route('/api/v1/jobs/<job_id>/logs', methods=['GET'])
 def api_get_job_logs(job_id):
     """获取执行日志 (SSE)"""
@@ -831,18 +1617,22 @@ def api_get_job_logs(job_id):
 
     def generate():
         last_len = 0
-        while True:
-            job = jobs.get(job_id)
-            if not job:
-                break
-            logs = job.get('logs', '')
-            if len(logs) > last_len:
-                yield f"data: {json.dumps({'logs': logs[last_len:]})}\n\n"
-                last_len = len(logs)
-            if job.get('status') in ('success', 'failed', 'error', 'timeout'):
-                yield f"data: {json.dumps({'status': job['status'], 'done': True})}\n\n"
-                break
-            time.sleep(0.5)
+        M_SSE_STREAMS.inc()
+        try:
+            while True:
+                job = jobs.get(job_id)
+                if not job:
+                    break
+                logs = job.get('logs', '')
+                if len(logs) > last_len:
+                    yield f"data: {json.dumps({'logs': logs[last_len:]})}\n\n"
+                    last_len = len(logs)
+                if job.get('status') in JOB_FINISHED:
+                    yield f"data: {json.dumps({'status': job['status'], 'done': True})}\n\n"
+                    break
+                socketio.sleep(0.5)
+        finally:
+            M_SSE_STREAMS.dec()
 
     return Response(generate(), mimetype='text/event-stream')
 
@@ -853,48 +1643,213 @@ def api_cancel_job(job_id):
     if job_id not in jobs:
         return jsonify({'error': 'Job not found'}), 404
 
-    job = jobs[job_id]
-    if job['status'] in ('pending', 'running'):
-        job['status'] = 'cancelled'
-        socketio.emit('job_update', job)
+    if _cancel_job(job_id):
+        _dispatch_pending()
 
     return jsonify({'status': 'cancelled'})
 
 
+def _cancel_job(job_id):
+    """取消未结束的 Job, 返回是否取消"""
+    job = jobs[job_id]
+    if job['status'] not in ('pending', 'assigned', 'running'):
+        return False
+    # 先置为 cancelled 立即释放槽位, 再终止进程 (本地进程组 / SSH 通道 / 通知 Agent)
+    jobs.update(job_id, status='cancelled', lease_expires=None,
+                finished_at=datetime.now().isoformat())
+    procs.cancel(job_id)
+    emit_bridge('job_update', job)
+    return True
+
+
+@app.route('/api/v1/jobs/<job_id>/ack', methods=['POST'])
+def api_ack_job(job_id):
+    """Agent 确认接收任务 (HTTP, Pull 模式)"""
+    if not verify_token():
+        return jsonify({'error': 'Unauthorized'}), 401
+    data = request.get_json(silent=True) or {}
+    if not _ack_job(job_id, data.get('node_id')):
+        return jsonify({'error': 'Lease not held by this node'}), 409
+    return jsonify({'status': 'ok', 'lease_ttl': JOB_LEASE_TTL})
+
+
 @app.route('/api/v1/jobs/<job_id>/result', methods=['POST'])
 def api_report_job_result(job_id):
     """Client 上报执行结果"""
     if job_id not in jobs:
         return jsonify({'error': 'Job not found'}), 404
 
-    data = request.json
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'error': 'JSON object required'}), 400
+    error = _log_report_error(data)
+    if error:
+        return jsonify({'error': error}), 400
+    # 租约已转给其他节点时, 旧节点的迟到结果不覆盖
+    if data.get('node_id') and data['node_id'] != jobs[job_id].get('node_id'):
+        return jsonify({'error': 'Lease not held by this node'}), 409
+    # 新版 Agent 只上报最后的日志序号与 digest, 日志缺尾时要求 Agent 只重发缺失部分
+    if 'log_seq' in data:
+        resend_from = _reconcile_job_log(jobs[job_id], data)
+        if resend_from:
+            return jsonify({'error': 'Log incomplete', 'log_from_seq': resend_from}), 409
+        logs = jobs[job_id]['logs']
+    else:
+        logs = data.get('logs', '')
+    procs.unregister(job_id)
+    # Agent 已通过分块上传把制品送入制品库, 这里只登记 digest
+    outputs = {name: digest for name, digest in (data.get('outputs') or {}).items()
+               if _valid_digest(digest) and artifact_store.has(digest)}
+    _finish_job(job_id, status=data.get('status', 'unknown'), outputs=outputs,
+                exit_code=data.get('exit_code'), logs=logs)
     job = jobs[job_id]
-    job['status'] = data.get('status', 'unknown')
-    job['exit_code'] = data.get('exit_code')
-    job['logs'] = data.get('logs', '')
-    job['finished_at'] = datetime.now().isoformat()
 
     # 更新节点状态
     node_id = job.get('node_id')
     if node_id and node_id in nodes:
         nodes[node_id]['current_job'] = None
 
-    socketio.emit('job_update', job)
-
-    # 持久化到数据库
-    with db_lock:
-        with get_db() as conn:
-            conn.execute('''
-                INSERT OR REPLACE INTO jobs (id, task, node_id, vars, status, exit_code, logs, started_at, finished_at)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (job_id, job['task'], job.get('node_id'), json.dumps(job.get('vars', {})),
-                  job['status'], job.get('exit_code'), job.get('logs'),
-                  job.get('started_at'), job.get('finished_at')))
-            conn.commit()
+    _dispatch_pending()
 
+    # Agent 收到 200 后即删除本地暂存的结果, 返回前确认结果已提交
+    _wait_write(db_writer.barrier())
     return jsonify({'status': 'ok'})
 
 
+# =============================================================================
+# API Routes - Artifacts (分块、可续传传输)
+# =============================================================================
+
+_DIGEST_RE = re.compile(r'^[0-9a-f]{64}$')
+
+
+def _valid_digest(digest):
+    return isinstance(digest, str) and bool(_DIGEST_RE.match(digest))
+
+
+def _relative_path_error(path):
+    """制品路径 (输入目标 / 产出路径) 须为 EZ_ROOT 下的相对路径, 不合法时返回错误信息"""
+    if not isinstance(path, str) or not path.strip():
+        return 'path required'
+    if os.path.isabs(path) or path.startswith('~'):
+        return f'Absolute path not allowed: {path}'
+    if '..' in re.split(r'[\\/]', path):
+        return f"'..' not allowed in path: {path}"
+    return None
+
+
+def _root_path(path):
+    """EZ_ROOT 下的相对路径 -> 绝对路径; 解析符号链接后超出 EZ_ROOT 时抛出 ValueError"""
+    err = _relative_path_error(path)
+    if err:
+        raise ValueError(err)
+    full = os.path.normpath(os.path.join(EZ_ROOT, path))
+    root = os.path.realpath(EZ_ROOT)
+    if os.path.commonpath([root, os.path.realpath(full)]) != root:
+        raise ValueError(f'Path escapes EZ_ROOT: {path}')
+    return full
+
+
+def _plan_paths_error(steps):
+    """检查 plan 各步骤 artifacts.path 与 inputs.to, 不合法时返回错误信息"""
+    for step in steps or []:
+        if not isinstance(step, dict):
+            continue
+        for art in step.get('artifacts') or []:
+            if isinstance(art, dict) and art.get('path') is not None:
+                err = _relative_path_error(art['path'])
+                if err:
+                    return f"{err} (step {step.get('name', '')})"
+        for inp in step.get('inputs') or []:
+            if isinstance(inp, dict) and inp.get('to') is not None:
+                err = _relative_path_error(inp['to'])
+                if err:
+                    return f"{err} (step {step.get('name', '')})"
+    return None
+
+
+def _valid_manifest(m):
+    """校验上传清单 (块数与大小一致, 块大小 64KiB ~ 64MiB)"""
+    try:
+        size, chunk_size, chunks = int(m['size']), int(m['chunk_size']), m['chunks']
+    except (KeyError, TypeError, ValueError):
+        return False
+    if not _valid_digest(m.get('digest')) or size < 0 or not 64 * 1024 <= chunk_size <= 64 * 1024 * 1024:
+        return False
+    return len(chunks) == -(-size // chunk_size) and all(_valid_digest(c) for c in chunks)
+
+
+@app.route('/api/v1/artifacts/<digest>', methods=['GET'])
+def api_download_artifact(digest):
+    """下载制品 (支持 Range, 从磁盘流式发送)"""
+    if not verify_token():
+        return jsonify({'error': 'Unauthorized'}), 401
+    if not _valid_digest(digest) or not artifact_store.has(digest):
+        return jsonify({'error': 'Artifact not found'}), 404
+    return send_file(artifact_store.path(digest), mimetype='application/octet-stream',
+                     conditional=True, etag=digest, max_age=31536000)
+
+
+@app.route('/api/v1/artifacts/<digest>/manifest', methods=['GET'])
+def api_artifact_manifest(digest):
+    """制品分块清单 {size, chunk_size, digest, chunks}"""
+    if not verify_token():
+        return jsonify({'error': 'Unauthorized'}), 401
+    if not _valid_digest(digest) or not artifact_store.has(digest):
+        return jsonify({'error': 'Artifact not found'}), 404
+    chunk_size = request.args.get('chunk_size', transfer.CHUNK_SIZE, type=int)
+    if not 64 * 1024 <= chunk_size <= 64 * 1024 * 1024:
+        return jsonify({'error': 'Invalid chunk_size'}), 400
+    return jsonify(artifact_store.manifest(digest, chunk_size))
+
+
+@app.route('/api/v1/artifacts/uploads', methods=['POST'])
+def api_begin_artifact_upload():
+    """开始 (或续传) 分块上传, 返回缺失的块序号"""
+    if not verify_token():
+        return jsonify({'error': 'Unauthorized'}), 401
+    manifest = request.get_json(silent=True) or {}
+    if not _valid_manifest(manifest):
+        return jsonify({'error': 'Invalid manifest'}), 400
+    manifest = {'size': int(manifest['size']), 'chunk_size': int(manifest['chunk_size']),
+                'digest': manifest['digest'], 'chunks': list(manifest['chunks'])}
+    missing = artifact_store.begin_upload(manifest)
+    return jsonify({'digest': manifest['digest'], 'exists': artifact_store.has(manifest['digest']),
+                    'missing': missing})
+
+
+@app.route('/api/v1/artifacts/uploads/<digest>/chunks/<int:index>', methods=['PUT'])
+def api_upload_artifact_chunk(digest, index):
+    """上传一块 (请求体为原始字节, 校验 sha256)"""
+    if not verify_token():
+        return jsonify({'error': 'Unauthorized'}), 401
+    if not _valid_digest(digest):
+        return jsonify({'error': 'Invalid digest'}), 400
+    try:
+        artifact_store.write_upload_chunk(digest, index, request.stream)
+    except KeyError:
+        return jsonify({'error': 'Upload not found'}), 404
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'ok': True})
+
+
+@app.route('/api/v1/artifacts/uploads/<digest>/commit', methods=['POST'])
+def api_commit_artifact_upload(digest):
+    """全部块到齐后校验并入库"""
+    if not verify_token():
+        return jsonify({'error': 'Unauthorized'}), 401
+    if not _valid_digest(digest):
+        return jsonify({'error': 'Invalid digest'}), 400
+    try:
+        size = artifact_store.commit_upload(digest)
+    except KeyError:
+        return jsonify({'error': 'Upload not found'}), 404
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 409
+    return jsonify({'digest': digest, 'size': size})
+
+
 # =============================================================================
 # API Routes - Executions (统一视图)
 # =============================================================================
@@ -911,14 +1866,17 @@ def api_list_executions():
 
     # Jobs (task runs)
     if exec_type in ('all', 'task'):
-        # 从内存
-        for jid, job in jobs.items():
-            if status_filter and job.get('status') != status_filter:
-                continue
+        # 从内存 (有状态过滤时走 status 索引)
+        candidates = reversed(jobs.by_status(status_filter)) if status_filter else jobs.recent()
+        matched = 0
+        for job in candidates:
             if search and search not in (job.get('task') or '').lower():
                 continue
+            matched += 1
+            if matched > limit:
+                break
             results.append({
-                'id': jid, 'type': 'task',
+                'id': job['id'], 'type': 'task',
                 'name': job.get('task', ''),
                 'status': job.get('status', 'unknown'),
                 'started_at': job.get('started_at'),
@@ -927,7 +1885,6 @@ def api_list_executions():
                 'node_id': job.get('node_id'),
             })
         # 从 DB (补充已不在内存中的)
-        seen_ids = {r['id'] for r in results}
         with db_lock:
             with get_db() as conn:
                 rows = conn.execute(
@@ -935,7 +1892,7 @@ def api_list_executions():
                     (limit * 2,)
                 ).fetchall()
                 for r in rows:
-                    if r['id'] not in seen_ids:
+                    if r['id'] not in jobs:
                         if status_filter and r['status'] != status_filter:
                             continue
                         if search and search not in (r['task'] or '').lower():
@@ -1011,13 +1968,12 @@ def api_dashboard():
 
     # 活跃运行
     active_runs = []
-    for jid, job in jobs.items():
-        if job.get('status') in ('running', 'pending'):
-            active_runs.append({
-                'id': jid, 'type': 'task',
-                'name': job.get('task'), 'status': job.get('status'),
-                'started_at': job.get('started_at')
-            })
+    for job in jobs.by_status('running', 'assigned', 'pending'):
+        active_runs.append({
+            'id': job['id'], 'type': 'task',
+            'name': job.get('task'), 'status': job.get('status'),
+            'started_at': job.get('started_at')
+        })
 
     with db_lock:
         with get_db() as conn:
@@ -1047,10 +2003,12 @@ def api_dashboard():
                     'finished_at': r['finished_at']
                 })
             # from memory
-            for jid, job in jobs.items():
+            failed_ids = {f['id'] for f in failed_24h}
+            for job in jobs.by_status('failed', 'error'):
+                jid = job['id']
                 fin = (job.get('finished_at') or '').replace('T', ' ')
-                if job.get('status') in ('failed', 'error') and fin >= cutoff_24h_db:
-                    if not any(f['id'] == jid for f in failed_24h):
+                if fin >= cutoff_24h_db:
+                    if jid not in failed_ids:
                         failed_24h.append({
                             'id': jid, 'type': 'task',
                             'name': job.get('task'), 'status': job.get('status'),
@@ -1070,10 +2028,11 @@ def api_dashboard():
 
             # 24h stats — 去重: 先收集内存, 再补充 DB 中不在内存的
             all_jobs_24h = {}
-            for jid, job in jobs.items():
+            for job in jobs.recent():
                 ca = (job.get('created_at') or '').replace('T', ' ')
-                if ca >= cutoff_24h_db:
-                    all_jobs_24h[jid] = job.get('status')
+                if ca < cutoff_24h_db:
+                    break
+                all_jobs_24h[job['id']] = job.get('status')
             rows = conn.execute(
                 "SELECT id, status FROM jobs WHERE REPLACE(created_at, 'T', ' ') >= ?", (cutoff_24h_db,)
             ).fetchall()
@@ -1251,28 +2210,90 @@ def api_stats():
     })
 
 
+STATS_BATCH_MAX = 5000  # 单次批量上报的最大记录数
+
+_INSERT_EXECUTION = '''INSERT INTO executions (task, exit_code, duration, host, workspace, params, timestamp)
+                       VALUES (?, ?, ?, ?, ?, ?, ?)'''
+
+
+_EXECUTION_FIELDS = {'task': str, 'exit_code': (int, float), 'duration': (int, float), 'host': str,
+                     'workspace': str, 'params': str, 'timestamp': str}
+
+
+def _execution_values(data):
+    """校验一条执行统计并转换为 executions 行, 不合法时抛出 ValueError
+
+    字段只接受字符串 / 数值 (可省略或为 null), 列表、对象等无法写入 SQLite 的值在此拒绝。
+    """
+    if not isinstance(data, dict):
+        raise ValueError('record must be an object')
+    if not data.get('task'):
+        raise ValueError('task required')
+    for field, types in _EXECUTION_FIELDS.items():
+        value = data.get(field)
+        if value is not None and (isinstance(value, bool) or not isinstance(value, types)):
+            kind = 'a string' if types is str else 'a number'
+            raise ValueError(f'{field} must be {kind}')
+    return (data['task'], data.get('exit_code', 0), data.get('duration', 0),
+            data.get('host', ''), data.get('workspace', ''),
+            data.get('params', ''), data.get('timestamp', datetime.now().isoformat()))
+
+
 @app.route('/api/v1/stats/report', methods=['POST'])
 def api_stats_report():
     """接收 CLI 上报的执行统计"""
-    data = request.json or {}
-    task = data.get('task', '')
-    if not task:
-        return jsonify({'error': 'task required'}), 400
+    try:
+        values = _execution_values(request.json or {})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
-    with db_lock:
-        with get_db() as conn:
-            conn.execute(
-                '''INSERT INTO executions (task, exit_code, duration, host, workspace, params, timestamp)
-                   VALUES (?, ?, ?, ?, ?, ?, ?)''',
-                (task, data.get('exit_code', 0), data.get('duration', 0),
-                 data.get('host', ''), data.get('workspace', ''),
-                 data.get('params', ''), data.get('timestamp', datetime.now().isoformat()))
-            )
-            conn.commit()
+    # CLI 收到 200 后即从本地缓冲删除该记录, 返回前确认已提交
+    _wait_write(db_writer.execute(_INSERT_EXECUTION, values))
 
     return jsonify({'status': 'ok'})
 
 
+@app.route('/api/v1/stats/report/batch', methods=['POST'])
+def api_stats_report_batch():
+    """批量接收执行统计: JSON 数组或 NDJSON (每行一条), 一个事务写入, 返回逐条结果
+
+    不合法的记录 (含 NDJSON 中无法解析的行) 单独报错, 不影响其余记录。
+    """
+    body = request.get_data(as_text=True)
+    if body.lstrip().startswith('['):
+        try:
+            records = json.loads(body)
+        except ValueError as e:
+            return jsonify({'error': f'Invalid JSON: {e}'}), 400
+    else:
+        records = []
+        for line in body.splitlines():
+            if not line.strip():
+                continue
+            try:
+                records.append(json.loads(line))
+            except ValueError as e:
+                records.append(ValueError(f'Invalid JSON: {e}'))
+    if len(records) > STATS_BATCH_MAX:
+        return jsonify({'error': f'Too many records (max {STATS_BATCH_MAX})'}), 413
+
+    rows, results = [], []
+    for index, record in enumerate(records):
+        try:
+            if isinstance(record, ValueError):
+                raise record
+            rows.append((index, _execution_values(record)))
+        except ValueError as e:
+            results.append({'index': index, 'error': str(e)})
+    if rows:
+        # 同上, 逐条结果中的 id 也要提交后才有
+        ids = _wait_write(db_writer.call(lambda conn: [conn.execute(_INSERT_EXECUTION, values).lastrowid
+                                                       for _, values in rows]))
+        results.extend({'index': index, 'id': id} for (index, _), id in zip(rows, ids))
+    results.sort(key=lambda r: r['index'])
+    return jsonify({'accepted': len(rows), 'rejected': len(records) - len(rows), 'results': results})
+
+
 @app.route('/api/v1/stats/executions', methods=['GET'])
 def api_cli_executions():
     """获取 CLI 上报的执行历史"""
@@ -1295,7 +2316,9 @@ def api_task_tree():
     try:
         with _tree_cache_lock:
             if _is_cache_valid():
+                M_TREE_CACHE.inc(result='hit')
                 return jsonify({'tree': _tree_cache['result']})
+        M_TREE_CACHE.inc(result='miss')
 
         tasks_flat = []
 
@@ -1634,6 +2657,9 @@ def _api_create_plan():
         return jsonify({'error': 'name required'}), 400
     if not re.match(r'^[a-zA-Z0-9_-]+$', name):
         return jsonify({'error': 'name 只允许字母、数字、下划线和连字符'}), 400
+    err = _plan_paths_error(steps)
+    if err:
+        return jsonify({'error': err}), 400
 
     plans_dir = os.path.join(EZ_ROOT, 'plans')
     os.makedirs(plans_dir, exist_ok=True)
@@ -1713,56 +2739,183 @@ def _api_delete_plan(plan_name):
 def api_run_plan(plan_name):
     """执行计划 — 逐步骤执行"""
     data = request.json or {}
-    task_vars = data.get('vars', {})
-    trigger_type = data.get('trigger_type', 'manual')
+    try:
+        steps, use_cache, concurrency = _load_plan_run_options(plan_name, data)
+    except LookupError as e:
+        return jsonify({'error': str(e)}), 404
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    run_id = _start_plan_run(plan_name, steps, data.get('vars', {}), data.get('trigger_type', 'manual'),
+                             use_cache, concurrency)
+    return jsonify({'run_id': run_id, 'status': 'running'})
 
-    # 加载 plan
+
+def _load_plan_run_options(plan_name, data):
+    """加载 plan 并解析本次运行的选项 -> (steps, use_cache, concurrency)
+
+    plan 或步骤 node 指定的节点不存在时抛出 LookupError, 其他错误抛出 ValueError
+    """
     plan_file = os.path.join(EZ_ROOT, 'plans', f'{plan_name}.yml')
     if not os.path.isfile(plan_file):
         plan_file = os.path.join(EZ_ROOT, 'plans', f'{plan_name}.yaml')
     if not os.path.isfile(plan_file):
-        return jsonify({'error': f'Plan not found: {plan_name}'}), 404
+        raise LookupError(f'Plan not found: {plan_name}')
 
     plan_data = _load_yaml_file(plan_file)
     steps = plan_data.get('steps', [])
     if not steps:
-        return jsonify({'error': 'Plan has no steps'}), 400
+        raise ValueError('Plan has no steps')
+    for step in steps:
+        if step.get('node') and step['node'] not in nodes:
+            raise LookupError(f"Node {step['node']} not found (step {step.get('name', '')})")
+    # 直接编辑的 plan 文件未经创建接口校验, 运行前再检查一次制品路径
+    err = _plan_paths_error(steps)
+    if err:
+        raise ValueError(err)
+    # 步骤结果缓存: 请求参数优先, 其次 plan 的 cache 字段; 步骤可用 cache 单独覆盖
+    use_cache = bool(data.get('cache', plan_data.get('cache', False)))
+    # 并行步骤数: 请求参数优先, 其次 plan 的 concurrency 字段
+    try:
+        concurrency = max(0, int(data.get('concurrency', plan_data.get('concurrency', PLAN_CONCURRENCY)) or 0))
+    except (TypeError, ValueError):
+        raise ValueError('Invalid concurrency')
+    return steps, use_cache, concurrency
 
-    run_id = str(uuid.uuid4())[:8]
 
-    # 记录到数据库
-    with db_lock:
-        with get_db() as conn:
-            conn.execute(
-                '''INSERT INTO plan_runs (id, plan_name, status, params, trigger_type, total_steps, started_at)
-                   VALUES (?, ?, 'running', ?, ?, ?, ?)''',
-                (run_id, plan_name, json.dumps(task_vars), trigger_type, len(steps), datetime.now().isoformat())
-            )
-            # 插入每个步骤
-            for step in steps:
+def _start_plan_run(plan_name, steps, task_vars, trigger_type, use_cache, concurrency,
+                    parent_run_id=None, reused=None):
+    """记录新的 plan run 并在执行事件循环中启动, 返回 run_id
+
+    reused: {step_name: (原步骤行, [原制品行])} 从 parent_run_id 沿用的步骤, 直接记为 reused 并复制其制品记录
+    """
+    run_id = str(uuid.uuid4())[:8]
+    reused = reused or {}
+    now = datetime.now().isoformat()
+
+    def write(conn):
+        conn.execute(
+            '''INSERT INTO plan_runs (id, plan_name, status, params, trigger_type, total_steps, completed_steps,
+                   started_at, parent_run_id)
+               VALUES (?, ?, 'running', ?, ?, ?, ?, ?, ?)''',
+            (run_id, plan_name, json.dumps(task_vars), trigger_type, len(steps), len(reused), now, parent_run_id)
+        )
+        # 插入每个步骤 (按 plan 中的顺序)
+        for step in steps:
+            name = step.get('name', '')
+            if name not in reused:
                 conn.execute(
                     '''INSERT INTO plan_run_steps (run_id, step_name, task_name, status)
                        VALUES (?, ?, ?, 'pending')''',
-                    (run_id, step.get('name', ''), step.get('task', ''))
+                    (run_id, name, step.get('task', ''))
                 )
-            conn.commit()
+                continue
+            old, artifacts = reused[name]
+            conn.execute(
+                '''INSERT INTO plan_run_steps (run_id, step_name, task_name, status, exit_code, logs,
+                       started_at, finished_at, duration, node_id, job_id)
+                   VALUES (?, ?, ?, 'reused', ?, ?, ?, ?, ?, ?, ?)''',
+                (run_id, name, old['task_name'], old['exit_code'], old['logs'], old['started_at'],
+                 old['finished_at'], old['duration'], old['node_id'], old['job_id'])
+            )
+            conn.executemany(
+                '''INSERT INTO plan_run_artifacts (run_id, step_name, name, path, digest, size)
+                   VALUES (?, ?, ?, ?, ?, ?)''',
+                [(run_id, name, a['name'], a['path'], a['digest'], a['size']) for a in artifacts]
+            )
 
-    socketio.emit('plan_update', {'run_id': run_id, 'plan_name': plan_name, 'status': 'running'})
+    # 不等待提交: 执行协程的步骤更新排在这批写入之后; 提交后再通知前端加载
+    db_writer.call(write).add_done_callback(
+        lambda _: emit_bridge('plan_update', {'run_id': run_id, 'plan_name': plan_name, 'status': 'running'}))
 
-    # 在后台线程逐步骤执行
-    Thread(target=_run_plan_steps, args=(run_id, plan_name, steps, task_vars), daemon=True).start()
-    return jsonify({'run_id': run_id, 'status': 'running'})
+    # 在执行事件循环中逐步骤执行
+    aio.submit(_run_plan_steps(run_id, plan_name, steps, task_vars, use_cache, concurrency,
+                               reused={name: {a['name']: a['digest'] for a in artifacts}
+                                       for name, (_, artifacts) in reused.items()}))
+    return run_id
+
+
+@app.route('/api/v1/plans/runs/<run_id>/resume', methods=['POST'])
+def api_resume_plan_run(run_id):
+    """从失败处重新执行: 新建关联原运行的 run, 沿用成功的步骤及其制品, 只执行失败 / 跳过的步骤及其下游
+
+    按当前 plan 定义与原运行的变量执行; 任务已变化或制品已不在制品库中的步骤也重新执行。
+    """
+    data = request.get_json(silent=True) or {}
+    with db_lock:
+        with get_db() as conn:
+            row = conn.execute('SELECT * FROM plan_runs WHERE id = ?', (run_id,)).fetchone()
+            if row:
+                old_steps = {r['step_name']: dict(r) for r in conn.execute(
+                    'SELECT * FROM plan_run_steps WHERE run_id = ?', (run_id,))}
+                old_artifacts = {}
+                for r in conn.execute('SELECT * FROM plan_run_artifacts WHERE run_id = ? ORDER BY id', (run_id,)):
+                    old_artifacts.setdefault(r['step_name'], []).append(dict(r))
+    if not row:
+        return jsonify({'error': 'not found'}), 404
+    # 只看本进程中的运行; Server 重启前中断的运行在启动时已标记为失败 (_fail_orphaned_plan_runs)
+    if run_id in live_plans:
+        return jsonify({'error': 'Run is still running'}), 409
+    try:
+        steps, use_cache, concurrency = _load_plan_run_options(row['plan_name'], data)
+    except LookupError as e:
+        return jsonify({'error': str(e)}), 404
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # 上游全部沿用、自身成功、任务未变且制品仍在时沿用
+    step_map = {s.get('name', ''): s for s in steps}
+    decided = {}
+
+    def reusable(name, visiting=()):
+        if name not in decided:
+            old, step = old_steps.get(name), step_map.get(name)
+            decided[name] = bool(
+                old and step and name not in visiting
+                and old['status'] in ('success', 'cached', 'reused')
+                and old['task_name'] == step.get('task', '')
+                and all(artifact_store.has(a['digest']) for a in old_artifacts.get(name, []))
+                and all(reusable(dep, visiting + (name,)) for dep in step.get('needs') or [])
+            )
+        return decided[name]
+
+    reused = {name: (old_steps[name], old_artifacts.get(name, [])) for name in step_map if reusable(name)}
+    rerun = [name for name in step_map if name not in reused]
+    if not rerun:
+        return jsonify({'error': 'Nothing to resume: all steps succeeded'}), 409
 
+    new_run_id = _start_plan_run(row['plan_name'], steps, json.loads(row['params'] or '{}'), 'resume',
+                                 use_cache, concurrency, parent_run_id=run_id, reused=reused)
+    return jsonify({'run_id': new_run_id, 'status': 'running', 'parent_run_id': run_id,
+                    'reused': list(reused), 'steps': rerun})
 
-def _run_plan_steps(run_id, plan_name, steps, global_vars):
-    """逐步骤执行 plan (拓扑排序)"""
+
+async def _run_plan_steps(run_id, plan_name, steps, global_vars, use_cache=False, concurrency=0, reused=None):
+    """按依赖 (DAG) 执行 plan, 依赖已满足的步骤并行执行 (最多 concurrency 个, 0 不限)
+
+    reused: {step_name: {artifact: digest}} 从上一次运行沿用的步骤, 视为已完成, 其制品供下游使用。
+
+    concurrency 为 1 时按 plan 中的顺序逐个执行; 可并行时就绪步骤按关键路径 (历史耗时估计的剩余最长路径,
+    见 plan_schedule.py) 从长到短启动。本地步骤的进程登记在 procs 中, /plans/runs/<id>/cancel 可终止。
+    运行在 asyncio 事件循环中。带 node / tags 的步骤作为 Job 派发到对应节点 (与 /tasks/run 相同的执行器),
+    其余步骤为本地 asyncio 子进程。DB 写入排入写队列 (写队列按序提交, 只需等待每组写入的最后一个 Future),
+    缓存与制品读写放到线程池。
+    """
     task_bin = _get_task_bin()
     step_map = {s.get('name', ''): s for s in steps}
+    artifact_digests = {}  # step_name -> {artifact: digest}
 
-    # 拓扑排序
-    completed = set()
+    completed = set(reused or {})
     failed_steps = set()
     start_time = datetime.now()
+    completed_count = len(completed)
+    for step_name, digests in (reused or {}).items():
+        artifact_digests[step_name] = dict(digests)
+
+    estimates = await asyncio.to_thread(_step_estimates, plan_name, steps)
+    ranks = critical_ranks(steps, estimates)
+    plan_state = live_plans[run_id] = {'steps': steps, 'estimates': estimates, 'ranks': ranks,
+                                       'concurrency': concurrency, 'cancelled': False}
 
     def can_run(step):
         needs = step.get('needs') or []
@@ -1773,133 +2926,387 @@ def _run_plan_steps(run_id, plan_name, steps, global_vars):
                 return 'wait'
         return 'ready'
 
-    remaining = [s.get('name', '') for s in steps]
-    completed_count = 0
-
-    while remaining:
-        progressed = False
-        for step_name in list(remaining):
-            step = step_map.get(step_name)
-            if not step:
-                remaining.remove(step_name)
-                continue
-
-            status = can_run(step)
-            if status == 'skip':
-                # 依赖失败, 跳过
-                remaining.remove(step_name)
-                _update_step(run_id, step_name, 'skipped')
-                socketio.emit('plan_step_update', {
-                    'run_id': run_id, 'step_name': step_name, 'status': 'skipped'
-                })
-                progressed = True
-            elif status == 'ready':
-                remaining.remove(step_name)
-                progressed = True
-
-                # 执行该步骤
-                _update_step(run_id, step_name, 'running', started_at=datetime.now().isoformat())
-                socketio.emit('plan_step_update', {
-                    'run_id': run_id, 'step_name': step_name, 'status': 'running'
+    async def run_step(step_name):
+        nonlocal completed_count
+        step = step_map[step_name]
+        task_name = step.get('task', '')
+        step_vars = dict(global_vars)
+        step_vars.update(step.get('vars') or {})
+        remote = bool(step.get('node') or step.get('tags'))
+
+        # 结果缓存: 命中则还原制品与日志, 直接标记为 cached
+        cache_key = None
+        if step.get('cache', use_cache):
+            cache_key = _step_cache_key(task_name, step_vars, step, artifact_digests)
+            entry = await asyncio.to_thread(step_cache.get, cache_key, task_name) if cache_key else None
+            M_STEP_CACHE.inc(result='hit' if entry else 'miss')
+            if entry:
+                if not remote:
+                    await asyncio.to_thread(step_cache.restore, entry, _step_artifact_paths(step))
+                artifact_digests[step_name] = dict(entry['artifacts'])
+                await asyncio.to_thread(_record_step_artifacts, run_id, step_name, step, entry['artifacts'])
+                now = datetime.now().isoformat()
+                _update_step(run_id, step_name, 'cached',
+                             exit_code=entry.get('exit_code', 0), logs=entry.get('logs', ''),
+                             duration=0, started_at=now, finished_at=now)
+                completed.add(step_name)
+                completed_count += 1
+                await asyncio.wrap_future(_set_plan_progress(run_id, completed_count))
+                emit_bridge('plan_step_update', {
+                    'run_id': run_id, 'step_name': step_name,
+                    'status': 'cached', 'exit_code': entry.get('exit_code', 0), 'duration': 0
                 })
+                return
 
-                task_name = step.get('task', '')
-                step_vars = dict(global_vars)
-                step_vars.update(step.get('vars') or {})
-
+        step_start = datetime.now()
+        placement = {}
+        produced = {}
+        try:
+            if remote:
+                # 以 Job 派发; 执行节点在派发 (及重新投递) 时由 Job listener 同步到步骤
+                job = _submit_job(task_name, {str(k): str(v) for k, v in step_vars.items()},
+                                  node_id=step.get('node'), selectors=parse_selectors(step.get('tags')),
+                                  inputs=[{'digest': d, 'path': p}
+                                          for d, p in _step_inputs(step, artifact_digests, step_map)],
+                                  artifacts=step.get('artifacts'), plan_step=(run_id, step_name))
+                placement = {'job_id': job['id'], 'node_id': job.get('node_id')}
+            await asyncio.wrap_future(_update_step(run_id, step_name, 'running', started_at=step_start.isoformat(),
+                                                   **{k: v for k, v in placement.items() if v}))
+            emit_bridge('plan_step_update', {'run_id': run_id, 'step_name': step_name, 'status': 'running',
+                                             **placement})
+            if remote:
+                job = await asyncio.wrap_future(_watch_job(placement['job_id']))
+                placement['node_id'] = job.get('node_id')
+                exit_code = job.get('exit_code')
+                logs = job.get('logs') or ''
+                step_status = 'success' if job.get('status') == 'success' else 'failed'
+                if exit_code is None:
+                    exit_code = 0 if step_status == 'success' else -1
+                produced = dict(job.get('outputs') or {})
+            else:
                 cmd = [task_bin, '-t', os.path.join(EZ_ROOT, 'Taskfile.yml'), task_name]
                 env = os.environ.copy()
                 for k, v in step_vars.items():
                     env[str(k)] = str(v)
+                for path in _step_artifact_paths(step).values():
+                    await asyncio.to_thread(artifact_store.detach, path)
+                await asyncio.to_thread(_materialize_inputs, step, artifact_digests, step_map)
+                proc_key = _step_proc_key(run_id, step_name)
+
+                def on_start(proc):
+                    procs.register_local(proc_key, proc)
+                    if plan_state['cancelled']:
+                        procs.cancel(proc_key)
 
-                step_start = datetime.now()
                 try:
-                    result = subprocess.run(
-                        cmd, capture_output=True, text=True, timeout=3600,
-                        env=env, cwd=EZ_ROOT
-                    )
-                    step_end = datetime.now()
-                    duration = (step_end - step_start).total_seconds()
-                    logs = result.stdout + result.stderr
-                    exit_code = result.returncode
-                    step_status = 'success' if exit_code == 0 else 'failed'
-                except subprocess.TimeoutExpired:
-                    step_end = datetime.now()
-                    duration = (step_end - step_start).total_seconds()
+                    exit_code, logs, timed_out = await run_process(cmd, env=env, cwd=EZ_ROOT, timeout=3600,
+                                                                   grace=KILL_GRACE, on_start=on_start)
+                finally:
+                    procs.unregister(proc_key)
+                if timed_out:
                     logs = 'Step timed out'
                     exit_code = -1
-                    step_status = 'failed'
-                except Exception as e:
-                    step_end = datetime.now()
-                    duration = (step_end - step_start).total_seconds()
-                    logs = str(e)
-                    exit_code = -1
-                    step_status = 'failed'
+                step_status = 'success' if exit_code == 0 else 'failed'
+                if step_status == 'success':
+                    produced = await asyncio.to_thread(_capture_artifacts, step)
+        except Exception as e:
+            logs = str(e)
+            exit_code = -1
+            step_status = 'failed'
+        if step_status == 'failed' and plan_state['cancelled']:
+            step_status = 'cancelled'
+        step_end = datetime.now()
+        duration = (step_end - step_start).total_seconds()
+
+        _update_step(run_id, step_name, step_status, exit_code=exit_code, logs=logs,
+                     duration=duration, finished_at=step_end.isoformat(),
+                     **{k: v for k, v in placement.items() if v})
+
+        if step_status == 'success':
+            completed.add(step_name)
+            artifact_digests[step_name] = produced
+            await asyncio.to_thread(_record_step_artifacts, run_id, step_name, step, produced)
+            if cache_key:
+                try:
+                    await asyncio.to_thread(step_cache.put, cache_key,
+                                            {'task': task_name, 'exit_code': exit_code,
+                                             'logs': logs, 'duration': duration}, produced)
+                except OSError as e:
+                    print(f'Step cache write failed: {e}')
+        else:
+            failed_steps.add(step_name)
 
-                _update_step(run_id, step_name, step_status,
-                             exit_code=exit_code, logs=logs, duration=duration,
-                             finished_at=step_end.isoformat())
+        completed_count += 1
+        # 步骤结果、制品与进度同批提交, 提交后再通知前端重新加载
+        await asyncio.wrap_future(_set_plan_progress(run_id, completed_count))
 
-                if step_status == 'success':
-                    completed.add(step_name)
-                else:
-                    failed_steps.add(step_name)
+        emit_bridge('plan_step_update', {
+            'run_id': run_id, 'step_name': step_name,
+            'status': step_status, 'exit_code': exit_code, 'duration': duration, **placement
+        })
 
-                completed_count += 1
-                # 更新 plan_runs completed_steps
-                with db_lock:
-                    with get_db() as conn:
-                        conn.execute(
-                            'UPDATE plan_runs SET completed_steps = ? WHERE id = ?',
-                            (completed_count, run_id)
-                        )
-                        conn.commit()
+    remaining = [s.get('name', '') for s in steps if s.get('name', '') not in completed]
+    running = {}  # asyncio.Task -> step_name
 
-                socketio.emit('plan_step_update', {
-                    'run_id': run_id, 'step_name': step_name,
-                    'status': step_status, 'exit_code': exit_code, 'duration': duration
+    while remaining or running:
+        if plan_state['cancelled'] and remaining:
+            # 已取消: 不再启动新步骤, 等待运行中的步骤被终止
+            for step_name in remaining:
+                _update_step(run_id, step_name, 'skipped')
+                emit_bridge('plan_step_update', {'run_id': run_id, 'step_name': step_name, 'status': 'skipped'})
+            remaining = []
+        ready = []
+        for step_name in list(remaining):
+            step = step_map.get(step_name)
+            if not step:
+                remaining.remove(step_name)
+                continue
+
+            status = can_run(step)
+            if status == 'skip':
+                # 依赖失败, 跳过
+                remaining.remove(step_name)
+                await asyncio.wrap_future(_update_step(run_id, step_name, 'skipped'))
+                emit_bridge('plan_step_update', {
+                    'run_id': run_id, 'step_name': step_name, 'status': 'skipped'
                 })
+            elif status == 'ready':
+                ready.append(step_name)
+
+        # 可并行时关键路径优先; 逐个执行时总耗时与顺序无关, 保持 plan 中的顺序
+        if concurrency != 1:
+            ready.sort(key=lambda name: -ranks.get(name, 0))
+        for step_name in ready:
+            if concurrency and len(running) >= concurrency:
+                break
+            remaining.remove(step_name)
+            running[asyncio.ensure_future(run_step(step_name))] = step_name
 
-        if not progressed:
+        if not running:
             # 死锁或所有剩余都在等待
             for step_name in remaining:
                 _update_step(run_id, step_name, 'skipped')
             break
 
-        time.sleep(0.1)
+        done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            step_name = running.pop(task)
+            if task.exception() is not None:
+                print(f'Plan step {run_id}/{step_name} failed: {task.exception()}')
+                failed_steps.add(step_name)
 
     # 完成 plan run
     end_time = datetime.now()
     total_duration = (end_time - start_time).total_seconds()
-    final_status = 'success' if not failed_steps else 'failed'
+    if plan_state['cancelled']:
+        final_status = 'cancelled'
+    else:
+        final_status = 'success' if not failed_steps else 'failed'
+
+    await asyncio.wrap_future(_set_plan_progress(run_id, completed_count, status=final_status,
+                                                 finished_at=end_time.isoformat(), duration=total_duration))
+    live_plans.pop(run_id, None)
+
+    emit_bridge('plan_update', {'run_id': run_id, 'plan_name': plan_name, 'status': final_status})
 
+
+STEP_HISTORY = 20  # 估计步骤耗时取最近几次成功执行
+live_plans = {}    # run_id -> {steps, estimates, ranks, concurrency, cancelled}, 运行中 plan 的排程信息 (ETA 预测、取消)
+
+
+def _step_proc_key(run_id, step_name):
+    """本地 plan 步骤进程在 procs 中的登记键"""
+    return f'plan:{run_id}/{step_name}'
+
+
+@app.route('/api/v1/plans/runs/<run_id>/cancel', methods=['POST'])
+def api_cancel_plan_run(run_id):
+    """取消运行中的 plan: 不再启动新步骤, 终止本地步骤进程并取消已派发的步骤 Job"""
+    plan_state = live_plans.get(run_id)
+    if plan_state is None:
+        return jsonify({'error': 'Run is not running'}), 409
+    plan_state['cancelled'] = True
+    for step in plan_state['steps']:
+        procs.cancel(_step_proc_key(run_id, step.get('name', '')))
+    cancelled = []
+    for job in jobs.by_status('pending', 'assigned', 'running'):
+        if (job.get('plan_step') or [None])[0] == run_id and _cancel_job(job['id']):
+            cancelled.append(job['id'])
+    if cancelled:
+        _dispatch_pending()
+    return jsonify({'status': 'cancelling', 'jobs': cancelled})
+
+
+def _step_estimates(plan_name, steps):
+    """按历史估计各步骤耗时 (秒): 同一 plan 同名步骤最近 STEP_HISTORY 次成功的中位数, 没有则取同一任务的; 都没有的不给出"""
+    names = {s.get('name', ''): s.get('task', '') for s in steps}
+    samples = {}
     with db_lock:
         with get_db() as conn:
-            conn.execute(
-                '''UPDATE plan_runs SET status=?, finished_at=?, duration=?, completed_steps=?
-                   WHERE id=?''',
-                (final_status, end_time.isoformat(), total_duration, completed_count, run_id)
-            )
-            conn.commit()
+            for r in conn.execute(
+                '''SELECT s.step_name, s.duration FROM plan_run_steps s JOIN plan_runs r ON r.id = s.run_id
+                   WHERE r.plan_name = ? AND s.status = 'success' AND s.duration IS NOT NULL
+                   ORDER BY s.id DESC LIMIT ?''', (plan_name, STEP_HISTORY * len(names))):
+                if r['step_name'] in names and len(samples.setdefault(r['step_name'], [])) < STEP_HISTORY:
+                    samples[r['step_name']].append(r['duration'])
+            by_task = {}
+            for name, task in names.items():
+                if samples.get(name) or not task:
+                    continue
+                if task not in by_task:
+                    by_task[task] = [r[0] for r in conn.execute(
+                        '''SELECT duration FROM plan_run_steps WHERE task_name = ? AND status = 'success'
+                           AND duration IS NOT NULL ORDER BY id DESC LIMIT ?''', (task, STEP_HISTORY))]
+                samples[name] = by_task[task]
+    return {name: median(values) for name, values in samples.items() if values}
+
+
+def _plan_eta(run_id, rows):
+    """运行中 plan 的预测: ({step_name: (预计开始, 预计结束)}, 估计耗时), 时间为 epoch 秒; 不在运行时为 None"""
+    live = live_plans.get(run_id)
+    if not live:
+        return None
+    states = {}
+    for r in rows:
+        started = r['started_at']
+        try:
+            started = datetime.fromisoformat(started).timestamp() if started else None
+        except ValueError:
+            started = None
+        states[r['step_name']] = (r['status'], started)
+    return simulate(live['steps'], live['estimates'], live['ranks'], states, time.time(),
+                    live['concurrency']), live['estimates']
+
+
+def _set_plan_progress(run_id, completed_count, **fields):
+    """更新 plan_runs 的已完成步骤数 (及结束时的 status / finished_at / duration), 返回写入 Future"""
+    fields['completed_steps'] = completed_count
+    columns = ', '.join(f'{k} = ?' for k in fields)
+    return db_writer.execute(f'UPDATE plan_runs SET {columns} WHERE id = ?', (*fields.values(), run_id))
+
 
-    socketio.emit('plan_update', {'run_id': run_id, 'plan_name': plan_name, 'status': final_status})
+# =============================================================================
+# Plan 制品存储 / 步骤结果缓存
+# =============================================================================
+
+ARTIFACT_LINK_MODE = os.environ.get('EZ_ARTIFACT_LINK', 'reflink')  # reflink / hardlink / copy
+artifact_store = ArtifactStore(os.path.join(SERVER_DATA_DIR, 'artifacts'), link_mode=ARTIFACT_LINK_MODE)
+step_cache = StepCache(os.path.join(SERVER_DATA_DIR, 'step-cache'), artifact_store)
+
+
+def _capture_artifacts(step):
+    """把步骤声明且已生成的制品存入制品库, 返回 {name: digest}"""
+    produced = {}
+    for name, path in _step_artifact_paths(step).items():
+        if not os.path.isfile(path):
+            continue
+        try:
+            produced[name], _ = artifact_store.put(path)
+        except OSError as e:
+            print(f'Artifact capture failed ({name}): {e}')
+    return produced
+
+
+def _record_step_artifacts(run_id, step_name, step, produced):
+    """记录本次执行产生的制品 (排入写队列)"""
+    if not produced:
+        return
+    declared = {a['name']: a.get('path') for a in step.get('artifacts') or []
+                if isinstance(a, dict) and a.get('name')}
+    rows = []
+    for name, digest in produced.items():
+        try:
+            size = os.path.getsize(artifact_store.path(digest))
+        except OSError:
+            size = None
+        rows.append((run_id, step_name, name, declared.get(name), digest, size))
+    return db_writer.executemany(
+        '''INSERT INTO plan_run_artifacts (run_id, step_name, name, path, digest, size)
+           VALUES (?, ?, ?, ?, ?, ?)''', rows
+    )
+
+
+def _step_inputs(step, artifact_digests, step_map):
+    """inputs 声明 -> [(digest, 目标路径)], 目标路径相对 EZ_ROOT (远程节点上相对其工作目录), to 缺省为上游声明的路径"""
+    resolved = []
+    for inp in step.get('inputs') or []:
+        if not isinstance(inp, dict):
+            continue
+        source, name = inp.get('from'), inp.get('artifact')
+        digest = artifact_digests.get(source, {}).get(name)
+        if digest is None:
+            raise RuntimeError(f'Input artifact not available: {source}/{name}')
+        declared = {a['name']: a.get('path') for a in (step_map.get(source) or {}).get('artifacts') or []
+                    if isinstance(a, dict) and a.get('name')}
+        dest = inp.get('to') or declared.get(name)
+        if not dest:
+            raise RuntimeError(f'Input artifact has no destination: {source}/{name}')
+        resolved.append((digest, dest))
+    return resolved
+
+
+def _materialize_inputs(step, artifact_digests, step_map):
+    """把上游制品放到本机 inputs 声明的位置"""
+    for digest, dest in _step_inputs(step, artifact_digests, step_map):
+        artifact_store.materialize(digest, _root_path(dest))
+
+
+def _task_definition_files(task_name):
+    """影响任务行为的定义文件: 目录任务为整个任务目录, 行内任务为 Taskfile.yml 及其 includes"""
+    task_dir = os.path.join(EZ_ROOT, 'tasks', task_name)
+    if os.path.isdir(task_dir):
+        files = []
+        for root, dirs, filenames in os.walk(task_dir):
+            dirs[:] = [d for d in dirs if not d.startswith('.') and d != 'workspace']
+            files.extend(os.path.join(root, f) for f in filenames if not f.startswith('.'))
+        return files
+    return [f for f in _get_file_mtimes() if not f.startswith(os.path.join(EZ_ROOT, 'tasks') + os.sep)]
+
+
+def _step_artifact_paths(step):
+    """步骤声明的制品: {name: 绝对路径}; 路径超出 EZ_ROOT 时抛出 ValueError"""
+    paths = {}
+    for art in step.get('artifacts') or []:
+        if isinstance(art, dict) and art.get('name') and art.get('path'):
+            paths[art['name']] = _root_path(art['path'])
+    return paths
+
+
+def _step_cache_key(task_name, step_vars, step, artifact_digests):
+    """步骤缓存键; 输入制品的 digest 未知时返回 None (不缓存)
+
+    键包含任务名, 远程步骤还包含 plan 中指定的节点与标签选择器 (不同节点上的结果不互相命中)。
+    """
+    input_digests = {}
+    for inp in step.get('inputs') or []:
+        if not isinstance(inp, dict):
+            continue
+        digest = artifact_digests.get(inp.get('from'), {}).get(inp.get('artifact'))
+        if digest is None:
+            return None
+        input_digests[f"{inp.get('from')}/{inp.get('artifact')}"] = digest
+    placement = None
+    if step.get('node') or step.get('tags'):
+        placement = {'node': step.get('node'), 'tags': sorted(parse_selectors(step.get('tags')))}
+    try:
+        return step_key(task_name, _task_definition_files(task_name), step_vars, input_digests,
+                        root=EZ_ROOT, placement=placement)
+    except OSError:
+        return None
 
 
 def _update_step(run_id, step_name, status, **kwargs):
-    """更新步骤状态"""
-    with db_lock:
-        with get_db() as conn:
-            sets = ['status = ?']
-            vals = [status]
-            for k, v in kwargs.items():
-                sets.append(f'{k} = ?')
-                vals.append(v)
-            vals.extend([run_id, step_name])
-            conn.execute(
-                f'UPDATE plan_run_steps SET {", ".join(sets)} WHERE run_id = ? AND step_name = ?',
-                vals
-            )
-            conn.commit()
+    """更新步骤状态, 返回写入 Future"""
+    sets = ['status = ?']
+    vals = [status]
+    for k, v in kwargs.items():
+        sets.append(f'{k} = ?')
+        vals.append(v)
+    vals.extend([run_id, step_name])
+    return db_writer.execute(
+        f'UPDATE plan_run_steps SET {", ".join(sets)} WHERE run_id = ? AND step_name = ?',
+        vals
+    )
 
 
 @app.route('/api/v1/plans/<plan_name>/hook', methods=['POST'])
@@ -1927,35 +3334,14 @@ def api_run_single_task():
 
     task_vars = data.get('vars', {})
     node_id = data.get('node')
+    selectors = parse_selectors(data.get('tags'))
 
-    # 如果指定了节点，使用分布式执行
-    if node_id:
-        if node_id not in nodes:
-            return jsonify({'error': f'Node {node_id} not found'}), 404
-        job_id = str(uuid.uuid4())[:8]
-        job = {
-            'id': job_id, 'task': task, 'node_id': node_id,
-            'vars': task_vars, 'status': 'pending', 'logs': '',
-            'created_at': datetime.now().isoformat()
-        }
-        jobs[job_id] = job
-        if nodes.get(node_id, {}).get('connection_type') == 'ssh':
-            job['status'] = 'running'
-            Thread(target=_execute_job_ssh, args=(job_id,), daemon=True).start()
-        else:
-            socketio.emit('job_assigned', job, room=node_id)
-        return jsonify({'job_id': job_id, 'status': job['status']})
+    # 如果指定了节点，检查节点是否存在
+    if node_id and node_id not in nodes:
+        return jsonify({'error': f'Node {node_id} not found'}), 404
 
-    # 本地执行
-    job_id = str(uuid.uuid4())[:8]
-    job = {
-        'id': job_id, 'task': task, 'node_id': None,
-        'vars': task_vars, 'status': 'running', 'logs': '',
-        'created_at': datetime.now().isoformat()
-    }
-    jobs[job_id] = job
-    Thread(target=_execute_job_local, args=(job_id,), daemon=True).start()
-    return jsonify({'job_id': job_id, 'status': 'running'})
+    job = _submit_job(task, task_vars, node_id=node_id, selectors=selectors)
+    return jsonify({'job_id': job['id'], 'status': job['status'], 'node_id': job.get('node_id')})
 
 
 @app.route('/api/v1/plans/runs', methods=['GET'])
@@ -1993,9 +3379,32 @@ def api_get_plan_run(run_id):
 
     result = dict(row)
     result['steps'] = [dict(s) for s in steps]
+    # 运行中: 按历史耗时与关键路径排程预测各步骤及整体的完成时间
+    eta = _plan_eta(run_id, steps)
+    if eta:
+        predicted, estimates = eta
+        for step in result['steps']:
+            name = step['step_name']
+            step['estimate'] = round(estimates[name], 1) if name in estimates else None
+            if name in predicted:
+                step['eta'] = datetime.fromtimestamp(predicted[name][1]).isoformat(timespec='seconds')
+        if predicted:
+            result['eta'] = datetime.fromtimestamp(max(f for _, f in predicted.values())).isoformat(timespec='seconds')
     return jsonify(result)
 
 
+@app.route('/api/v1/plans/runs/<run_id>/artifacts', methods=['GET'])
+def api_plan_run_artifacts(run_id):
+    """列出某次计划执行产生的制品"""
+    with db_lock:
+        with get_db() as conn:
+            rows = conn.execute(
+                'SELECT step_name, name, path, digest, size, created_at FROM plan_run_artifacts '
+                'WHERE run_id = ? ORDER BY id ASC', (run_id,)
+            ).fetchall()
+    return jsonify({'artifacts': [dict(r) for r in rows]})
+
+
 @app.route('/api/v1/plans/runs/<run_id>/steps/<step_name>/logs', methods=['GET'])
 def api_step_logs(run_id, step_name):
     """获取单步日志"""
@@ -2051,13 +3460,10 @@ def api_save_chart():
         return jsonify({'error': 'name and formula required'}), 400
 
     chart_id = str(uuid.uuid4())[:8]
-    with db_lock:
-        with get_db() as conn:
-            conn.execute(
-                'INSERT INTO charts (id, name, type, formula, config) VALUES (?, ?, ?, ?, ?)',
-                (chart_id, name, chart_type, formula, json.dumps(data.get('config', {})))
-            )
-            conn.commit()
+    db_writer.execute(
+        'INSERT INTO charts (id, name, type, formula, config) VALUES (?, ?, ?, ?, ?)',
+        (chart_id, name, chart_type, formula, json.dumps(data.get('config', {})))
+    )
 
     return jsonify({'id': chart_id, 'status': 'saved'})
 
@@ -2065,10 +3471,7 @@ def api_save_chart():
 @app.route('/api/v1/charts/<chart_id>', methods=['DELETE'])
 def api_delete_chart(chart_id):
     """删除自定义图表"""
-    with db_lock:
-        with get_db() as conn:
-            conn.execute('DELETE FROM charts WHERE id = ?', (chart_id,))
-            conn.commit()
+    db_writer.execute('DELETE FROM charts WHERE id = ?', (chart_id,))
     return jsonify({'status': 'deleted'})
 
 
@@ -2083,6 +3486,81 @@ def api_clear_cache():
     return jsonify({'status': 'ok'})
 
 
+# =============================================================================
+# 数据保留 / 归档
+# =============================================================================
+
+archive = Archive(os.path.join(SERVER_DATA_DIR, 'archive'))
+_retention_lock = Lock()
+
+
+def _forget_archived(table, ids):
+    """归档后的已结束 Job 从内存注册表移除"""
+    M_ARCHIVED.inc(len(ids), table=table)
+    if table == 'jobs':
+        for job_id in ids:
+            job = jobs.get(job_id)
+            if job and job.get('status') not in ('pending', 'assigned', 'running'):
+                jobs.remove(job_id)
+
+
+retention = Retention(parse_policies(RETENTION), archive, db_lock, get_db, on_archived=_forget_archived)
+
+
+def _run_retention():
+    """执行一轮保留策略并增量 VACUUM; 已有一轮在执行时返回 None"""
+    if not _retention_lock.acquire(False):
+        return None
+    try:
+        counts = retention.run()
+        freed = retention.vacuum()
+        if any(counts.values()) or freed:
+            print(f'Retention: archived {counts}, freed {freed} pages')
+        return counts
+    finally:
+        _retention_lock.release()
+
+
+def _retention_loop():
+    """后台线程: 每 RETENTION_INTERVAL 秒执行一次保留策略"""
+    time.sleep(min(60, RETENTION_INTERVAL))
+    while True:
+        try:
+            _run_retention()
+        except Exception as e:
+            print(f'Retention error: {e}')
+        time.sleep(RETENTION_INTERVAL)
+
+
+@app.route('/api/v1/archive', methods=['GET'])
+def api_archive_files():
+    """归档文件列表与当前保留策略"""
+    return jsonify({'files': archive.files(), 'policies': {
+        table: {status or '*': seconds for status, seconds in policy.items()}
+        for table, policy in retention.policies.items()}})
+
+
+@app.route('/api/v1/archive/<table>', methods=['GET'])
+def api_archive_query(table):
+    """查询归档记录: ?id=&status=&task=&since=&until=&limit=&logs=1 (since / until 为 ISO 时间前缀)"""
+    if table not in RETENTION_TABLES:
+        return jsonify({'error': f'Unknown table: {table}'}), 404
+    args = request.args
+    records = archive.query(table, id=args.get('id'), status=args.get('status'), task=args.get('task'),
+                            since=args.get('since'), until=args.get('until'),
+                            limit=min(args.get('limit', 100, type=int), 1000), logs=args.get('logs') == '1')
+    return jsonify({'table': table, 'records': records})
+
+
+@app.route('/api/v1/retention/run', methods=['POST'])
+def api_run_retention():
+    """立即在后台执行一轮保留策略"""
+    if _retention_lock.locked():
+        return jsonify({'status': 'running'}), 409
+    Thread(target=_run_retention, daemon=True).start()
+    return jsonify({'status': 'started'}), 202
+
+
 # =============================================================================
 # API Routes - File Browser (目录任务)
 # =============================================================================
@@ -2231,12 +3709,20 @@ def handle_node_register(data):
         'name': data.get('name', node_id),
         'status': 'online',
         'tags': data.get('tags', []),
+        'slots': _parse_slots(data.get('slots')),
         'last_seen': datetime.now().isoformat(),
         'current_job': None,
         'sid': request.sid
     }
-    emit('registered', {'id': node_id})
-    socketio.emit('node_update', nodes[node_id])
+    _node_seen(node_id, data.get('load'))
+    join_room(node_id)
+    # 重连 / Server 重启后认领仍在运行的 Job
+    revoked = _renew_leases(node_id, data.get('running'))
+    emit('registered', {'id': node_id, 'log_seq': _log_offsets(node_id, data.get('running'))})
+    if revoked:
+        emit('job_revoked', {'job_ids': revoked})
+    emit_bridge('node_update', nodes[node_id])
+    _dispatch_pending()
 
 
 @socketio.on('node_ping')
@@ -2244,18 +3730,123 @@ def handle_node_ping(data):
     """节点心跳 (WebSocket)"""
     node_id = data.get('id')
     if node_id in nodes:
-        nodes[node_id]['last_seen'] = datetime.now().isoformat()
-        nodes[node_id]['status'] = 'online'
+        was_online = _node_seen(node_id, data.get('load'))
+        if data.get('slots'):
+            nodes[node_id]['slots'] = _parse_slots(data['slots'])
+        revoked = _renew_leases(node_id, data.get('running'))
+        if revoked:
+            emit('job_revoked', {'job_ids': revoked})
+        if not was_online:
+            _dispatch_pending()
+
+
+@socketio.on('job_ack')
+def handle_job_ack(data):
+    """Agent 确认接收任务 (WebSocket), 返回值作为 ack 回调"""
+    ok = _ack_job(data.get('job_id'), data.get('node_id'))
+    return {'ok': ok, 'lease_ttl': JOB_LEASE_TTL}
 
 
 @socketio.on('job_log')
 def handle_job_log(data):
-    """接收任务日志"""
+    """接收任务日志
+
+    带 seq 的日志按序号追加: 重复行 (重发/重放) 忽略, 出现缺口时请求 Agent 从缺失处重发。
+    """
     job_id = data.get('job_id')
     log_line = data.get('log', '')
-    if job_id in jobs:
-        jobs[job_id]['logs'] += log_line + '\n'
-        socketio.emit('job_log_update', {'job_id': job_id, 'log': log_line})
+    M_LOG_LINES.inc()
+    job = jobs.get(job_id)
+    if not job:
+        return
+    # 租约已转给其他节点, 旧节点的日志不再接收
+    if data.get('node_id') and data['node_id'] != job.get('node_id'):
+        return
+    seq = data.get('seq')
+    if seq is None:
+        job['logs'] += log_line + '\n'
+    elif not _is_seq(seq, 1):
+        return
+    else:
+        accepted = _accept_log_line(job, seq, log_line)
+        if accepted is None:
+            expected = job.get('log_seq', 0) + 1
+            if job.get('log_resend_from') != expected:
+                job['log_resend_from'] = expected
+                emit('job_log_resend', {'job_id': job_id, 'from_seq': expected})
+            return
+        if not accepted:
+            return
+    log_hub.publish(job_id, log_line)
+
+
+def _accept_log_line(job, seq, line):
+    """按序号追加一行日志: 追加返回 True, 重复返回 False, 有缺口返回 None
+
+    序号从 1 开始, 每次派发到 Agent 时重置; seq 1 之前的内容 (log_base) 为此前的 Server 记录。
+    """
+    expected = job.get('log_seq', 0) + 1
+    if seq < expected:
+        return False
+    if seq > expected:
+        return None
+    if seq == 1:
+        job['logs'] = job.get('logs', '')[:job.get('log_base', 0)]
+    job['logs'] += line + '\n'
+    job['log_seq'] = seq
+    return True
+
+
+def _is_seq(value, minimum=0):
+    """日志序号: 不小于 minimum 的整数 (不含 bool)"""
+    return isinstance(value, int) and not isinstance(value, bool) and value >= minimum
+
+
+def _log_report_error(data):
+    """校验结果上报中的日志字段 (Agent 提供的 JSON), 不合法时返回错误信息
+
+    带 log_digest / log_tail 时必须带 log_seq; 只有旧版 Agent 的 logs 字段时不检查。
+    """
+    if 'log_seq' not in data:
+        return 'log_seq required' if data.get('log_digest') or data.get('log_tail') else None
+    if not _is_seq(data['log_seq']):
+        return 'log_seq must be a non-negative integer'
+    if data.get('log_digest') is not None and not isinstance(data['log_digest'], str):
+        return 'log_digest must be a string'
+    tail = data.get('log_tail')
+    if tail:
+        if not isinstance(tail, dict):
+            return 'log_tail must be an object'
+        if not _is_seq(tail.get('from_seq', 1), 1):
+            return 'log_tail.from_seq must be a positive integer'
+        if not isinstance(tail.get('text') or '', str):
+            return 'log_tail.text must be a string'
+    return None
+
+
+def _reconcile_job_log(job, data):
+    """结果上报时核对日志: 合并附带的 log_tail, 返回仍需 Agent 重发的起始序号 (0 表示已完整)
+
+    data: {log_seq: 最后一行序号, log_digest: 本次执行全部日志的 sha256, log_tail?: {from_seq, text}},
+    已经 _log_report_error 校验。
+    """
+    tail = data.get('log_tail') or {}
+    if tail:
+        seq = tail.get('from_seq', 1)
+        for line in (tail.get('text') or '').split('\n')[:-1]:
+            if _accept_log_line(job, seq, line) is None:
+                break
+            seq += 1
+    if job.get('log_seq', 0) < data['log_seq']:
+        return job.get('log_seq', 0) + 1
+    digest = hashlib.sha256(job['logs'][job.get('log_base', 0):].encode('utf-8')).hexdigest()
+    if data.get('log_digest') and digest != data['log_digest']:
+        if tail.get('from_seq') == 1:
+            print(f"Job {job['id']} log digest mismatch after full resend")
+            return 0
+        job['log_seq'] = 0
+        return 1
+    return 0
 
 
 # =============================================================================
@@ -2280,6 +3871,7 @@ def _load_nodes_from_db():
                     'name': r['name'],
                     'status': 'online' if conn_type == 'ssh' else 'offline',
                     'tags': tags,
+                    'slots': r['slots'] if 'slots' in r.keys() and r['slots'] else NODE_DEFAULT_SLOTS,
                     'last_seen': str(r['last_seen']) if r['last_seen'] else None,
                     'current_job': None,
                     'connection_type': conn_type or 'agent',
@@ -2296,13 +3888,107 @@ def _load_nodes_from_db():
     print(f'Loaded {len(nodes)} nodes from DB')
 
 
+def _fail_orphaned_plan_runs():
+    """启动时把上次退出时仍在运行的 plan 标记为失败: 执行协程随进程退出, 不会再有人更新它们
+
+    运行中的步骤记为 failed, 未开始的记为 skipped, 之后可从失败处重跑 (/plans/runs/<id>/resume)。
+    """
+    now = datetime.now().isoformat()
+    note = '[ez-server] Server 重启, plan 运行已中断\n'
+
+    def write(conn):
+        ids = [r[0] for r in conn.execute("SELECT id FROM plan_runs WHERE status IN ('pending', 'running')")]
+        for run_id in ids:
+            conn.execute("""UPDATE plan_run_steps SET status = 'failed', finished_at = ?, logs = COALESCE(logs, '') || ?
+                            WHERE run_id = ? AND status = 'running'""", (now, note, run_id))
+            conn.execute("UPDATE plan_run_steps SET status = 'skipped' WHERE run_id = ? AND status = 'pending'",
+                         (run_id,))
+            conn.execute("UPDATE plan_runs SET status = 'failed', finished_at = ? WHERE id = ?", (now, run_id))
+        return len(ids)
+
+    count = _wait_write(db_writer.call(write))
+    if count:
+        print(f'Marked {count} interrupted plan runs as failed')
+
+
+def _load_jobs_from_db():
+    """启动时从 DB 重建未完成的 Job 队列
+
+    - pending: 原样重新排队
+    - Agent 上的 assigned/running: 给予一个租约周期等待 Agent 重连并通过注册/心跳认领, 否则由巡检重新投递
+    - 本地 / SSH 上的 running: 执行进程随 Server 退出, 重新执行
+    - plan 步骤的 Job: 所属 plan 运行随 Server 退出中断 (运行由 _fail_orphaned_plan_runs 标记为失败),
+      没有等待方收取结果, 取消 Job 并在步骤日志中注明
+    """
+    with db_lock:
+        with get_db() as conn:
+            rows = conn.execute(
+                "SELECT * FROM jobs WHERE status IN ('pending', 'assigned', 'running') ORDER BY created_at ASC"
+            ).fetchall()
+
+    restart_local = []
+    orphaned_steps = []
+    for r in rows:
+        job = {
+            'id': r['id'], 'task': r['task'], 'node_id': r['node_id'],
+            'vars': json.loads(r['vars']) if r['vars'] else {},
+            'status': r['status'], 'exit_code': r['exit_code'], 'logs': r['logs'] or '',
+            'started_at': r['started_at'], 'finished_at': r['finished_at'],
+            'created_at': str(r['created_at']) if r['created_at'] else None,
+            'selectors': json.loads(r['selectors']) if r['selectors'] else [],
+            'target_node': r['target_node'],
+            'tried_nodes': json.loads(r['tried_nodes']) if r['tried_nodes'] else [],
+            'attempts': r['attempts'] or 0,
+        }
+        job.update(json.loads(r['files']) if r['files'] else {})
+        jobs.add(job, notify=False)
+        if job.get('plan_step'):
+            orphaned_steps.append(job['id'])
+            continue
+        if job['status'] == 'pending':
+            continue
+        conn_type = nodes.get(job['node_id'], {}).get('connection_type', 'agent') if job['node_id'] else None
+        if conn_type == 'agent':
+            # 重启前收到的日志未持久化, Agent 下一行日志会触发从 seq 1 重发
+            jobs.update(job['id'], lease_expires=time.time() + JOB_LEASE_TTL,
+                        log_seq=0, log_base=len(job.get('logs') or ''))
+        elif conn_type == 'ssh':
+            jobs.update(job['id'], status='pending', node_id=None,
+                        logs=job['logs'] + '[ez-server] Server 重启, 重新投递\n')
+        else:
+            restart_local.append(job['id'])
+
+    now = datetime.now().isoformat()
+    for job_id in orphaned_steps:
+        note = '[ez-server] Server 重启, 所属 plan 运行已中断\n'
+        # Agent 上仍在执行的由下一次心跳收回 (revoked)
+        _finish_job(job_id, status='cancelled', logs=jobs[job_id]['logs'] + note)
+        run_id, step_name = jobs[job_id]['plan_step']
+        _update_step(run_id, step_name, 'failed', finished_at=now, logs=note)
+
+    for job_id in restart_local:
+        jobs.update(job_id, logs=jobs[job_id]['logs'] + '[ez-server] Server 重启, 重新执行\n')
+        aio.submit(_execute_job_local(job_id))
+    _dispatch_pending()
+    print(f'Recovered {len(rows)} unfinished jobs from DB')
+
+
 def main():
     """启动服务器"""
     init_db()
+    db_writer.start()
+    atexit.register(db_writer.close)
+    aio.start()
     _load_nodes_from_db()
+    _fail_orphaned_plan_runs()
+    _load_jobs_from_db()
     print(f'EZ Server starting on http://0.0.0.0:{HTTP_PORT}')
     print(f'EZ Root: {EZ_ROOT}')
     print(f'Database: {DB_PATH}')
+    socketio.start_background_task(_sweeper_loop)
+    socketio.start_background_task(_log_flush_loop)
+    if RETENTION_INTERVAL > 0 and retention.policies:
+        Thread(target=_retention_loop, daemon=True).start()
     socketio.run(app, host='0.0.0.0', port=HTTP_PORT, debug=False)
 
 
@@ -0,0 +1,235 @@
+"""轻量 Prometheus 指标 (文本格式 0.0.4, 无外部依赖)
+
+热路径只做一次 dict 查找 + 加法 (直方图多一次 bisect), 导出时才格式化。
+"""
+
+import sqlite3
+from bisect import bisect_left
+from threading import Lock
+from time import perf_counter
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+FAST_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+LONG_BUCKETS = (1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600, 7200)
+
+
+class _Metric:
+    kind = 'untyped'
+
+    def __init__(self, name, doc, labels=()):
+        self.name = name
+        self.doc = doc
+        self.labelnames = tuple(labels)
+        self._lock = Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        return tuple(str(labels.get(n, '')) for n in self.labelnames)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def _label_str(self, key, extra=None):
+        pairs = list(zip(self.labelnames, key))
+        if extra:
+            pairs.append(extra)
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{n}="{_escape(v)}"' for n, v in pairs) + '}'
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield f'{self.name}{self._label_str(key)} {_num(value)}'
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, doc, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, doc, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def time(self, **labels):
+        """with hist.time(...): 计时代码块"""
+        return _Timer(self, labels)
+
+    def samples(self):
+        with self._lock:
+            items = [(k, (list(v[0]), v[1], v[2])) for k, v in self._values.items()]
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                yield f'{self.name}_bucket{self._label_str(key, ("le", _num(bound)))} {cumulative}'
+            yield f'{self.name}_bucket{self._label_str(key, ("le", "+Inf"))} {count}'
+            yield f'{self.name}_sum{self._label_str(key)} {_num(total)}'
+            yield f'{self.name}_count{self._label_str(key)} {count}'
+
+
+class _Timer:
+    __slots__ = ('hist', 'labels', 'start')
+
+    def __init__(self, hist, labels):
+        self.hist = hist
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.hist.observe(perf_counter() - self.start, **self.labels)
+
+
+class Registry:
+    """指标集合; collectors 在每次导出前调用, 用于刷新按需计算的 gauge"""
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, name, doc, labels=()):
+        return self._add(Counter(name, doc, labels))
+
+    def gauge(self, name, doc, labels=()):
+        return self._add(Gauge(name, doc, labels))
+
+    def histogram(self, name, doc, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(name, doc, labels, buckets))
+
+    def collector(self, fn):
+        self._collectors.append(fn)
+        return fn
+
+    def render(self):
+        for fn in self._collectors:
+            try:
+                fn()
+            except Exception as e:
+                print(f'Metrics collector failed: {e}')
+        lines = []
+        for m in self._metrics:
+            lines.append(f'# HELP {m.name} {m.doc}')
+            lines.append(f'# TYPE {m.name} {m.kind}')
+            lines.extend(m.samples())
+        return '\n'.join(lines) + '\n'
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+
+class TimedLock:
+    """记录等待时间的互斥锁 (可直接替换 threading.Lock 用于 with 语句)"""
+
+    def __init__(self, histogram):
+        self._lock = Lock()
+        self._hist = histogram
+
+    def acquire(self, blocking=True, timeout=-1):
+        if self._lock.acquire(False):
+            self._hist.observe(0.0)
+            return True
+        if not blocking:
+            return False
+        start = perf_counter()
+        got = self._lock.acquire(True, timeout)
+        self._hist.observe(perf_counter() - start)
+        return got
+
+    def release(self):
+        self._lock.release()
+
+    def locked(self):
+        return self._lock.locked()
+
+    __enter__ = acquire
+
+    def __exit__(self, *exc):
+        self._lock.release()
+
+
+def timed_connection(histogram, slow_log=None):
+    """sqlite3.Connection 子类 (connect(factory=...)), 按语句类型记录执行耗时 (不含取行)
+
+    slow_log: 可选, 提供 threshold (秒) 与 check(seconds, sql=...) 的慢查询日志
+    """
+
+    def observe(sql, start):
+        elapsed = perf_counter() - start
+        histogram.observe(elapsed, op=_sql_op(sql))
+        if slow_log is not None and elapsed >= slow_log.threshold:
+            slow_log.check(elapsed, sql=' '.join(sql.split())[:500])
+
+    class TimedConnection(sqlite3.Connection):
+        def execute(self, sql, *args):
+            start = perf_counter()
+            try:
+                return super().execute(sql, *args)
+            finally:
+                observe(sql, start)
+
+        def executemany(self, sql, *args):
+            start = perf_counter()
+            try:
+                return super().executemany(sql, *args)
+            finally:
+                observe(sql, start)
+
+        def commit(self):
+            start = perf_counter()
+            try:
+                return super().commit()
+            finally:
+                observe('COMMIT', start)
+
+    return TimedConnection
+
+
+def _sql_op(sql):
+    word = sql.lstrip().split(None, 1)[0] if sql.strip() else ''
+    return word.lower()
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _num(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value)) if abs(value) < 1e15 else repr(value)
+    return str(value)
@@ -0,0 +1,92 @@
+"""Plan 步骤排程: 按历史耗时估计步骤时长, 关键路径优先, 以及完成时间预测
+
+rank (剩余最长路径) = 步骤自身估计时长 + 下游各分支中最长的 rank。并发受限时就绪步骤按 rank 从大到小启动,
+长链上的步骤先跑, 总耗时更接近关键路径长度。预测用同样的规则模拟剩余步骤的执行 (列表调度)。
+"""
+
+import heapq
+
+DEFAULT_ESTIMATE = 60.0  # 无历史记录的步骤按 60 秒估计
+FINISHED = ('success', 'cached', 'reused', 'failed', 'skipped')
+
+
+def median(values):
+    values = sorted(values)
+    if not values:
+        return None
+    mid = len(values) // 2
+    return values[mid] if len(values) % 2 else (values[mid - 1] + values[mid]) / 2
+
+
+def critical_ranks(steps, estimates):
+    """{step: 从该步骤开始到 plan 结束的最长路径秒数}"""
+    children = {s.get('name', ''): [] for s in steps}
+    for s in steps:
+        for dep in s.get('needs') or []:
+            if dep in children:
+                children[dep].append(s.get('name', ''))
+    ranks = {}
+
+    def rank(name, visiting=()):
+        if name not in ranks:
+            if name in visiting:  # 循环依赖: 该分支不再展开
+                return estimates.get(name, DEFAULT_ESTIMATE)
+            below = [rank(c, visiting + (name,)) for c in children.get(name, [])]
+            ranks[name] = estimates.get(name, DEFAULT_ESTIMATE) + max(below, default=0.0)
+        return ranks[name]
+
+    for name in children:
+        rank(name)
+    return ranks
+
+
+def simulate(steps, estimates, ranks, states, now, concurrency=0):
+    """预测未结束步骤的 (开始, 结束) 时间 (epoch 秒)
+
+    states: {step: (status, started_epoch 或 None)}; 依赖失败 / 跳过的步骤不会执行, 不给出预测。
+    运行中的步骤按 开始时间 + 估计时长 结束 (已超时的视为马上结束)。concurrency 为 0 表示不限,
+    为 1 时与执行器一致按 steps 中的顺序执行。
+    """
+    needs = {s.get('name', ''): list(s.get('needs') or []) for s in steps}
+    done, dead, running, pending = set(), set(), [], []
+    for name in needs:
+        status, started = states.get(name, ('pending', None))
+        if status in ('success', 'cached', 'reused'):
+            done.add(name)
+        elif status in FINISHED:
+            dead.add(name)
+        elif status == 'running' and started is not None:
+            running.append((max(now, started + estimates.get(name, DEFAULT_ESTIMATE)), name, started))
+        else:
+            pending.append(name)
+    # 依赖失败的步骤会被跳过
+    changed = True
+    while changed:
+        changed = False
+        for name in list(pending):
+            if any(dep in dead for dep in needs[name]):
+                pending.remove(name)
+                dead.add(name)
+                changed = True
+
+    result = {name: (started, finish) for finish, name, started in running}
+    heap = [(finish, name) for finish, name, _ in running]
+    heapq.heapify(heap)
+    if concurrency != 1:
+        pending.sort(key=lambda n: -ranks.get(n, 0))
+    t = now
+    while True:
+        ready = [n for n in pending if all(dep in done for dep in needs[n])]
+        for name in ready:
+            if concurrency and len(heap) >= concurrency:
+                break
+            pending.remove(name)
+            finish = t + estimates.get(name, DEFAULT_ESTIMATE)
+            result[name] = (t, finish)
+            heapq.heappush(heap, (finish, name))
+        if not heap:
+            break
+        finish, name = heapq.heappop(heap)
+        t = max(t, finish)
+        done.add(name)
+    return result
@@ -0,0 +1,82 @@
+"""执行进程登记与取消 (本地进程组 / SSH 通道 / Agent)"""
+
+import os
+import signal
+from threading import Lock, Timer
+
+
+class ProcessRegistry:
+    """job_id -> 正在执行的进程句柄, 取消时按类型终止并尽快释放资源
+
+    - local: 以 start_new_session=True 启动的子进程 (subprocess.Popen 或 asyncio Process),
+             向整个进程组发 SIGTERM, grace 秒后再对整组发 SIGKILL
+    - ssh:   paramiko 通道, 先发送 Ctrl-C (需 pty) 再关闭通道和连接, 远端进程随 SIGHUP 退出
+    - agent: 回调通知 Agent 自行终止
+    """
+
+    def __init__(self, grace=5):
+        self.grace = grace
+        self._lock = Lock()
+        self._entries = {}
+
+    def register_local(self, job_id, proc):
+        self._put(job_id, ('local', proc))
+
+    def register_ssh(self, job_id, client, channel):
+        self._put(job_id, ('ssh', (client, channel)))
+
+    def register_agent(self, job_id, notify):
+        self._put(job_id, ('agent', notify))
+
+    def unregister(self, job_id):
+        with self._lock:
+            self._entries.pop(job_id, None)
+
+    def __contains__(self, job_id):
+        return job_id in self._entries
+
+    def cancel(self, job_id):
+        """终止 Job 的执行进程, 返回是否找到"""
+        with self._lock:
+            entry = self._entries.pop(job_id, None)
+        if entry is None:
+            return False
+        kind, handle = entry
+        if kind == 'local':
+            self._kill_group(handle)
+        elif kind == 'ssh':
+            client, channel = handle
+            try:
+                channel.send('\x03')
+            except Exception:
+                pass
+            for closable in (channel, client):
+                try:
+                    closable.close()
+                except Exception:
+                    pass
+        elif kind == 'agent':
+            handle()
+        return True
+
+    def _put(self, job_id, entry):
+        with self._lock:
+            self._entries[job_id] = entry
+
+    def _kill_group(self, proc):
+        """SIGTERM 进程组, grace 秒后补 SIGKILL
+
+        不看组长是否存活: 组长退出 (甚至已被回收) 后, 忽略 SIGTERM 的子孙进程仍在组内并占住输出管道。
+        """
+        signal_group(proc.pid, signal.SIGTERM)
+        timer = Timer(self.grace, signal_group, (proc.pid, signal.SIGKILL))
+        timer.daemon = True
+        timer.start()
+
+
+def signal_group(pid, sig):
+    """向 start_new_session 启动的进程组发信号; 组 ID 即组长 pid, 组长已被回收时同样可用"""
+    try:
+        os.killpg(pid, sig)
+    except (ProcessLookupError, PermissionError):
+        pass
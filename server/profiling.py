@@ -0,0 +1,136 @@
+"""请求耗时分位数、慢请求/慢查询日志与采样式 CPU 剖析"""
+
+import os
+import sys
+import time
+import marshal
+import threading
+from collections import deque, Counter
+from datetime import datetime
+
+
+class LatencyTracker:
+    """按路由保存最近 window 次耗时, 查询时计算分位数"""
+
+    def __init__(self, window=1024):
+        self.window = window
+        self._lock = threading.Lock()
+        self._samples = {}
+        self._totals = {}
+
+    def record(self, route, seconds):
+        with self._lock:
+            samples = self._samples.get(route)
+            if samples is None:
+                samples = self._samples[route] = deque(maxlen=self.window)
+                self._totals[route] = [0, 0.0]
+            samples.append(seconds)
+            total = self._totals[route]
+            total[0] += 1
+            total[1] = max(total[1], seconds)
+
+    def snapshot(self):
+        """{route: {count, p50, p90, p99, max, mean}} (毫秒, 分位数基于最近 window 次), 按 p99 倒序"""
+        with self._lock:
+            items = [(r, sorted(s), list(self._totals[r])) for r, s in self._samples.items()]
+        result = {}
+        for route, samples, (count, worst) in items:
+            result[route] = {
+                'count': count,
+                'p50': _ms(_percentile(samples, 50)),
+                'p90': _ms(_percentile(samples, 90)),
+                'p99': _ms(_percentile(samples, 99)),
+                'max': _ms(worst),
+                'mean': _ms(sum(samples) / len(samples)),
+            }
+        return dict(sorted(result.items(), key=lambda kv: kv[1]['p99'], reverse=True))
+
+
+class SlowLog:
+    """超过阈值的操作记入环形缓冲并打印"""
+
+    def __init__(self, kind, threshold_ms, size=200):
+        self.kind = kind
+        self.threshold = threshold_ms / 1000.0
+        self._entries = deque(maxlen=size)
+
+    def check(self, seconds, **info):
+        if seconds < self.threshold:
+            return False
+        entry = dict(info, ms=_ms(seconds), at=datetime.now().isoformat())
+        self._entries.append(entry)
+        print(f'[slow {self.kind}] {entry["ms"]}ms {info}')
+        return True
+
+    def entries(self):
+        return list(reversed(self._entries))
+
+
+# =============================================================================
+# 采样剖析: 定期抓取所有线程的调用栈, 无需重启或预先插桩
+# =============================================================================
+
+def sample_stacks(seconds, interval=0.005):
+    """在当前 (真实 OS) 线程中采样 seconds 秒, 返回 Counter{调用栈 (根 -> 叶): 次数}
+
+    每帧记为 (文件, 函数首行, 函数名)。eventlet 下只能看到各 OS 线程上正在运行的 greenlet。
+    """
+    own = threading.get_ident()
+    counts = Counter()
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append((code.co_filename, code.co_firstlineno, code.co_name))
+                frame = frame.f_back
+            counts[tuple(reversed(stack))] += 1
+        time.sleep(interval)
+    return counts
+
+
+def collapsed(samples):
+    """折叠栈格式 (flamegraph.pl / speedscope): 'a;b;c 次数'"""
+    lines = []
+    for stack, n in samples.most_common():
+        frames = ';'.join(f'{os.path.basename(f)}:{name}:{line}' for f, line, name in stack)
+        lines.append(f'{frames} {n}')
+    return '\n'.join(lines) + '\n'
+
+
+def to_pstats(samples, interval):
+    """把采样结果转换为 pstats 可加载的 marshal 数据 (时间 = 样本数 x 采样间隔)"""
+    stats = {}
+    for stack, n in samples.items():
+        seen = set()
+        for depth, func in enumerate(stack):
+            cc, nc, tt, ct, callers = stats.get(func, (0, 0, 0.0, 0.0, {}))
+            if func not in seen:
+                # 递归时只计一次累计时间
+                seen.add(func)
+                cc += n
+                nc += n
+                ct += n * interval
+            if depth == len(stack) - 1:
+                tt += n * interval
+            if depth:
+                caller = stack[depth - 1]
+                c = callers.get(caller, (0, 0, 0.0, 0.0))
+                callers[caller] = (c[0] + n, c[1] + n, c[2] + (n * interval if depth == len(stack) - 1 else 0.0),
+                                   c[3] + n * interval)
+            stats[func] = (cc, nc, tt, ct, callers)
+    return marshal.dumps(stats)
+
+
+def _percentile(sorted_samples, pct):
+    if not sorted_samples:
+        return 0.0
+    index = min(len(sorted_samples) - 1, int(round(pct / 100.0 * (len(sorted_samples) - 1))))
+    return sorted_samples[index]
+
+
+def _ms(seconds):
+    return round(seconds * 1000.0, 3)
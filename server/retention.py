@@ -0,0 +1,238 @@
+"""数据保留: 过期行归档为 gzip JSONL 后分批删除, 再增量 VACUUM 回收空间
+
+归档按 表/年-月 分文件 (<root>/<table>/YYYY-MM.jsonl.gz), 每批追加一个 gzip member, 可直接用 zcat 查看,
+也可通过 Archive.query 按 id / 状态 / 任务 / 时间过滤。子表 (job_events、plan_run_steps 等) 随主行一起归档。
+每批只在读取与删除时短暂持有数据库锁, 写归档文件时不持锁; 先写归档后删除, 中途崩溃最多产生重复记录,
+查询时按 id 去重。
+"""
+
+import os
+import gzip
+import json
+import time
+from datetime import datetime, timedelta
+
+# 表 -> 年龄字段、主键、时间字段是否为 UTC (CURRENT_TIMESTAMP)、随主行归档的子表 (子表, 外键, 记录中的字段名)
+TABLES = {
+    'jobs': {'age': 'finished_at', 'key': 'id', 'task': 'task',
+             'children': (('job_events', 'job_id', 'events'),)},
+    'plan_runs': {'age': 'finished_at', 'key': 'id', 'task': 'plan_name',
+                  'children': (('plan_run_steps', 'run_id', 'steps'),
+                               ('plan_run_artifacts', 'run_id', 'artifacts'))},
+    'executions': {'age': 'created_at', 'key': 'id', 'task': 'task', 'utc': True, 'children': ()},
+}
+
+ACTIVE_STATUSES = ('pending', 'assigned', 'running')
+UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_duration(value):
+    """'30d' / '12h' / '90m' / 秒数; 0 表示永久保留"""
+    value = str(value).strip().lower()
+    if value and value[-1] in UNITS:
+        return float(value[:-1]) * UNITS[value[-1]]
+    return float(value)
+
+
+def parse_policies(spec):
+    """解析保留策略 'jobs=30d,jobs:failed=90d,executions=7d' -> {table: {status 或 None: 秒数}}
+
+    不带状态的为该表默认策略, 带状态的覆盖默认; executions 的状态为 success (exit_code 0) / failed。
+    """
+    policies = {}
+    for item in (spec or '').split(','):
+        item = item.strip()
+        if not item:
+            continue
+        target, _, value = item.partition('=')
+        table, _, status = target.strip().partition(':')
+        if table not in TABLES:
+            raise ValueError(f'Unknown retention table: {table}')
+        policies.setdefault(table, {})[status.strip() or None] = parse_duration(value)
+    return policies
+
+
+def _cutoff(seconds, utc=False):
+    now = datetime.utcnow() if utc else datetime.now()
+    cutoff = now - timedelta(seconds=seconds)
+    return cutoff.strftime('%Y-%m-%d %H:%M:%S') if utc else cutoff.isoformat()
+
+
+class Archive:
+    """<root>/<table>/YYYY-MM.jsonl.gz"""
+
+    def __init__(self, root):
+        self.root = root
+
+    def write(self, table, records):
+        """按年龄字段的月份追加记录"""
+        age = TABLES[table]['age']
+        by_month = {}
+        for record in records:
+            month = str(record.get(age) or datetime.now().isoformat())[:7]
+            by_month.setdefault(month, []).append(record)
+        os.makedirs(os.path.join(self.root, table), exist_ok=True)
+        for month, items in by_month.items():
+            data = ''.join(json.dumps(r, ensure_ascii=False, default=str) + '\n' for r in items)
+            with open(self._path(table, month), 'ab') as f:
+                f.write(gzip.compress(data.encode('utf-8')))
+                f.flush()
+                os.fsync(f.fileno())
+
+    def files(self):
+        """{table: [{month, size}]}"""
+        result = {}
+        for table in TABLES:
+            d = os.path.join(self.root, table)
+            names = sorted(os.listdir(d)) if os.path.isdir(d) else []
+            result[table] = [{'month': n[:-len('.jsonl.gz')], 'size': os.path.getsize(os.path.join(d, n))}
+                             for n in names if n.endswith('.jsonl.gz')]
+        return result
+
+    def query(self, table, id=None, status=None, task=None, since=None, until=None, limit=100, logs=False):
+        """按条件查询归档记录, 新的在前; since / until 为 ISO 日期时间前缀 (如 2026-01 或 2026-01-15)"""
+        spec = TABLES[table]
+        age = spec['age']
+        months = [f['month'] for f in self.files()[table]
+                  if (not since or f['month'] >= since[:7]) and (not until or f['month'] <= until[:7])]
+        found = {}
+        for month in reversed(months):
+            with gzip.open(self._path(table, month), 'rt', encoding='utf-8') as f:
+                for line in f:
+                    record = json.loads(line)
+                    if id is not None and str(record.get(spec['key'])) != str(id):
+                        continue
+                    if status and _status_of(table, record) != status:
+                        continue
+                    if task and record.get(spec['task']) != task:
+                        continue
+                    stamp = str(record.get(age) or '')
+                    if (since and stamp < since) or (until and stamp[:len(until)] > until):
+                        continue
+                    found[record.get(spec['key'])] = record
+            # 月份从新到旧, 已够数即可停止
+            if len(found) >= limit and id is None:
+                break
+        records = sorted(found.values(), key=lambda r: str(r.get(age) or ''), reverse=True)[:limit]
+        if not logs:
+            for r in records:
+                r.pop('logs', None)
+                for step in r.get('steps') or []:
+                    step.pop('logs', None)
+        return records
+
+    def _path(self, table, month):
+        return os.path.join(self.root, table, f'{month}.jsonl.gz')
+
+
+def _status_of(table, record):
+    if table == 'executions':
+        return 'success' if record.get('exit_code') == 0 else 'failed'
+    return record.get('status')
+
+
+class Retention:
+    """按策略归档并删除过期行
+
+    lock / connect: 数据库锁与连接工厂 (connect() 返回可用作上下文管理器的 sqlite3 连接, row_factory 为 Row)
+    on_archived(table, ids): 每批删除后回调 (如从内存注册表移除)
+    """
+
+    def __init__(self, policies, archive, lock, connect, batch=500, pause=0.05, on_archived=None):
+        self.policies = policies
+        self.archive = archive
+        self.lock = lock
+        self.connect = connect
+        self.batch = batch
+        self.pause = pause
+        self.on_archived = on_archived
+
+    def run(self):
+        """执行一轮保留策略, 返回 {table: 归档行数}"""
+        counts = {}
+        for table, policy in self.policies.items():
+            total = 0
+            for where, params in self._conditions(table, policy):
+                total += self._expire(table, where, params)
+            counts[table] = total
+        return counts
+
+    def _conditions(self, table, policy):
+        """策略 -> [(WHERE 子句, 参数)]: 每个单独设置的状态一条, 其余结束状态走默认策略"""
+        spec = TABLES[table]
+        age, utc = spec['age'], spec.get('utc', False)
+        overrides = [s for s in policy if s is not None]
+        conditions = []
+        for status in overrides:
+            if policy[status] > 0:
+                where, params = self._status_clause(table, status)
+                conditions.append((f'{where} AND {age} < ?', params + [_cutoff(policy[status], utc)]))
+        if policy.get(None):
+            where, params = [], []
+            if table != 'executions':
+                where.append(f'status NOT IN ({",".join("?" * len(ACTIVE_STATUSES))})')
+                params.extend(ACTIVE_STATUSES)
+            for status in overrides:
+                clause, args = self._status_clause(table, status)
+                where.append(f'NOT ({clause})')
+                params.extend(args)
+            where.append(f'{age} < ?')
+            conditions.append((' AND '.join(where), params + [_cutoff(policy[None], utc)]))
+        return conditions
+
+    @staticmethod
+    def _status_clause(table, status):
+        if table == 'executions':
+            return ('exit_code = 0', []) if status == 'success' else ('(exit_code IS NULL OR exit_code != 0)', [])
+        return 'status = ?', [status]
+
+    def _expire(self, table, where, params):
+        spec = TABLES[table]
+        key = spec['key']
+        total = 0
+        while True:
+            with self.lock:
+                with self.connect() as conn:
+                    rows = [dict(r) for r in conn.execute(
+                        f'SELECT * FROM {table} WHERE {where} ORDER BY {spec["age"]} LIMIT ?',
+                        (*params, self.batch))]
+                    ids = [r[key] for r in rows]
+                    marks = ','.join('?' * len(ids))
+                    for child, fk, field in spec['children'] if ids else ():
+                        by_parent = {}
+                        for c in conn.execute(f'SELECT * FROM {child} WHERE {fk} IN ({marks}) ORDER BY id', ids):
+                            by_parent.setdefault(c[fk], []).append(dict(c))
+                        for r in rows:
+                            r[field] = by_parent.get(r[key], [])
+            if not rows:
+                return total
+            self.archive.write(table, rows)
+            with self.lock:
+                with self.connect() as conn:
+                    for child, fk, _ in spec['children']:
+                        conn.execute(f'DELETE FROM {child} WHERE {fk} IN ({marks})', ids)
+                    conn.execute(f'DELETE FROM {table} WHERE {key} IN ({marks})', ids)
+                    conn.commit()
+            if self.on_archived:
+                self.on_archived(table, ids)
+            total += len(rows)
+            if len(rows) < self.batch:
+                return total
+            time.sleep(self.pause)
+
+    def vacuum(self, pages=256):
+        """auto_vacuum=INCREMENTAL 下分步归还空闲页, 每步短暂持锁; 返回归还的页数"""
+        freed = 0
+        while True:
+            with self.lock:
+                with self.connect() as conn:
+                    free = conn.execute('PRAGMA freelist_count').fetchone()[0]
+                    if not free:
+                        return freed
+                    conn.execute(f'PRAGMA incremental_vacuum({pages})').fetchall()
+                    after = conn.execute('PRAGMA freelist_count').fetchone()[0]
+            if after >= free:
+                # auto_vacuum 未开启
+                return freed
+            freed += free - after
+            time.sleep(self.pause)
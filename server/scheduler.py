@@ -0,0 +1,41 @@
+"""节点选择: 标签匹配 + 最小负载"""
+
+
+def parse_selectors(value):
+    """规范化标签选择器: 支持列表或逗号分隔字符串"""
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = value.split(',')
+    return [str(v).strip() for v in value if str(v).strip()]
+
+
+def match_tags(node_tags, selectors):
+    """节点标签是否满足全部选择器 (如 arch:aarch64, os:linux)"""
+    tags = set(node_tags or [])
+    return all(sel in tags for sel in selectors)
+
+
+def select_node(nodes, selectors, load_of, capacity_of, exclude=None, pressure_of=None):
+    """从在线且匹配的节点中选出负载率最低、仍有空闲容量的节点, 没有则返回 None
+
+    nodes:       node_id -> node dict
+    load_of:     node_id -> 当前占用数
+    capacity_of: node_id -> 容量
+    exclude:     不参与选择的节点 id
+    pressure_of: node_id -> 主机负载 (心跳上报), 槽位占用率相同时优先选较空闲的主机
+    """
+    best, best_key = None, None
+    for node_id, node in list(nodes.items()):
+        if node.get('status') != 'online' or (exclude and node_id in exclude):
+            continue
+        if not match_tags(node.get('tags'), selectors):
+            continue
+        capacity = capacity_of(node_id)
+        load = load_of(node_id)
+        if load >= capacity:
+            continue
+        key = (load / capacity, pressure_of(node_id) if pressure_of else 0, load, node_id)
+        if best_key is None or key < best_key:
+            best, best_key = node_id, key
+    return best
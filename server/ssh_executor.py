@@ -1,7 +1,31 @@
 """SSH 远程执行模块"""
 
+import os
+import json
+import shlex
+import posixpath
+
 import paramiko
 
+import transfer
+
+# 远端计算分块清单 (需要 python3), 文件不存在时输出 null
+_REMOTE_MANIFEST = r'''
+import hashlib, json, os, sys
+path, n = sys.argv[1], int(sys.argv[2])
+try:
+    f = open(path, 'rb')
+except OSError:
+    print('null'); sys.exit(0)
+whole, chunks = hashlib.sha256(), []
+while True:
+    b = f.read(n)
+    if not b:
+        break
+    whole.update(b); chunks.append(hashlib.sha256(b).hexdigest())
+print(json.dumps({'size': os.path.getsize(path), 'chunk_size': n, 'digest': whole.hexdigest(), 'chunks': chunks}))
+'''
+
 
 def test_ssh_connection(host, port, user, auth_type, password=None, key_path=None):
     """测试 SSH 连接, 返回 (ok: bool, msg: str)"""
@@ -23,8 +47,16 @@ def test_ssh_connection(host, port, user, auth_type, password=None, key_path=Non
 
 
 def execute_via_ssh(host, port, user, auth_type, task_cmd,
-                    password=None, key_path=None, timeout=3600):
-    """SSH 远程执行命令, 返回 (exit_code, logs)"""
+                    password=None, key_path=None, timeout=3600, on_start=None,
+                    uploads=None, downloads=None, cancelled=None):
+    """SSH 远程执行命令, 返回 (exit_code, logs)
+
+    on_start(client, channel) 在命令启动后回调, 用于登记以便取消。
+    cancelled() 在上传前与启动命令前检查, 返回 True 时不再执行。
+    使用 pty, 关闭通道时远端进程组会收到 SIGHUP。
+    uploads:   [(本地路径, 远端路径)] 执行前经 SFTP 分块上传
+    downloads: [(远端路径, 本地路径)] 执行成功后分块下载 (失败只记入日志)
+    """
     client = paramiko.SSHClient()
     client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
     try:
@@ -35,11 +67,134 @@ def execute_via_ssh(host, port, user, auth_type, task_cmd,
             kwargs['password'] = password
         client.connect(**kwargs)
 
-        stdin, stdout, stderr = client.exec_command(task_cmd, timeout=timeout)
-        exit_code = stdout.channel.recv_exit_status()
+        for local_path, remote_path in uploads or []:
+            if cancelled and cancelled():
+                return -1, 'Cancelled before start'
+            sftp_put(client, local_path, remote_path)
+
+        if cancelled and cancelled():
+            return -1, 'Cancelled before start'
+        stdin, stdout, stderr = client.exec_command(task_cmd, timeout=timeout, get_pty=True)
+        if on_start:
+            on_start(client, stdout.channel)
         logs = stdout.read().decode('utf-8', errors='replace') + stderr.read().decode('utf-8', errors='replace')
+        exit_code = stdout.channel.recv_exit_status()
+
+        if exit_code == 0:
+            for remote_path, local_path in downloads or []:
+                try:
+                    sftp_get(client, remote_path, local_path)
+                except Exception as e:
+                    logs += f'\nArtifact download failed ({remote_path}): {e}'
         return exit_code, logs
     except Exception as e:
         return -1, str(e)
     finally:
         client.close()
+
+
+# =============================================================================
+# SFTP 分块传输 (只传输目标端缺失或不一致的块, 支持续传)
+# =============================================================================
+
+def remote_manifest(client, remote_path, chunk_size=transfer.CHUNK_SIZE):
+    """远端文件的分块清单; 文件不存在或远端无 python3 时返回 None"""
+    cmd = f'python3 -c {shlex.quote(_REMOTE_MANIFEST)} {shlex.quote(remote_path)} {int(chunk_size)}'
+    stdin, stdout, stderr = client.exec_command(cmd, timeout=600)
+    out = stdout.read().decode('utf-8', errors='replace').strip()
+    if stdout.channel.recv_exit_status() != 0:
+        return None
+    try:
+        return json.loads(out)
+    except ValueError:
+        return None
+
+
+def sftp_put(client, local_path, remote_path, manifest=None):
+    """上传文件到远端: 已一致则跳过, 否则续传 <remote>.part 中缺失的块后改名; 返回传输字节数"""
+    manifest = manifest or transfer.build_manifest(local_path)
+    existing = remote_manifest(client, remote_path, manifest['chunk_size'])
+    if existing and existing['digest'] == manifest['digest']:
+        return 0
+    part = remote_path + '.part'
+    partial = remote_manifest(client, part, manifest['chunk_size'])
+
+    sent = 0
+    sftp = client.open_sftp()
+    try:
+        _sftp_makedirs(sftp, posixpath.dirname(remote_path))
+        if partial is None and existing:
+            # 旧版本文件中相同的块可直接复用
+            sftp.posix_rename(remote_path, part)
+            partial = existing
+        have = set()
+        if partial:
+            have = {i for i, h in enumerate(partial['chunks'])
+                    if i < len(manifest['chunks']) and h == manifest['chunks'][i]
+                    and transfer.chunk_span(manifest, i)[1] == transfer.chunk_span(partial, i)[1]}
+        with open(local_path, 'rb') as lf, sftp.open(part, 'r+' if partial else 'w') as rf:
+            rf.set_pipelined(True)
+            for index in range(len(manifest['chunks'])):
+                if index in have:
+                    continue
+                offset, length = transfer.chunk_span(manifest, index)
+                lf.seek(offset)
+                rf.seek(offset)
+                remaining = length
+                while remaining:
+                    buf = lf.read(min(transfer.IO_BUFSIZE, remaining))
+                    if not buf:
+                        break
+                    rf.write(buf)
+                    remaining -= len(buf)
+                sent += length
+            rf.truncate(manifest['size'])
+        sftp.posix_rename(part, remote_path)
+    finally:
+        sftp.close()
+    return sent
+
+
+def sftp_get(client, remote_path, local_path, chunk_size=transfer.CHUNK_SIZE):
+    """下载远端文件: 复用本地 <local>.part (或旧的目标文件) 中一致的块, 逐块校验; 返回清单"""
+    manifest = remote_manifest(client, remote_path, chunk_size)
+    sftp = client.open_sftp()
+    try:
+        os.makedirs(os.path.dirname(local_path) or '.', exist_ok=True)
+        part = local_path + '.part'
+        if manifest is None:
+            # 远端无 python3: 退化为整文件流式下载
+            sftp.stat(remote_path)
+            with sftp.open(remote_path, 'rb') as rf, open(part, 'wb') as lf:
+                rf.prefetch()
+                for buf in iter(lambda: rf.read(transfer.IO_BUFSIZE), b''):
+                    lf.write(buf)
+            os.replace(part, local_path)
+            return None
+        if not os.path.exists(part) and os.path.exists(local_path):
+            os.replace(local_path, part)
+        with sftp.open(remote_path, 'rb') as rf:
+            for index in transfer.missing_chunks(part, manifest):
+                offset, length = transfer.chunk_span(manifest, index)
+                rf.seek(offset)
+                transfer.write_chunk(part, manifest, index, rf)
+        transfer.finalize(part, local_path, manifest)
+        return manifest
+    finally:
+        sftp.close()
+
+
+def _sftp_makedirs(sftp, path):
+    """逐级创建远端目录"""
+    if not path or path in ('.', '/'):
+        return
+    try:
+        sftp.stat(path)
+        return
+    except IOError:
+        pass
+    _sftp_makedirs(sftp, posixpath.dirname(path))
+    try:
+        sftp.mkdir(path)
+    except IOError:
+        pass
@@ -33,8 +33,8 @@ window.escapeHtml = function(str) {
 // 状态标签映射
 window.statusLabels = {
     success: '成功', failed: '失败', error: '错误',
-    running: '运行中', pending: '等待中', cancelled: '已取消',
-    timeout: '超时', skipped: '已跳过'
+    running: '运行中', pending: '等待中', assigned: '已分配', cancelled: '已取消',
+    timeout: '超时', skipped: '已跳过', cached: '已缓存', reused: '已沿用'
 };
 
 // 状态 badge HTML
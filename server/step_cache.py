@@ -0,0 +1,75 @@
+"""Plan 步骤结果缓存 (按任务定义 + 变量 + 输入制品内容哈希)"""
+
+import os
+import json
+import hashlib
+
+
+def file_digest(path, chunk_size=1024 * 1024):
+    """文件内容 sha256 (流式读取)"""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def step_key(task_name, task_files, step_vars, input_digests, root=None, placement=None):
+    """计算步骤缓存键
+
+    task_name:     任务名 (行内任务共用同一组定义文件, 须以任务名区分)
+    task_files:    任务定义相关文件路径
+    step_vars:     解析后的变量
+    input_digests: {输入名: 制品 digest}
+    placement:     远程步骤的执行位置 {node, tags}, 本地步骤为 None
+    """
+    h = hashlib.sha256()
+    h.update(json.dumps({'task': task_name, 'placement': placement}, sort_keys=True).encode('utf-8') + b'\n')
+    for path in sorted(task_files):
+        rel = os.path.relpath(path, root) if root else path
+        h.update(rel.encode('utf-8') + b'\0')
+        h.update(file_digest(path).encode('ascii') + b'\n')
+    h.update(json.dumps({str(k): str(v) for k, v in (step_vars or {}).items()},
+                        sort_keys=True).encode('utf-8'))
+    h.update(json.dumps(input_digests or {}, sort_keys=True).encode('utf-8'))
+    return h.hexdigest()
+
+
+class StepCache:
+    """<root>/<ab>/<key>.json, 制品内容保存在 ArtifactStore 中, 缓存项只记录 digest"""
+
+    def __init__(self, root, store):
+        self.root = root
+        self.store = store
+
+    def _file(self, key):
+        return os.path.join(self.root, key[:2], f'{key}.json')
+
+    def get(self, key, task=None):
+        """读取缓存项, 任务名不符、制品对象缺失或内容与 digest 不符视为未命中"""
+        try:
+            with open(self._file(key), 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if task is not None and entry.get('task') != task:
+            return None
+        if not all(self.store.verify(digest) for digest in entry.get('artifacts', {}).values()):
+            return None
+        return entry
+
+    def put(self, key, entry, artifacts):
+        """写入缓存项; artifacts: {制品名: digest} (须已存入 store)"""
+        target = self._file(key)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        tmp = f'{target}.{os.getpid()}.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(dict(entry, key=key, artifacts=artifacts), f, ensure_ascii=False)
+        os.replace(tmp, target)
+
+    def restore(self, entry, destinations):
+        """把缓存的制品还原到 {制品名: 目标路径}"""
+        for name, digest in entry.get('artifacts', {}).items():
+            dest = destinations.get(name)
+            if dest:
+                self.store.materialize(digest, dest)
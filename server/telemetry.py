@@ -0,0 +1,111 @@
+"""节点资源遥测: 心跳样本降采样后按固定大小的环形分层存储
+
+每层 (step, slots) 中每个节点最多 slots 行, 行号为 (ts // step) % slots, 新的桶覆盖一圈前的旧桶,
+node_metrics 表大小只与节点数有关。样本先在内存中按桶求平均, 桶结束后由 flush() 批量写入。
+"""
+
+import threading
+
+# (桶宽秒数, 桶数): 10 秒 x 1 小时, 1 分钟 x 1 天, 10 分钟 x 30 天
+TIERS = ((10, 360), (60, 1440), (600, 4320))
+
+# cpu / mem: 使用率 (%); load: 1 分钟 loadavg; disk_read / disk_write: 字节/秒; disk_free: 字节;
+# busy: Agent 上报的运行中槽位; jobs: Server 记录的该节点运行中 Job
+FIELDS = ('cpu', 'mem', 'load', 'disk_read', 'disk_write', 'disk_free', 'busy', 'jobs')
+
+
+def sample_from_load(load, jobs=None):
+    """由心跳 load (见 liveness.parse_load) 构造遥测样本"""
+    sample = {name: load.get(name) for name in ('cpu', 'disk_read', 'disk_write', 'disk_free', 'busy')}
+    if load.get('loadavg'):
+        sample['load'] = load['loadavg'][0]
+    if load.get('mem_total') and load.get('mem_free') is not None:
+        sample['mem'] = max(0.0, 100.0 * (1 - load['mem_free'] / load['mem_total']))
+    sample['jobs'] = jobs
+    return sample
+
+
+def pick_tier(seconds, tiers=TIERS):
+    """覆盖 seconds 时间范围的最细粒度层"""
+    for step, slots in tiers:
+        if step * slots >= seconds:
+            return step, slots
+    return tiers[-1]
+
+
+class Telemetry:
+    def __init__(self, tiers=TIERS):
+        self.tiers = tiers
+        self._lock = threading.Lock()
+        self._open = {}     # (node_id, step) -> [bucket_ts, samples, sums, counts]
+        self._closed = []   # 已结束待写入的行
+
+    def record(self, node_id, sample, now):
+        values = [sample.get(name) for name in FIELDS]
+        with self._lock:
+            for step, slots in self.tiers:
+                bucket = int(now // step) * step
+                key = (node_id, step)
+                cur = self._open.get(key)
+                if cur is not None and cur[0] != bucket:
+                    self._closed.append(self._row(node_id, step, slots, cur))
+                    cur = None
+                if cur is None:
+                    cur = self._open[key] = [bucket, 0, [0.0] * len(FIELDS), [0] * len(FIELDS)]
+                cur[1] += 1
+                for i, v in enumerate(values):
+                    if v is not None:
+                        cur[2][i] += v
+                        cur[3][i] += 1
+
+    def flush(self, conn, now):
+        """写入已结束的桶 (含停止上报节点的最后一个桶), 返回写入行数; 调用方负责 commit"""
+        with self._lock:
+            for (node_id, step), cur in list(self._open.items()):
+                if cur[0] + step <= now:
+                    slots = dict(self.tiers)[step]
+                    self._closed.append(self._row(node_id, step, slots, cur))
+                    del self._open[(node_id, step)]
+            rows, self._closed = self._closed, []
+        if rows:
+            conn.executemany(
+                f'INSERT OR REPLACE INTO node_metrics (node_id, tier, slot, ts, samples, {", ".join(FIELDS)}) '
+                f'VALUES ({", ".join("?" * (5 + len(FIELDS)))})', rows)
+        return len(rows)
+
+    def query(self, conn, node_id, step, now, since=None):
+        """某层的时间序列 (列式): {ts: [...], cpu: [...], ...}, 含尚未写入的桶"""
+        slots = dict(self.tiers)[step]
+        start = max(now - step * slots, since or 0)
+        points = {}
+        for r in conn.execute(f'SELECT ts, {", ".join(FIELDS)} FROM node_metrics '
+                              'WHERE node_id = ? AND tier = ? AND ts > ?', (node_id, step, start)):
+            points[r[0]] = tuple(r[1:])
+        with self._lock:
+            pending = [row for row in self._closed if row[0] == node_id and row[1] == step]
+            cur = self._open.get((node_id, step))
+            if cur is not None:
+                pending.append(self._row(node_id, step, slots, cur))
+        for row in pending:
+            if row[3] > start:
+                points[row[3]] = row[5:]
+        series = {'ts': sorted(points)}
+        for i, name in enumerate(FIELDS):
+            series[name] = [_round(points[ts][i]) for ts in series['ts']]
+        return series
+
+    def forget(self, node_id):
+        with self._lock:
+            for key in [k for k in self._open if k[0] == node_id]:
+                del self._open[key]
+            self._closed = [row for row in self._closed if row[0] != node_id]
+
+    @staticmethod
+    def _row(node_id, step, slots, cur):
+        bucket, samples, sums, counts = cur
+        avgs = [sums[i] / counts[i] if counts[i] else None for i in range(len(FIELDS))]
+        return (node_id, step, (bucket // step) % slots, bucket, samples, *avgs)
+
+
+def _round(value):
+    return None if value is None else round(value, 2)
@@ -0,0 +1,67 @@
+"""加载 main (Flask 应用) 供接口测试使用: 临时 EZ_ROOT / 数据库, 缺少 Flask 等依赖时返回 None"""
+
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_main = None
+
+
+def make_root():
+    """临时 EZ_ROOT: Taskfile.yml、plans/ 与测试用 task, 返回其路径"""
+    root = tempfile.mkdtemp(prefix='ez-test-')
+    with open(os.path.join(root, 'Taskfile.yml'), 'w') as f:
+        f.write('version: "3"\ntasks:\n  hello:\n    cmds: [echo hi]\n')
+    for d in ('dep', 'plans', 'stub'):
+        os.makedirs(os.path.join(root, d))
+    # 测试用 task: 执行 stub/<任务名>.sh (任务名为最后一个参数, 工作目录为 EZ_ROOT)
+    task_bin = os.path.join(root, 'dep', 'task')
+    with open(task_bin, 'w') as f:
+        f.write('#!/bin/sh\nfor task; do :; done\n[ -f "stub/$task.sh" ] || exit 0\nexec sh "stub/$task.sh"\n')
+    os.chmod(task_bin, 0o755)
+    return root
+
+
+def load_main():
+    """导入一次 main 并初始化数据库; main 持有全局状态, 各测试模块共用同一实例"""
+    global _main
+    if _main is None:
+        try:
+            import flask, flask_socketio, yaml  # noqa: F401
+        except ImportError:
+            return None
+        root = make_root()
+        os.environ['EZ_ROOT'] = root
+        os.environ['EZ_DB_PATH'] = os.path.join(root, '.ez-server', 'ez.db')
+        os.environ.pop('EZ_SERVER_TOKEN', None)
+        import main
+        main.init_db()
+        _main = main
+    return _main
+
+
+def write_task(name, script, root=None):
+    """stub/<name>.sh: 测试用 task 执行该任务时运行的 shell 脚本"""
+    with open(os.path.join(root or _main.EZ_ROOT, 'stub', f'{name}.sh'), 'w') as f:
+        f.write(script)
+
+
+def write_plan(name, text):
+    with open(os.path.join(_main.EZ_ROOT, 'plans', f'{name}.yml'), 'w') as f:
+        f.write(text)
+
+
+def wait_plan(client, run_id, timeout=10):
+    """等待 plan 运行结束, 返回 /plans/runs/<id> 的结果"""
+    deadline = time.time() + timeout
+    while True:
+        # 启动写入不等待提交, 刚返回 run_id 时可能还查不到
+        run = client.get(f'/api/v1/plans/runs/{run_id}').json
+        if run.get('status') not in (None, 'running') and run_id not in _main.live_plans:
+            return run
+        if time.time() > deadline:
+            raise AssertionError(f'plan run {run_id} still running: {run}')
+        time.sleep(0.05)
@@ -0,0 +1,108 @@
+"""制品路径限制在 EZ_ROOT 内: 创建 Job / plan 时拒绝绝对路径与 '..', 放置前检查解析后的路径"""
+
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+sys.path.insert(0, os.path.join(os.path.dirname(HERE), 'client'))
+
+from server_app import load_main, write_plan
+
+main = load_main()
+
+try:
+    import agent
+except SystemExit:  # 缺少 python-socketio / requests
+    agent = None
+
+
+@unittest.skipIf(main is None, 'Flask / flask_socketio 未安装')
+class ServerPathTest(unittest.TestCase):
+
+    def setUp(self):
+        self.client = main.app.test_client()
+        src = os.path.join(main.EZ_ROOT, 'stub', 'input.txt')
+        with open(src, 'w') as f:
+            f.write('data')
+        self.digest, _ = main.artifact_store.put(src)
+
+    def run_task(self, **body):
+        return self.client.post('/api/v1/tasks/run', json=dict({'task': 'hello'}, **body))
+
+    def test_relative_path_error(self):
+        for path in ('out/a.txt', 'a..b', './x'):
+            self.assertIsNone(main._relative_path_error(path), path)
+        for path in ('', None, 3, '/etc/passwd', '~/x', '../x', 'a/../../x', 'a\\..\\x'):
+            self.assertIsNotNone(main._relative_path_error(path), path)
+
+    def test_run_task_rejects_malformed_inputs(self):
+        for inputs in ('in.txt', [['in.txt']], ['in.txt'], {'path': 'in.txt'}):
+            self.assertEqual(self.run_task(inputs=inputs).status_code, 400, inputs)
+        for artifacts in ('out.txt', ['out.txt'], [{'name': 'a', 'path': '/tmp/out'}]):
+            self.assertEqual(self.run_task(artifacts=artifacts).status_code, 400, artifacts)
+
+    def test_run_task_rejects_escaping_destination(self):
+        for path in ('/tmp/ez-evil', '../ez-evil', 'a/../../ez-evil'):
+            resp = self.run_task(inputs=[{'digest': self.digest, 'path': path}])
+            self.assertEqual(resp.status_code, 400, path)
+        self.assertFalse(os.path.exists(os.path.join(os.path.dirname(main.EZ_ROOT), 'ez-evil')))
+
+    def test_plan_create_and_run_reject_escaping_paths(self):
+        steps = [{'name': 'a', 'task': 'hello', 'artifacts': [{'name': 'out', 'path': 'out.txt'}]},
+                 {'name': 'b', 'task': 'hello', 'needs': ['a'],
+                  'inputs': [{'from': 'a', 'artifact': 'out', 'to': '/tmp/ez-evil'}]}]
+        resp = self.client.post('/api/v1/plans', json={'name': 'evil-create', 'steps': steps})
+        self.assertEqual(resp.status_code, 400)
+        self.assertFalse(os.path.exists(os.path.join(main.EZ_ROOT, 'plans', 'evil-create.yml')))
+
+        # 直接写入的 plan 文件在运行时拒绝
+        write_plan('evil-run', 'steps:\n'
+                   '  - name: a\n    task: hello\n'
+                   '    artifacts:\n      - {name: out, path: ../ez-evil}\n')
+        resp = self.client.post('/api/v1/plans/evil-run/run', json={})
+        self.assertEqual(resp.status_code, 400)
+        self.assertIn('..', resp.json['error'])
+
+    def test_root_path_rejects_symlink_escape(self):
+        outside = tempfile.mkdtemp(prefix='ez-outside-')
+        link = os.path.join(main.EZ_ROOT, 'link-out')
+        os.symlink(outside, link)
+        self.addCleanup(os.unlink, link)
+        self.assertEqual(main._root_path('sub/x.txt'), os.path.join(main.EZ_ROOT, 'sub', 'x.txt'))
+        with self.assertRaises(ValueError):
+            main._root_path('link-out/x.txt')
+        with self.assertRaises(ValueError):
+            main._materialize_inputs({'inputs': [{'from': 'a', 'artifact': 'out', 'to': 'link-out/x.txt'}]},
+                                     {'a': {'out': self.digest}}, {'a': {}})
+        self.assertEqual(os.listdir(outside), [])
+
+
+@unittest.skipIf(agent is None, 'python-socketio / requests 未安装')
+class AgentPathTest(unittest.TestCase):
+
+    def test_root_path(self):
+        self.assertEqual(agent.root_path('out/a.txt'), os.path.join(agent.EZ_ROOT, 'out', 'a.txt'))
+        for path in ('', None, '/etc/passwd', '../x', 'a/../../x'):
+            with self.assertRaises(ValueError):
+                agent.root_path(path)
+
+    def test_job_with_escaping_input_is_not_downloaded(self):
+        job = {'id': 'path-1', 'task': 'hello',
+               'inputs': [{'digest': 'sha256:' + '0' * 64, 'path': '../ez-evil'}]}
+        with mock.patch.object(agent, 'download_artifact') as download, \
+                mock.patch.object(agent, 'report_result') as report, \
+                mock.patch.object(agent, 'send_log'), \
+                mock.patch.object(agent.subprocess, 'Popen') as popen, \
+                mock.patch.object(agent, 'LOG_DIR', tempfile.mkdtemp()):
+            agent.execute_job(job, 0)
+        download.assert_not_called()
+        popen.assert_not_called()
+        self.assertEqual(report.call_args[0][1]['status'], 'error')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,248 @@
+"""启动前到达的取消: Server 本地 / SSH 执行与 Agent (同步 / asyncio) 都不再启动任务进程"""
+
+import asyncio
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+import uuid
+from datetime import datetime
+from unittest import mock
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+sys.path.insert(0, os.path.join(os.path.dirname(HERE), 'client'))
+
+from server_app import load_main, write_task
+
+main = load_main()
+
+try:
+    import agent
+except SystemExit:  # 缺少 python-socketio / requests
+    agent = None
+try:
+    import aio_agent
+except (ImportError, SystemExit):
+    aio_agent = None
+
+
+def _job(**fields):
+    job = {'id': f'c-{uuid.uuid4().hex[:8]}', 'task': 'cancel-probe', 'vars': {}, 'status': 'running',
+           'logs': '', 'created_at': datetime.now().isoformat()}
+    job.update(fields)
+    return job
+
+
+@unittest.skipIf(main is None, 'Flask / flask_socketio 未安装')
+class ServerCancelBeforeStartTest(unittest.TestCase):
+
+    def setUp(self):
+        self.marker = os.path.join(main.EZ_ROOT, 'ran-cancel-probe')
+        if os.path.exists(self.marker):
+            os.remove(self.marker)
+        write_task('cancel-probe', 'touch ran-cancel-probe\n')
+
+    def add(self, **fields):
+        job = _job(**fields)
+        main.jobs.add(job)
+        return job['id']
+
+    def test_local_job_cancelled_before_coroutine_starts(self):
+        job_id = self.add()
+        main._cancel_job(job_id)
+        main.aio.submit(main._execute_job_local(job_id)).result(10)
+        self.assertEqual(main.jobs[job_id]['status'], 'cancelled')
+        self.assertFalse(os.path.exists(self.marker))
+
+    def test_local_job_cancelled_while_placing_inputs(self):
+        src = os.path.join(main.EZ_ROOT, 'cancel-input.bin')
+        with open(src, 'wb') as f:
+            f.write(b'input')
+        digest, _ = main.artifact_store.put(src)
+        job_id = self.add(inputs=[{'digest': digest, 'path': 'cancel-in/a.bin'},
+                                  {'digest': digest, 'path': 'cancel-in/b.bin'}])
+        materialize = main.artifact_store.materialize
+
+        def cancel_during_download(digest, dest):
+            materialize(digest, dest)
+            main._cancel_job(job_id)
+
+        with mock.patch.object(main.artifact_store, 'materialize', side_effect=cancel_during_download):
+            main.aio.submit(main._execute_job_local(job_id)).result(10)
+        job = main.jobs[job_id]
+        self.assertEqual(job['status'], 'cancelled')
+        self.assertIn('Cancelled before start', job['logs'])
+        self.assertFalse(os.path.exists(self.marker))
+
+    def add_ssh(self):
+        node_id = f'ssh-{uuid.uuid4().hex[:8]}'
+        main.nodes[node_id] = {'id': node_id, 'name': node_id, 'status': 'online', 'connection_type': 'ssh',
+                               'host': '127.0.0.1', 'ssh_user': 'nobody', 'slots': 1, 'tags': []}
+        self.addCleanup(main.nodes.pop, node_id, None)
+        return self.add(node_id=node_id)
+
+    def test_ssh_job_cancelled_before_thread_starts(self):
+        job_id = self.add_ssh()
+        main._cancel_job(job_id)
+        with mock.patch('ssh_executor.execute_via_ssh') as execute:
+            main._execute_job_ssh(job_id)
+        execute.assert_not_called()
+        self.assertEqual(main.jobs[job_id]['status'], 'cancelled')
+
+    def test_ssh_cancel_arriving_before_channel_is_registered(self):
+        job_id = self.add_ssh()
+        client, channel = mock.Mock(), mock.Mock()
+
+        def execute(**kw):
+            self.assertFalse(kw['cancelled']())
+            main._cancel_job(job_id)          # 通道登记前到达, procs 中还没有它
+            self.assertTrue(kw['cancelled']())
+            kw['on_start'](client, channel)
+            return -1, 'closed'
+
+        with mock.patch('ssh_executor.execute_via_ssh', side_effect=execute):
+            main._execute_job_ssh(job_id)
+        channel.send.assert_called_with('\x03')
+        client.close.assert_called()
+        self.assertEqual(main.jobs[job_id]['status'], 'cancelled')
+
+    def test_execute_via_ssh_checks_cancel_before_upload_and_exec(self):
+        import ssh_executor
+        with mock.patch.object(ssh_executor.paramiko, 'SSHClient') as client_cls, \
+                mock.patch.object(ssh_executor, 'sftp_put') as put:
+            result = ssh_executor.execute_via_ssh('h', 22, 'u', 'password', 'task x',
+                                                  uploads=[('a', 'b')], cancelled=lambda: True)
+        self.assertEqual(result, (-1, 'Cancelled before start'))
+        put.assert_not_called()
+        client_cls.return_value.exec_command.assert_not_called()
+        client_cls.return_value.close.assert_called()
+
+
+class AgentFixture:
+    """临时 EZ_ROOT: ez 桩记录执行过的任务 (ran-<task>), slow 任务睡眠 30 秒"""
+
+    def make_root(self):
+        root = tempfile.mkdtemp(prefix='ez-agent-test-')
+        self.addCleanup(shutil.rmtree, root, True)
+        with open(os.path.join(root, 'ez'), 'w') as f:
+            f.write('#!/bin/sh\ntouch "$(dirname "$0")/ran-$2"\n[ "$2" = slow ] && sleep 30\necho done\n')
+        os.chmod(os.path.join(root, 'ez'), 0o755)
+        return root
+
+    def ran(self, task):
+        return os.path.exists(os.path.join(self.root, f'ran-{task}'))
+
+
+@unittest.skipIf(agent is None, 'python-socketio / requests 未安装')
+class AgentCancelBeforeStartTest(AgentFixture, unittest.TestCase):
+
+    def setUp(self):
+        self.root = self.make_root()
+        self.reports = []
+        for name, value in (('EZ_ROOT', self.root), ('LOG_DIR', os.path.join(self.root, 'logs')),
+                            ('KILL_GRACE', 1)):
+            patcher = mock.patch.object(agent, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(agent, 'report_result', side_effect=lambda job_id, r: self.reports.append(r))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_cancel_while_waiting_for_a_slot(self):
+        job = {'id': 'a-wait', 'task': 'quick'}
+        with mock.patch.object(agent, 'ack_job', return_value=True), \
+                mock.patch.object(agent, 'free_slots', agent.Queue()) as free_slots:
+            worker = agent.Thread(target=agent.run_in_slot, args=(job,))
+            worker.start()
+            agent.stop_job('a-wait')          # 槽位全满时到达
+            free_slots.put(0)
+            worker.join(10)
+            self.assertEqual(free_slots.qsize(), 1)
+        self.assertFalse(self.ran('quick'))
+        self.assertEqual(self.reports[0]['status'], 'cancelled')
+        self.assertNotIn('a-wait', agent.stopped)
+
+    def test_cancel_while_downloading_inputs(self):
+        job = {'id': 'a-download', 'task': 'quick', 'inputs': [{'digest': 'd1', 'path': 'x'}, {'digest': 'd2', 'path': 'y'}]}
+        with mock.patch.object(agent, 'download_artifact',
+                               side_effect=lambda digest, dest: agent.stop_job('a-download')) as download:
+            agent.execute_job(job)
+        agent.stopped.discard('a-download')
+        self.assertEqual(download.call_count, 1)
+        self.assertFalse(self.ran('quick'))
+        self.assertEqual(self.reports[0]['status'], 'cancelled')
+
+    def test_cancel_between_popen_and_registration(self):
+        job = {'id': 'a-late', 'task': 'slow'}
+        real_popen = subprocess.Popen
+
+        def popen(*args, **kw):
+            proc = real_popen(*args, **kw)
+            agent.stop_job('a-late')          # 进程已启动但还未登记
+            return proc
+
+        start = time.time()
+        with mock.patch.object(agent.subprocess, 'Popen', side_effect=popen):
+            agent.execute_job(job)
+        agent.stopped.discard('a-late')
+        agent.processes.pop('a-late', None)
+        self.assertLess(time.time() - start, 10)
+        self.assertEqual(self.reports[0]['status'], 'cancelled')
+
+
+@unittest.skipIf(aio_agent is None, 'aiohttp / python-socketio 未安装')
+class AsyncAgentCancelBeforeStartTest(AgentFixture, unittest.TestCase):
+
+    def setUp(self):
+        self.root = self.make_root()
+        for module, name, value in ((aio_agent, 'EZ_ROOT', self.root), (aio_agent, 'KILL_GRACE', 1),
+                                    (agent, 'LOG_DIR', os.path.join(self.root, 'logs'))):
+            patcher = mock.patch.object(module, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.reports = []
+
+    def run_agent(self, scenario):
+        async def main_():
+            a = aio_agent.AsyncAgent('http://127.0.0.1:9', 'n1', slots=1)
+
+            async def report(job_id, result):
+                self.reports.append(result)
+            a.report_result = report
+            a.ack_job = mock.AsyncMock(return_value=True)
+            await scenario(a)
+            return a
+        return asyncio.run(main_())
+
+    def test_cancel_while_downloading_inputs(self):
+        job = {'id': 'b-download', 'task': 'quick', 'inputs': [{'digest': 'd1', 'path': 'x'}, {'digest': 'd2', 'path': 'y'}]}
+
+        async def scenario(a):
+            a.download_artifact = mock.AsyncMock(side_effect=lambda digest, dest: a.stop_job('b-download'))
+            await a.run_in_slot(job)
+            self.assertEqual(a.download_artifact.await_count, 1)
+
+        a = self.run_agent(scenario)
+        self.assertFalse(self.ran('quick'))
+        self.assertEqual(self.reports[0]['status'], 'cancelled')
+        self.assertEqual(a.stopped, set())
+
+    def test_cancel_while_waiting_for_a_slot(self):
+        async def scenario(a):
+            async with a.free:                # 槽位被占满
+                waiting = asyncio.ensure_future(a.run_in_slot({'id': 'b-wait', 'task': 'quick'}))
+                await asyncio.sleep(0.05)
+                a.stop_job('b-wait')
+            await asyncio.wait_for(waiting, 10)
+
+        self.run_agent(scenario)
+        self.assertFalse(self.ran('quick'))
+        self.assertEqual(self.reports[0]['status'], 'cancelled')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,125 @@
+"""DBWriter: 组提交、barrier 与单条失败隔离"""
+
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import unittest
+from concurrent.futures import Future
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from db_writer import DBWriter
+from server_app import load_main
+
+main = load_main()
+
+
+class DBWriterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.db = os.path.join(self.dir, 'ez.db')
+        with sqlite3.connect(self.db) as conn:
+            conn.execute('CREATE TABLE t (id INTEGER PRIMARY KEY, name TEXT UNIQUE)')
+        self.batches = []
+        self.writer = None
+
+    def tearDown(self):
+        if self.writer:
+            self.writer.close()
+        shutil.rmtree(self.dir)
+
+    def start(self, **kw):
+        self.writer = DBWriter(lambda: sqlite3.connect(self.db, check_same_thread=False), threading.Lock(),
+                               on_commit=lambda ops, seconds: self.batches.append(ops), **kw)
+        return self.writer
+
+    def names(self):
+        with sqlite3.connect(self.db) as conn:
+            return [r[0] for r in conn.execute('SELECT name FROM t ORDER BY id')]
+
+    def test_writes_in_window_share_one_commit(self):
+        writer = self.start(window=0.5)
+        futures = [writer.execute('INSERT INTO t (name) VALUES (?)', (f'n{i}',)) for i in range(5)]
+        writer.barrier().result(5)
+        self.assertEqual(self.batches, [6])
+        self.assertEqual([f.result() for f in futures], [1, 2, 3, 4, 5])
+        self.assertEqual(self.names(), ['n0', 'n1', 'n2', 'n3', 'n4'])
+
+    def test_max_batch_splits_batches(self):
+        writer = self.start(window=0.5, max_batch=2)
+        futures = [writer.execute('INSERT INTO t (name) VALUES (?)', (f'n{i}',)) for i in range(3)]
+        writer.barrier().result(5)
+        self.assertEqual(self.batches, [2, 2])
+        self.assertTrue(all(f.done() for f in futures))
+
+    def test_barrier_waits_for_earlier_writes(self):
+        lock = threading.Lock()
+        writer = DBWriter(lambda: sqlite3.connect(self.db, check_same_thread=False), lock, window=0)
+        self.writer = writer
+        with lock:
+            # 持锁期间写线程无法提交, barrier 也不会完成
+            writer.executemany('INSERT INTO t (name) VALUES (?)', [('a',), ('b',)])
+            barrier = writer.barrier()
+            self.assertFalse(barrier.done())
+        self.assertIsNone(barrier.result(5))
+        self.assertEqual(self.names(), ['a', 'b'])
+
+    def test_failing_write_only_fails_its_own_future(self):
+        writer = self.start(window=0.5)
+        ok = writer.execute('INSERT INTO t (name) VALUES (?)', ('dup',))
+        dup = writer.execute('INSERT INTO t (name) VALUES (?)', ('dup',))
+        def insert_and_fail(conn):
+            conn.execute("INSERT INTO t (name) VALUES ('rolled back')")
+            raise RuntimeError('boom')
+        failed = writer.call(insert_and_fail)
+        after = writer.call(lambda conn: conn.execute("INSERT INTO t (name) VALUES ('after')").rowcount)
+        self.assertEqual(ok.result(5), 1)
+        with self.assertRaises(sqlite3.IntegrityError):
+            dup.result(5)
+        with self.assertRaisesRegex(RuntimeError, 'boom'):
+            failed.result(5)
+        self.assertEqual(after.result(5), 1)
+        self.assertEqual(self.batches, [4])
+        self.assertEqual(self.names(), ['dup', 'after'])
+
+    def test_close_drains_queue(self):
+        writer = self.start(window=0)
+        futures = [writer.execute('INSERT INTO t (name) VALUES (?)', (f'n{i}',)) for i in range(20)]
+        writer.close()
+        self.assertTrue(all(f.done() for f in futures))
+        self.assertEqual(len(self.names()), 20)
+        self.assertEqual(writer.pending(), 0)
+
+
+@unittest.skipIf(main is None, 'Flask / flask_socketio 未安装')
+class WaitWriteTest(unittest.TestCase):
+
+    def test_wait_yields_to_other_greenlets(self):
+        """请求处理中等待提交时其他 greenlet 继续运行 (Future.result() 会阻塞整个 hub)"""
+        future = Future()
+        ticks = []
+
+        def other_connection():
+            for _ in range(5):
+                ticks.append(1)
+                main.socketio.sleep(0.001)
+
+        main.socketio.start_background_task(other_connection)
+        threading.Timer(0.1, future.set_result, args=(42,)).start()
+        self.assertEqual(main._wait_write(future), 42)
+        self.assertEqual(len(ticks), 5)
+
+    def test_wait_raises_write_error(self):
+        future = Future()
+        future.set_exception(sqlite3.IntegrityError('dup'))
+        with self.assertRaises(sqlite3.IntegrityError):
+            main._wait_write(future)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+"""/debug/*: 未配置 Token 时默认关闭, 配置后需 Token"""
+
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from server_app import load_main
+
+main = load_main()
+
+ROUTES = ('/api/v1/debug/routes', '/api/v1/debug/slow', '/api/v1/debug/profile?seconds=0.1&interval=5')
+
+
+@unittest.skipIf(main is None, 'Flask / flask_socketio 未安装')
+class DebugApiTest(unittest.TestCase):
+
+    def setUp(self):
+        self.client = main.app.test_client()
+
+    def get(self, path, token=None):
+        headers = {'Authorization': f'Bearer {token}'} if token else {}
+        return self.client.get(path, headers=headers)
+
+    def test_disabled_without_server_token(self):
+        for path in ROUTES:
+            self.assertEqual(self.get(path).status_code, 403, path)
+
+    def test_token_required_when_configured(self):
+        with mock.patch.object(main, 'SERVER_TOKEN', 'secret'):
+            for path in ROUTES:
+                self.assertEqual(self.get(path).status_code, 401, path)
+                self.assertEqual(self.get(path, 'wrong').status_code, 401, path)
+                self.assertEqual(self.get(path, 'secret').status_code, 200, path)
+
+    def test_explicit_opt_in_without_token(self):
+        with mock.patch.object(main, 'DEBUG_API', True):
+            resp = self.get('/api/v1/debug/routes')
+            self.assertEqual(resp.status_code, 200)
+            self.assertIn('routes', resp.json)
+
+
+if __name__ == '__main__':
+    unittest.main()
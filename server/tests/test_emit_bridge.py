@@ -0,0 +1,77 @@
+"""EmitBridge: 主线程直接广播, 其他 OS 线程的广播排队到 flush() 时发送"""
+
+import os
+import sys
+import threading
+import unittest
+from unittest import mock
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+sys.path.insert(0, os.path.dirname(HERE))
+
+from aio_core import EmitBridge
+from server_app import load_main
+
+main = load_main()
+
+
+def in_thread(fn, *args):
+    t = threading.Thread(target=fn, args=args)
+    t.start()
+    t.join(5)
+
+
+class EmitBridgeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.sent = []
+        self.bridge = EmitBridge(lambda event, *args, **kw: self.sent.append((event, args, kw)))
+
+    def test_main_thread_emits_directly(self):
+        self.bridge('node_update', {'id': 'n1'}, to='room')
+        self.assertEqual(self.sent, [('node_update', ({'id': 'n1'},), {'to': 'room'})])
+        self.assertEqual(self.bridge.pending(), 0)
+
+    def test_worker_thread_emit_is_queued_until_flush(self):
+        job = {'id': 'j1', 'status': 'running'}
+        in_thread(self.bridge, 'job_update', job)
+        job['status'] = 'success'          # 负载按调用时的内容发送
+        self.assertEqual(self.sent, [])
+        self.assertEqual(self.bridge.pending(), 1)
+
+        self.bridge.flush()
+        self.assertEqual(self.sent, [('job_update', ({'id': 'j1', 'status': 'running'},), {})])
+        self.assertEqual(self.bridge.pending(), 0)
+
+    def test_flush_continues_after_failed_emit(self):
+        calls = []
+
+        def emit(event, *args, **kw):
+            calls.append(event)
+            if event == 'bad':
+                raise RuntimeError('boom')
+
+        bridge = EmitBridge(emit)
+        in_thread(bridge, 'bad')
+        in_thread(bridge, 'good')
+        bridge.flush()
+        self.assertEqual(calls, ['bad', 'good'])
+
+
+@unittest.skipIf(main is None, 'Flask / flask_socketio 未安装')
+class ServerEmitTest(unittest.TestCase):
+
+    def test_socketio_emit_is_not_patched(self):
+        self.assertIs(main.socketio.emit.__func__, type(main.socketio).emit)
+
+    def test_worker_thread_broadcast_delivered_by_flush(self):
+        with mock.patch.object(main, '_socketio_emit') as emit:
+            in_thread(main.emit_bridge, 'plan_update', {'run_id': 'r1', 'status': 'success'})
+            self.assertFalse(any(c.args[0] == 'plan_update' for c in emit.call_args_list))
+            main.emit_bridge.flush()
+        emit.assert_any_call('plan_update', {'run_id': 'r1', 'status': 'success'})
+
+
+if __name__ == '__main__':
+    unittest.main()
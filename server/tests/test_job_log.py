@@ -0,0 +1,118 @@
+"""结果上报时的日志核对: 缺尾 409 + log_tail 补传、digest 不符时整体重发、不合法的字段"""
+
+import hashlib
+import os
+import sys
+import unittest
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from server_app import load_main
+
+main = load_main()
+
+
+def _digest(lines):
+    return hashlib.sha256(''.join(line + '\n' for line in lines).encode('utf-8')).hexdigest()
+
+
+@unittest.skipIf(main is None, 'Flask / flask_socketio 未安装')
+class ResultLogTest(unittest.TestCase):
+
+    LINES = ['line 1', 'line 2', 'line 3', 'line 4']
+
+    def setUp(self):
+        self.client = main.app.test_client()
+        self.node_id = f'n-{uuid.uuid4().hex[:8]}'
+        self.client.post('/api/v1/nodes/register', json={'id': self.node_id, 'slots': 1})
+        self.job_id = self.client.post('/api/v1/tasks/run', json={'task': 'hello', 'node': self.node_id}).json['job_id']
+        self.client.get(f'/api/v1/nodes/{self.node_id}/jobs/next?wait=0')
+        self.client.post(f'/api/v1/jobs/{self.job_id}/ack', json={'node_id': self.node_id})
+        self.job = main.jobs[self.job_id]
+
+    def tearDown(self):
+        main._cancel_job(self.job_id)
+        self.client.delete(f'/api/v1/nodes/{self.node_id}')
+
+    def stream(self, lines, start=1):
+        """模拟经 Socket.IO 实时推送的日志行"""
+        for seq, line in enumerate(lines, start):
+            main._accept_log_line(self.job, seq, line)
+
+    def report(self, **fields):
+        result = {'node_id': self.node_id, 'status': 'success', 'exit_code': 0,
+                  'log_seq': len(self.LINES), 'log_digest': _digest(self.LINES)}
+        result.update(fields)
+        return self.client.post(f'/api/v1/jobs/{self.job_id}/result', json=result)
+
+    def test_complete_log_is_accepted(self):
+        self.stream(self.LINES)
+        self.assertEqual(self.report().status_code, 200)
+        self.assertEqual(self.job['status'], 'success')
+        self.assertEqual(self.job['logs'], ''.join(line + '\n' for line in self.LINES))
+
+    def test_missing_tail_round_trip(self):
+        self.stream(self.LINES[:2])
+        resp = self.report()
+        self.assertEqual(resp.status_code, 409)
+        self.assertEqual(resp.json['log_from_seq'], 3)
+        self.assertEqual(self.job['status'], 'running')
+
+        # Agent 从 spool 补传 3 之后的行
+        resp = self.report(log_tail={'from_seq': 3, 'text': 'line 3\nline 4\n'})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(self.job['logs'], ''.join(line + '\n' for line in self.LINES))
+        self.assertEqual(self.job['status'], 'success')
+
+    def test_tail_with_a_gap_asks_again(self):
+        self.stream(self.LINES[:1])
+        resp = self.report(log_tail={'from_seq': 3, 'text': 'line 3\nline 4\n'})
+        self.assertEqual((resp.status_code, resp.json['log_from_seq']), (409, 2))
+
+    def test_digest_mismatch_resets_and_requests_full_resend(self):
+        self.stream(['line 1', 'garbled', 'line 3', 'line 4'])
+        resp = self.report()
+        self.assertEqual((resp.status_code, resp.json['log_from_seq']), (409, 1))
+        self.assertEqual(self.job['log_seq'], 0)
+
+        resp = self.report(log_tail={'from_seq': 1, 'text': ''.join(line + '\n' for line in self.LINES)})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(self.job['logs'], ''.join(line + '\n' for line in self.LINES))
+
+    def test_mismatch_after_full_resend_is_accepted(self):
+        # 整体重发后仍不一致 (如 Agent 侧 spool 丢行) 不再无限要求重发
+        resp = self.report(log_tail={'from_seq': 1, 'text': 'line 1\nline 2\nline 3\nother\n'})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(self.job['status'], 'success')
+
+    def test_malformed_log_fields_are_rejected(self):
+        self.stream(self.LINES)
+        bad = [
+            {'log_seq': None},
+            {'log_seq': '4'},
+            {'log_seq': -1},
+            {'log_seq': True},
+            {'log_seq': 4.5},
+            {'log_digest': 123},
+            {'log_tail': ['line 1']},
+            {'log_tail': {'from_seq': 'x', 'text': 'a\n'}},
+            {'log_tail': {'from_seq': 0, 'text': 'a\n'}},
+            {'log_tail': {'from_seq': 1, 'text': 42}},
+        ]
+        for fields in bad:
+            resp = self.report(**fields)
+            self.assertEqual(resp.status_code, 400, fields)
+            self.assertIn('error', resp.json)
+        missing = self.client.post(f'/api/v1/jobs/{self.job_id}/result',
+                                   json={'node_id': self.node_id, 'status': 'success', 'log_digest': 'abc'})
+        self.assertEqual(missing.status_code, 400)
+        not_object = self.client.post(f'/api/v1/jobs/{self.job_id}/result', json=['success'])
+        self.assertEqual(not_object.status_code, 400)
+        self.assertEqual(self.job['status'], 'running')
+        # 仍可正常上报
+        self.assertEqual(self.report().status_code, 200)
+
+
+if __name__ == '__main__':
+    unittest.main()
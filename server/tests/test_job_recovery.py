@@ -0,0 +1,105 @@
+"""持久化 Job 队列: Server 崩溃后重启, 从 DB 恢复未完成的 Job (两个子进程共用同一 EZ_ROOT / 数据库)"""
+
+import json
+import os
+import subprocess
+import sys
+import unittest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+from server_app import load_main, make_root, write_task
+
+main = load_main()
+
+# 第一次启动: 提交三个 Job 后直接退出进程 (不执行 atexit, 模拟崩溃)
+CRASH = '''
+import json, os, sys, time
+import main
+main.init_db()
+client = main.app.test_client()
+client.post('/api/v1/nodes/register', json={'id': 'dq-agent', 'slots': 1})
+ids = {
+    'pending': client.post('/api/v1/tasks/run', json={'task': 'dq-pending', 'tags': 'pool=none',
+                                                      'vars': {'K': 'v'}}).json['job_id'],
+    'agent': client.post('/api/v1/tasks/run', json={'task': 'dq-agent', 'node': 'dq-agent'}).json['job_id'],
+}
+client.get('/api/v1/nodes/dq-agent/jobs/next?wait=0')
+client.post(f"/api/v1/jobs/{ids['agent']}/ack", json={'node_id': 'dq-agent'})
+ids['local'] = client.post('/api/v1/tasks/run', json={'task': 'dq-local'}).json['job_id']
+deadline = time.time() + 10
+while not os.path.exists('dq-started') and time.time() < deadline:
+    time.sleep(0.05)
+main.db_writer.barrier().result(5)
+print(json.dumps(ids), flush=True)
+os._exit(0)
+'''
+
+# 第二次启动: 按 main() 的顺序恢复, 等本地 Job 重新执行完
+RESTART = '''
+import json, os, sys, time
+import main
+ids = json.loads(sys.argv[1])
+main.init_db()
+main._load_nodes_from_db()
+main._fail_orphaned_plan_runs()
+main._load_jobs_from_db()
+deadline = time.time() + 10
+while main.jobs[ids['local']]['status'] == 'running' and time.time() < deadline:
+    time.sleep(0.05)
+main.db_writer.barrier().result(5)
+fields = ('status', 'node_id', 'selectors', 'vars', 'logs', 'lease_expires')
+state = {name: {f: main.jobs[job_id].get(f) for f in fields} for name, job_id in ids.items()}
+state['now'] = time.time()
+print(json.dumps(state), flush=True)
+os._exit(0)
+'''
+
+
+@unittest.skipIf(main is None, 'Flask / flask_socketio 未安装')
+class JobRecoveryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root = make_root()
+        self.env = dict(os.environ, EZ_ROOT=self.root, PYTHONPATH=os.path.dirname(HERE),
+                        EZ_DB_PATH=os.path.join(self.root, '.ez-server', 'ez.db'))
+        self.env.pop('EZ_SERVER_TOKEN', None)
+
+    def server(self, script, *args):
+        out = subprocess.run([sys.executable, '-c', script, *args], cwd=self.root, env=self.env,
+                             capture_output=True, text=True, timeout=30,
+                             ).stdout.strip().splitlines()
+        self.assertTrue(out, 'server process printed nothing')
+        return json.loads(out[-1])
+
+    def test_unfinished_jobs_survive_a_crash(self):
+        write_task('dq-local', 'echo run >> dq-runs\ntouch dq-started\n'
+                               'while [ ! -f dq-go ]; do sleep 0.05; done\necho local-done\n', root=self.root)
+        ids = self.server(CRASH)
+
+        # 崩溃前启动的本地进程随之放行; 重启后的重新执行也不再等待
+        open(os.path.join(self.root, 'dq-go'), 'w').close()
+        state = self.server(RESTART, json.dumps(ids))
+
+        pending = state['pending']
+        self.assertEqual((pending['status'], pending['node_id']), ('pending', None))
+        self.assertEqual(pending['vars'], {'K': 'v'})
+        self.assertEqual(pending['selectors'], ['pool=none'])
+
+        # Agent 上运行中的 Job 等待 Agent 重连认领, 给予新的租约
+        agent = state['agent']
+        self.assertEqual((agent['status'], agent['node_id']), ('running', 'dq-agent'))
+        self.assertGreater(agent['lease_expires'], state['now'])
+
+        # 本地运行中的 Job 随 Server 退出中断, 重启后重新执行
+        local = state['local']
+        self.assertEqual(local['status'], 'success')
+        self.assertIn('重新执行', local['logs'])
+        self.assertIn('local-done', local['logs'])
+        with open(os.path.join(self.root, 'dq-runs')) as f:
+            self.assertEqual(f.read().split(), ['run', 'run'])
+
+
+if __name__ == '__main__':
+    unittest.main()
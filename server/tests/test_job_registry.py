@@ -0,0 +1,71 @@
+"""JobRegistry: 二级索引与状态迁移回调"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from job_registry import JobRegistry
+
+
+def _job(job_id, task='build', node_id=None, status='pending'):
+    return {'id': job_id, 'task': task, 'node_id': node_id, 'status': status, 'created_at': job_id}
+
+
+class JobRegistryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.events = []
+        self.jobs = JobRegistry(lambda job, changes: self.events.append((job['id'], changes)))
+
+    def test_indexes_follow_updates(self):
+        for i in range(3):
+            self.jobs.add(_job(f'j{i}', task='build' if i < 2 else 'test'))
+        self.jobs.update('j1', status='running', node_id='n1')
+
+        self.assertEqual([j['id'] for j in self.jobs.by_task('build')], ['j1', 'j0'])
+        self.assertEqual([j['id'] for j in self.jobs.by_task('build', limit=1)], ['j1'])
+        self.assertEqual([j['id'] for j in self.jobs.by_status('pending')], ['j0', 'j2'])
+        self.assertEqual([j['id'] for j in self.jobs.by_node('n1')], ['j1'])
+        self.assertEqual(self.jobs.by_node('n1', 'pending'), [])
+        self.assertEqual(self.jobs.count_status('running'), 1)
+        self.assertEqual(self.jobs.first('n1', 'running')['id'], 'j1')
+        self.assertIsNone(self.jobs.first('n1', 'pending'))
+
+    def test_multi_status_lookup_is_ordered_by_creation(self):
+        self.jobs.add(_job('a', status='running'))
+        self.jobs.add(_job('b', status='pending'))
+        self.jobs.add(_job('c', status='running'))
+        self.assertEqual([j['id'] for j in self.jobs.by_status('running', 'pending')], ['a', 'b', 'c'])
+
+    def test_remove_and_readd_clear_old_index_entries(self):
+        self.jobs.add(_job('a', node_id='n1'))
+        self.jobs.add(_job('a', node_id='n2'))
+        self.assertEqual(self.jobs.by_node('n1'), [])
+        self.assertEqual(len(self.jobs.by_node('n2')), 1)
+        self.jobs.remove('a')
+        self.assertNotIn('a', self.jobs)
+        self.assertEqual(self.jobs.by_status('pending'), [])
+        self.assertEqual(self.jobs.count_status('pending'), 0)
+
+    def test_listener_gets_the_transition_that_fired_it(self):
+        self.jobs.add(_job('a'))
+        self.jobs.update('a', status='running', node_id='n1')
+        self.jobs.update('a', logs='line\n')          # 非索引字段不触发
+        self.jobs.update('a', status='running')       # 未变化不触发
+        self.jobs.update('a', status='success')
+        self.assertEqual(self.events, [
+            ('a', None),
+            ('a', {'status': ('pending', 'running'), 'node_id': (None, 'n1')}),
+            ('a', {'status': ('running', 'success')}),
+        ])
+
+    def test_restore_without_notify(self):
+        self.jobs.add(_job('a'), notify=False)
+        self.assertEqual(self.events, [])
+        self.assertIsNone(self.jobs.update('missing', status='running'))
+
+
+if __name__ == '__main__':
+    unittest.main()
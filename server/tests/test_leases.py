@@ -0,0 +1,106 @@
+"""Agent Job 租约: 长轮询取出、ack、心跳续约与过期重投"""
+
+import os
+import sys
+import time
+import unittest
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from server_app import load_main
+
+main = load_main()
+
+
+@unittest.skipIf(main is None, 'Flask / flask_socketio 未安装')
+class LeaseTest(unittest.TestCase):
+
+    def setUp(self):
+        self.client = main.app.test_client()
+        self.node_a = self.register()
+        self.node_b = None
+
+    def tearDown(self):
+        for node_id in (self.node_a, self.node_b):
+            if node_id:
+                for job in main.jobs.by_node(node_id, 'assigned', 'running'):
+                    main._cancel_job(job['id'])
+                self.client.delete(f'/api/v1/nodes/{node_id}')
+
+    def register(self):
+        node_id = f'n-{uuid.uuid4().hex[:8]}'
+        resp = self.client.post('/api/v1/nodes/register', json={'id': node_id, 'name': node_id, 'slots': 1})
+        self.assertEqual(resp.status_code, 200)
+        return node_id
+
+    def submit(self, node_id):
+        resp = self.client.post('/api/v1/tasks/run', json={'task': 'hello', 'node': node_id})
+        return resp.json['job_id']
+
+    def poll(self, node_id):
+        return self.client.get(f'/api/v1/nodes/{node_id}/jobs/next?wait=0').json['job']
+
+    def ping(self, node_id, running):
+        return self.client.post(f'/api/v1/nodes/{node_id}/ping', json={'running': running}).json
+
+    def expire(self, job_id):
+        main.jobs.update(job_id, lease_expires=time.time() - 1)
+        main._sweep_leases()
+
+    def test_poll_and_ack_take_the_lease(self):
+        job_id = self.submit(self.node_a)
+        self.assertEqual(main.jobs[job_id]['status'], 'assigned')
+        # 心跳不投递 Job, 只有长轮询取出
+        self.assertEqual(self.ping(self.node_a, []), {'status': 'ok', 'revoked': []})
+        self.assertEqual(self.poll(self.node_a)['id'], job_id)
+        self.assertIsNone(self.poll(self.node_a))
+
+        other = self.client.post(f'/api/v1/jobs/{job_id}/ack', json={'node_id': 'someone-else'})
+        self.assertEqual(other.status_code, 409)
+        resp = self.client.post(f'/api/v1/jobs/{job_id}/ack', json={'node_id': self.node_a})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(main.jobs[job_id]['status'], 'running')
+
+    def test_ping_renews_running_leases_and_revokes_foreign_ones(self):
+        job_id = self.submit(self.node_a)
+        self.poll(self.node_a)
+        self.client.post(f'/api/v1/jobs/{job_id}/ack', json={'node_id': self.node_a})
+        main.jobs.update(job_id, lease_expires=time.time() + 1)
+
+        self.assertEqual(self.ping(self.node_a, [job_id, 'unknown-job'])['revoked'], ['unknown-job'])
+        self.assertGreater(main.jobs[job_id]['lease_expires'], time.time() + main.JOB_LEASE_TTL - 5)
+        main._sweep_leases()
+        self.assertEqual(main.jobs[job_id]['status'], 'running')
+
+    def test_expired_lease_is_redelivered_to_another_node(self):
+        job_id = self.submit(self.node_a)
+        self.poll(self.node_a)
+        self.client.post(f'/api/v1/jobs/{job_id}/ack', json={'node_id': self.node_a})
+        # target_node 固定了节点, 去掉后才会换节点重投
+        main.jobs.update(job_id, target_node=None)
+        self.node_b = self.register()
+
+        self.expire(job_id)
+        job = main.jobs[job_id]
+        self.assertEqual((job['status'], job['node_id'], job['attempts']), ('assigned', self.node_b, 2))
+        self.assertIn('租约过期', job['logs'])
+        # 旧节点的心跳得知租约已转走, 迟到的结果被拒绝
+        self.assertEqual(self.ping(self.node_a, [job_id])['revoked'], [job_id])
+        late = self.client.post(f'/api/v1/jobs/{job_id}/result', json={'node_id': self.node_a, 'exit_code': 0})
+        self.assertEqual(late.status_code, 409)
+        self.assertEqual(self.poll(self.node_b)['id'], job_id)
+
+    def test_lease_expiring_too_often_ends_in_error(self):
+        job_id = self.submit(self.node_a)
+        self.poll(self.node_a)
+        main.jobs.update(job_id, attempts=main.JOB_MAX_ATTEMPTS)
+        self.expire(job_id)
+        job = main.jobs[job_id]
+        self.assertEqual(job['status'], 'error')
+        self.assertIsNotNone(job['finished_at'])
+        self.assertIn('超过最大投递次数', job['logs'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+"""liveness: 心跳时间轮与负载解析"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from liveness import TimerWheel, cpu_pressure, parse_load
+
+
+class TimerWheelTest(unittest.TestCase):
+
+    def setUp(self):
+        self.wheel = TimerWheel(tick=1.0, size=8)
+
+    def test_expires_after_timeout(self):
+        self.assertEqual(self.wheel.advance(100), [])
+        self.wheel.touch('a', 5, now=100)
+        self.wheel.touch('b', 3, now=100)
+        self.assertEqual(self.wheel.advance(102.5), [])
+        self.assertEqual(self.wheel.advance(103), ['b'])
+        self.assertEqual(self.wheel.advance(104.9), [])
+        self.assertEqual(self.wheel.advance(105), ['a'])
+        self.assertEqual(len(self.wheel), 0)
+
+    def test_touch_postpones_and_shortens(self):
+        self.wheel.touch('a', 3, now=100)
+        self.wheel.touch('a', 3, now=102)      # 心跳推迟到 105
+        self.assertEqual(self.wheel.advance(104), [])
+        self.assertEqual(self.wheel.advance(105), ['a'])
+
+        self.wheel.touch('b', 6, now=105)
+        self.wheel.touch('b', 1, now=105)      # 超时变短时移到更早的槽位
+        self.assertEqual(self.wheel.advance(106), ['b'])
+
+    def test_deadline_beyond_one_revolution(self):
+        self.wheel.touch('a', 20, now=100)     # 超过 8 格一圈, 中途重新挂入
+        for t in range(101, 120):
+            self.assertEqual(self.wheel.advance(t), [], t)
+        self.assertEqual(self.wheel.advance(120), ['a'])
+
+    def test_long_pause_expires_everything_once(self):
+        for i in range(5):
+            self.wheel.touch(i, i + 1, now=100)
+        self.assertEqual(sorted(self.wheel.advance(1000)), [0, 1, 2, 3, 4])
+        self.assertEqual(self.wheel.advance(2000), [])
+
+    def test_remove(self):
+        self.wheel.touch('a', 2, now=100)
+        self.wheel.remove('a')
+        self.wheel.remove('missing')
+        self.assertEqual(self.wheel.advance(110), [])
+        self.assertEqual(len(self.wheel), 0)
+
+
+class LoadTest(unittest.TestCase):
+
+    def test_parse_load_keeps_known_numeric_fields(self):
+        load = parse_load({'loadavg': [2, 1.5, 1], 'cpus': 4, 'cpu': 'high', 'busy': True,
+                           'mem_free': -1, 'disk_free': 10, 'extra': 1})
+        self.assertEqual(load, {'loadavg': [2.0, 1.5, 1.0], 'cpus': 4, 'disk_free': 10})
+        self.assertIsNone(parse_load({'cpu': None}))
+        self.assertIsNone(parse_load('1.0'))
+
+    def test_cpu_pressure_is_per_cpu(self):
+        self.assertEqual(cpu_pressure({'loadavg': [2.0, 0, 0], 'cpus': 4}), 0.5)
+        self.assertEqual(cpu_pressure({'loadavg': [2.0, 0, 0]}), 2.0)
+        self.assertEqual(cpu_pressure(None), 0.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,153 @@
+"""plan 运行端到端: 真实的 _run_plan_steps 执行测试用 task (stub/<任务名>.sh), 远程步骤由模拟的 Agent 经 HTTP 完成"""
+
+import os
+import sys
+import tempfile
+import time
+import unittest
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from server_app import load_main, write_task, write_plan, wait_plan
+
+main = load_main()
+
+
+@unittest.skipIf(main is None, 'Flask / flask_socketio 未安装')
+class ArtifactHandOffTest(unittest.TestCase):
+    """本地步骤的制品经远程步骤传给下游步骤"""
+
+    def setUp(self):
+        self.client = main.app.test_client()
+        self.node_id = f'ho-{uuid.uuid4().hex[:8]}'
+        self.client.post('/api/v1/nodes/register', json={'id': self.node_id, 'slots': 1})
+        self.addCleanup(self.client.delete, f'/api/v1/nodes/{self.node_id}')
+
+    def poll_job(self, timeout=10):
+        """模拟 Agent 长轮询取 Job"""
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            job = self.client.get(f'/api/v1/nodes/{self.node_id}/jobs/next?wait=0').json['job']
+            if job:
+                return job
+            time.sleep(0.05)
+        self.fail('remote step was not dispatched')
+
+    def test_artifacts_flow_through_a_remote_step(self):
+        write_task('ho-build', 'mkdir -p ho && echo built-1 > ho/out.txt\n')
+        write_task('ho-publish', 'cat ho/final.txt\n')
+        write_plan('handoff', f'''name: handoff
+steps:
+  - name: build
+    task: ho-build
+    artifacts: [{{name: out, path: ho/out.txt}}]
+  - name: remote
+    task: ho-remote
+    node: {self.node_id}
+    needs: [build]
+    inputs: [{{from: build, artifact: out, to: ho/in.txt}}]
+    artifacts: [{{name: report, path: ho/report.txt}}]
+  - name: publish
+    task: ho-publish
+    needs: [remote]
+    inputs: [{{from: remote, artifact: report, to: ho/final.txt}}]
+''')
+        run_id = self.client.post('/api/v1/plans/handoff/run', json={}).json['run_id']
+
+        # 远程步骤作为 Job 派发, 带上游制品的 digest 与放置位置
+        job = self.poll_job()
+        self.assertEqual(job['plan_step'], [run_id, 'remote'])
+        self.assertEqual(job['artifacts'], [{'name': 'report', 'path': 'ho/report.txt'}])
+        [inp] = job['inputs']
+        self.assertEqual(inp['path'], 'ho/in.txt')
+        with self.client.get(f"/api/v1/artifacts/{inp['digest']}") as resp:
+            self.assertEqual(resp.data, b'built-1\n')
+
+        # Agent 执行后上传产出 (分块上传见 test_transfer) 并上报结果
+        self.client.post(f"/api/v1/jobs/{job['id']}/ack", json={'node_id': self.node_id})
+        with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False) as f:
+            f.write('report-from-agent\n')
+        self.addCleanup(os.unlink, f.name)
+        report, _ = main.artifact_store.put(f.name)
+        resp = self.client.post(f"/api/v1/jobs/{job['id']}/result", json={
+            'node_id': self.node_id, 'status': 'success', 'exit_code': 0,
+            'logs': 'remote ok\n', 'outputs': {'report': report}})
+        self.assertEqual(resp.status_code, 200)
+
+        run = wait_plan(self.client, run_id)
+        steps = {s['step_name']: s for s in run['steps']}
+        self.assertEqual(run['status'], 'success')
+        self.assertEqual([steps[n]['status'] for n in ('build', 'remote', 'publish')], ['success'] * 3)
+        self.assertEqual((steps['remote']['node_id'], steps['remote']['job_id']), (self.node_id, job['id']))
+        self.assertIn('report-from-agent', steps['publish']['logs'])
+
+        artifacts = self.client.get(f'/api/v1/plans/runs/{run_id}/artifacts').json['artifacts']
+        self.assertEqual([(a['step_name'], a['name'], a['digest']) for a in artifacts],
+                         [('build', 'out', inp['digest']), ('remote', 'report', report)])
+
+
+
+@unittest.skipIf(main is None, 'Flask / flask_socketio 未安装')
+class PlanResumeTest(unittest.TestCase):
+    """从失败处重新执行: 沿用成功的步骤及其制品, 重跑失败的步骤及其下游"""
+
+    def setUp(self):
+        self.client = main.app.test_client()
+
+    def calls(self):
+        with open(os.path.join(main.EZ_ROOT, 'rs', 'calls')) as f:
+            return f.read().split()
+
+    def test_resume_reruns_failed_step_and_downstream(self):
+        write_task('rs-build', 'mkdir -p rs && echo build >> rs/calls && echo payload-1 > rs/out.txt\n')
+        write_task('rs-check', 'echo check >> rs/calls\ncat rs/in.txt\n[ -f rs/go ]\n')
+        write_task('rs-report', 'echo report >> rs/calls\n')
+        write_task('rs-docs', 'echo docs >> rs/calls\n')
+        write_plan('resume-chain', '''name: resume-chain
+steps:
+  - name: build
+    task: rs-build
+    artifacts: [{name: out, path: rs/out.txt}]
+  - name: check
+    task: rs-check
+    needs: [build]
+    inputs: [{from: build, artifact: out, to: rs/in.txt}]
+  - name: report
+    task: rs-report
+    needs: [check]
+  - name: docs
+    task: rs-docs
+''')
+        first_id = self.client.post('/api/v1/plans/resume-chain/run', json={}).json['run_id']
+        first = wait_plan(self.client, first_id)
+        steps = {s['step_name']: s['status'] for s in first['steps']}
+        self.assertEqual(first['status'], 'failed')
+        self.assertEqual(steps, {'build': 'success', 'check': 'failed', 'report': 'skipped', 'docs': 'success'})
+
+        # 修复失败原因; 工作目录中的制品已被清掉, 下游输入须从制品库取回
+        open(os.path.join(main.EZ_ROOT, 'rs', 'go'), 'w').close()
+        for name in ('out.txt', 'in.txt'):
+            os.remove(os.path.join(main.EZ_ROOT, 'rs', name))
+        resp = self.client.post(f'/api/v1/plans/runs/{first_id}/resume', json={})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(sorted(resp.json['reused']), ['build', 'docs'])
+        self.assertEqual(resp.json['steps'], ['check', 'report'])
+
+        second = wait_plan(self.client, resp.json['run_id'])
+        steps = {s['step_name']: s for s in second['steps']}
+        self.assertEqual((second['status'], second['parent_run_id']), ('success', first_id))
+        self.assertEqual({n: s['status'] for n, s in steps.items()},
+                         {'build': 'reused', 'check': 'success', 'report': 'success', 'docs': 'reused'})
+        self.assertIn('payload-1', steps['check']['logs'])
+        self.assertEqual(sorted(self.calls()), ['build', 'check', 'check', 'docs', 'report'])
+
+        # 沿用步骤的制品记入新运行; 全部成功后不能再次 resume
+        artifacts = self.client.get(f"/api/v1/plans/runs/{second['id']}/artifacts").json['artifacts']
+        self.assertEqual([(a['step_name'], a['name']) for a in artifacts], [('build', 'out')])
+        self.assertEqual(self.client.post(f"/api/v1/plans/runs/{second['id']}/resume", json={}).status_code, 409)
+        self.assertEqual(self.client.post('/api/v1/plans/runs/missing/resume', json={}).status_code, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
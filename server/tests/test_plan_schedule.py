@@ -0,0 +1,64 @@
+"""plan_schedule: 关键路径 rank 与完成时间预测"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from plan_schedule import DEFAULT_ESTIMATE, critical_ranks, median, simulate
+
+# a -> c, b -> c; d 独立: a(10) b(30) c(5) d(20)
+STEPS = [{'name': 'a'}, {'name': 'b'}, {'name': 'c', 'needs': ['a', 'b']}, {'name': 'd'}]
+ESTIMATES = {'a': 10, 'b': 30, 'c': 5, 'd': 20}
+
+
+class RankTest(unittest.TestCase):
+
+    def test_rank_is_longest_remaining_path(self):
+        self.assertEqual(critical_ranks(STEPS, ESTIMATES), {'a': 15, 'b': 35, 'c': 5, 'd': 20})
+
+    def test_missing_estimate_and_cycle(self):
+        steps = [{'name': 'x', 'needs': ['y']}, {'name': 'y', 'needs': ['x']}, {'name': 'z', 'needs': ['gone']}]
+        ranks = critical_ranks(steps, {'x': 1})
+        self.assertEqual(ranks['z'], DEFAULT_ESTIMATE)
+        self.assertEqual(set(ranks), {'x', 'y', 'z'})
+
+    def test_median(self):
+        self.assertIsNone(median([]))
+        self.assertEqual(median([3, 1, 2]), 2)
+        self.assertEqual(median([4, 1, 2, 3]), 2.5)
+
+
+class SimulateTest(unittest.TestCase):
+
+    def setUp(self):
+        self.ranks = critical_ranks(STEPS, ESTIMATES)
+
+    def run_sim(self, states=None, concurrency=0, now=0):
+        return simulate(STEPS, ESTIMATES, self.ranks, states or {}, now, concurrency)
+
+    def test_unlimited_runs_independent_steps_together(self):
+        self.assertEqual(self.run_sim(), {'a': (0, 10), 'b': (0, 30), 'd': (0, 20), 'c': (30, 35)})
+
+    def test_sequential_keeps_file_order(self):
+        self.assertEqual(self.run_sim(concurrency=1),
+                         {'a': (0, 10), 'b': (10, 40), 'c': (40, 45), 'd': (45, 65)})
+
+    def test_limited_concurrency_starts_critical_path_first(self):
+        # 并发 2: b (rank 35) 与 d (rank 20) 先跑, a 等 d 结束
+        self.assertEqual(self.run_sim(concurrency=2),
+                         {'b': (0, 30), 'd': (0, 20), 'a': (20, 30), 'c': (30, 35)})
+
+    def test_progress_states(self):
+        states = {'a': ('success', 0), 'b': ('running', 5), 'd': ('failed', 0)}
+        self.assertEqual(self.run_sim(states, now=20), {'b': (5, 35), 'c': (35, 40)})
+        # 已超出估计时长的运行中步骤视为马上结束
+        self.assertEqual(self.run_sim(states, now=50)['c'], (50, 55))
+        # 依赖失败的步骤不会执行
+        states['b'] = ('failed', 5)
+        self.assertEqual(self.run_sim(states, now=20), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+"""retention: 保留策略解析、过期行归档删除与归档查询"""
+
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import unittest
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from retention import Archive, Retention, parse_duration, parse_policies
+
+
+def _ago(days):
+    return (datetime.now() - timedelta(days=days)).isoformat()
+
+
+class PolicyTest(unittest.TestCase):
+
+    def test_parse(self):
+        self.assertEqual(parse_duration('90m'), 5400)
+        self.assertEqual(parse_duration(' 2D'), 172800)
+        self.assertEqual(parse_duration('15'), 15)
+        self.assertEqual(parse_policies(''), {})
+        self.assertEqual(parse_policies('jobs=30d, jobs:failed=0,executions=1h'),
+                         {'jobs': {None: 30 * 86400, 'failed': 0}, 'executions': {None: 3600}})
+        with self.assertRaises(ValueError):
+            parse_policies('nodes=1d')
+
+
+class RetentionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.db = os.path.join(self.dir, 'ez.db')
+        with self.connect() as conn:
+            conn.executescript('''
+                CREATE TABLE jobs (id TEXT PRIMARY KEY, task TEXT, status TEXT, finished_at TEXT, logs TEXT);
+                CREATE TABLE job_events (id INTEGER PRIMARY KEY, job_id TEXT, status TEXT);
+                CREATE TABLE executions (id INTEGER PRIMARY KEY, task TEXT, exit_code INTEGER,
+                                         created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP);
+            ''')
+            jobs = [('old-ok', 'build', 'success', _ago(40)), ('old-err', 'build', 'error', _ago(41)),
+                    ('old-running', 'build', 'running', _ago(40)), ('new-ok', 'test', 'success', _ago(1)),
+                    ('mid-err', 'test', 'error', _ago(10))]
+            for job_id, task, status, finished in jobs:
+                conn.execute('INSERT INTO jobs VALUES (?, ?, ?, ?, ?)', (job_id, task, status, finished, 'log'))
+                conn.execute('INSERT INTO job_events (job_id, status) VALUES (?, ?)', (job_id, status))
+            conn.execute("INSERT INTO executions (task, exit_code, created_at) VALUES ('x', 0, '2000-01-01 00:00:00')")
+            conn.execute("INSERT INTO executions (task, exit_code) VALUES ('y', 1)")
+        self.archive = Archive(os.path.join(self.dir, 'archive'))
+        self.archived = []
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def connect(self):
+        conn = sqlite3.connect(self.db)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def run_policy(self, spec, batch=500):
+        retention = Retention(parse_policies(spec), self.archive, threading.Lock(), self.connect,
+                              batch=batch, pause=0, on_archived=lambda table, ids: self.archived.extend(ids))
+        return retention.run()
+
+    def remaining(self, table='jobs'):
+        with self.connect() as conn:
+            return sorted(r[0] for r in conn.execute(f'SELECT id FROM {table}'))
+
+    def test_default_and_status_overrides(self):
+        # 失败的 Job 保留更久; 运行中的 Job 不受影响
+        counts = self.run_policy('jobs=30d,jobs:error=60d,executions=1d', batch=1)
+        self.assertEqual(counts, {'jobs': 1, 'executions': 1})
+        self.assertEqual(self.remaining(), ['mid-err', 'new-ok', 'old-err', 'old-running'])
+        self.assertEqual(self.remaining('executions'), [2])
+        self.assertEqual(self.archived, ['old-ok', 1])
+        with self.connect() as conn:
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM job_events WHERE job_id = 'old-ok'").fetchone()[0], 0)
+
+        self.assertEqual(self.run_policy('jobs:error=5d', batch=1), {'jobs': 2})
+        self.assertEqual(self.remaining(), ['new-ok', 'old-running'])
+
+    def test_archive_query(self):
+        self.run_policy('jobs=5d')
+        self.assertEqual(len(self.archive.files()['jobs']), len({_ago(41)[:7], _ago(40)[:7], _ago(10)[:7]}))
+
+        records = self.archive.query('jobs')
+        self.assertEqual([r['id'] for r in records], ['mid-err', 'old-ok', 'old-err'])
+        self.assertNotIn('logs', records[0])
+        job = self.archive.query('jobs', id='old-ok', logs=True)[0]
+        self.assertEqual((job['logs'], job['events'][0]['status']), ('log', 'success'))
+        self.assertEqual([r['id'] for r in self.archive.query('jobs', status='error')], ['mid-err', 'old-err'])
+        self.assertEqual([r['id'] for r in self.archive.query('jobs', task='test')], ['mid-err'])
+        self.assertEqual([r['id'] for r in self.archive.query('jobs', since=_ago(20))], ['mid-err'])
+        self.assertEqual(len(self.archive.query('jobs', until=_ago(20))), 2)
+        self.assertEqual(len(self.archive.query('jobs', limit=1)), 1)
+
+    def test_duplicate_archive_records_are_merged(self):
+        # 归档后删除前崩溃再重跑: 同一 id 写入两次, 查询时去重
+        with self.connect() as conn:
+            rows = [dict(r) for r in conn.execute("SELECT * FROM jobs WHERE id = 'old-ok'")]
+        self.archive.write('jobs', rows)
+        self.run_policy('jobs=30d')
+        self.assertEqual([r['id'] for r in self.archive.query('jobs', id='old-ok')], ['old-ok'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+"""scheduler: 标签选择器与最小负载选点"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scheduler import match_tags, parse_selectors, select_node
+
+
+def _nodes(**tags):
+    return {node_id: {'status': 'online', 'tags': t} for node_id, t in tags.items()}
+
+
+class SelectorTest(unittest.TestCase):
+
+    def test_parse_selectors(self):
+        self.assertEqual(parse_selectors(None), [])
+        self.assertEqual(parse_selectors(' arch:x86_64, ,os:linux'), ['arch:x86_64', 'os:linux'])
+        self.assertEqual(parse_selectors(['gpu', ' ']), ['gpu'])
+
+    def test_match_tags_requires_every_selector(self):
+        self.assertTrue(match_tags(['os:linux', 'gpu'], ['gpu']))
+        self.assertTrue(match_tags(None, []))
+        self.assertFalse(match_tags(['os:linux'], ['os:linux', 'gpu']))
+
+
+class SelectNodeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.nodes = _nodes(a=['os:linux'], b=['os:linux', 'gpu'], c=['os:linux'])
+        self.load = {'a': 0, 'b': 0, 'c': 0}
+        self.capacity = {'a': 1, 'b': 1, 'c': 1}
+
+    def select(self, selectors=(), **kw):
+        return select_node(self.nodes, list(selectors), self.load.get, self.capacity.get, **kw)
+
+    def test_ties_break_by_node_id(self):
+        self.assertEqual(self.select(), 'a')
+
+    def test_picks_lowest_load_ratio(self):
+        self.capacity.update(a=2, b=4)
+        self.load.update(a=1, b=1, c=0)
+        self.assertEqual(self.select(), 'c')
+        self.load['c'] = 1
+        self.assertEqual(self.select(), 'b')        # 1/4 < 1/2
+
+    def test_skips_full_offline_excluded_and_unmatched(self):
+        self.load['a'] = 1
+        self.nodes['c']['status'] = 'offline'
+        self.assertEqual(self.select(), 'b')
+        self.assertIsNone(self.select(exclude={'b'}))
+        self.load['a'] = 0
+        self.assertEqual(self.select(['gpu']), 'b')
+        self.assertIsNone(self.select(['gpu'], exclude={'b'}))
+
+    def test_host_pressure_breaks_ratio_ties(self):
+        pressure = {'a': 0.9, 'b': 0.1, 'c': 0.5}
+        self.assertEqual(self.select(pressure_of=pressure.get), 'b')
+        self.load['b'] = 1
+        self.assertEqual(self.select(pressure_of=pressure.get), 'c')
+
+
+if __name__ == '__main__':
+    unittest.main()
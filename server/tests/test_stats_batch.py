@@ -0,0 +1,67 @@
+"""批量执行统计接口: 逐条校验, 合法记录一次写入"""
+
+import json
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from server_app import load_main
+
+main = load_main()
+
+
+@unittest.skipIf(main is None, 'Flask / flask_socketio 未安装')
+class StatsBatchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.client = main.app.test_client()
+
+    def post(self, body, content_type='application/json'):
+        return self.client.post('/api/v1/stats/report/batch', data=body, content_type=content_type)
+
+    def stored(self, task):
+        rows = self.client.get('/api/v1/stats/executions?limit=1000').json['executions']
+        return [r for r in rows if r['task'] == task]
+
+    def test_json_array_rejects_bad_records_one_by_one(self):
+        records = [
+            {'task': 'batch-a', 'exit_code': 0, 'duration': 1.5, 'host': 'h1'},
+            {'exit_code': 0},
+            {'task': 'batch-a', 'params': ['x']},
+            {'task': 'batch-a', 'exit_code': True},
+            {'task': 'batch-a', 'duration': '3'},
+            'not an object',
+            {'task': 'batch-a', 'exit_code': 2, 'host': None},
+        ]
+        resp = self.post(json.dumps(records))
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual((resp.json['accepted'], resp.json['rejected']), (2, 5))
+        results = resp.json['results']
+        self.assertEqual([r['index'] for r in results], list(range(7)))
+        self.assertEqual([('id' in r) for r in results], [True, False, False, False, False, False, True])
+        self.assertEqual(results[1]['error'], 'task required')
+        self.assertEqual(results[2]['error'], 'params must be a string')
+        self.assertEqual(results[3]['error'], 'exit_code must be a number')
+        self.assertEqual(results[4]['error'], 'duration must be a number')
+
+        rows = self.stored('batch-a')
+        self.assertEqual(sorted((r['exit_code'], r['host']) for r in rows), [(0, 'h1'), (2, None)])
+
+    def test_ndjson_with_unparsable_line(self):
+        body = '{"task": "batch-b"}\n\nnot json\n{"task": "batch-b", "exit_code": 1}\n'
+        resp = self.post(body, content_type='application/x-ndjson')
+        self.assertEqual((resp.json['accepted'], resp.json['rejected']), (2, 1))
+        self.assertTrue(resp.json['results'][1]['error'].startswith('Invalid JSON'))
+        self.assertEqual(len(self.stored('batch-b')), 2)
+
+    def test_invalid_array_and_oversized_batch(self):
+        self.assertEqual(self.post('[{"task": ').status_code, 400)
+        too_many = json.dumps([{'task': 'batch-c'}] * (main.STATS_BATCH_MAX + 1))
+        self.assertEqual(self.post(too_many).status_code, 413)
+        self.assertEqual(self.stored('batch-c'), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+"""step_cache: 缓存键与缓存项校验; plan 中共用 Taskfile 的行内任务互不命中"""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from server_app import load_main, wait_plan, write_plan, write_task
+from artifact_store import ArtifactStore
+from step_cache import StepCache, step_key
+
+main = load_main()
+
+
+class StepKeyTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.taskfile = os.path.join(self.dir, 'Taskfile.yml')
+        with open(self.taskfile, 'w') as f:
+            f.write('version: "3"\n')
+        self.cache = StepCache(os.path.join(self.dir, 'cache'), ArtifactStore(os.path.join(self.dir, 'store')))
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def key(self, task, step_vars=None, placement=None):
+        return step_key(task, [self.taskfile], step_vars or {'V': 1}, {}, root=self.dir, placement=placement)
+
+    def test_inline_tasks_sharing_a_taskfile_get_different_keys(self):
+        self.assertEqual(self.key('build'), self.key('build'))
+        self.assertNotEqual(self.key('build'), self.key('test'))
+        self.assertNotEqual(self.key('build'), self.key('build', {'V': 2}))
+        before = self.key('build')
+        with open(self.taskfile, 'a') as f:
+            f.write('# changed\n')
+        self.assertNotEqual(self.key('build'), before)
+
+    def test_placement_is_part_of_the_key(self):
+        local = self.key('build')
+        on_a = self.key('build', placement={'node': 'a', 'tags': []})
+        self.assertNotEqual(local, on_a)
+        self.assertNotEqual(on_a, self.key('build', placement={'node': 'b', 'tags': []}))
+        self.assertNotEqual(on_a, self.key('build', placement={'node': None, 'tags': ['os:linux']}))
+
+    def test_get_checks_the_task(self):
+        key = self.key('build')
+        self.cache.put(key, {'task': 'build', 'exit_code': 0}, {})
+        self.assertEqual(self.cache.get(key, 'build')['exit_code'], 0)
+        self.assertIsNone(self.cache.get(key, 'test'))
+        self.assertIsNone(self.cache.get(self.key('test'), 'test'))
+
+
+@unittest.skipIf(main is None, 'Flask / flask_socketio 未安装')
+class PlanStepCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.client = main.app.test_client()
+
+    def run_plan(self, name):
+        run_id = self.client.post(f'/api/v1/plans/{name}/run', json={}).json['run_id']
+        run = wait_plan(self.client, run_id)
+        return run, {s['step_name']: s for s in run['steps']}
+
+    def test_inline_tasks_with_equal_vars_do_not_share_results(self):
+        write_task('cache-ok', 'echo ok-output\n')
+        write_task('cache-bad', 'echo bad-output\nexit 3\n')
+        write_plan('cache-pair', '''name: cache-pair
+cache: true
+vars: {}
+steps:
+  - name: ok
+    task: cache-ok
+    vars: {MODE: same}
+  - name: bad
+    task: cache-bad
+    vars: {MODE: same}
+''')
+        run, steps = self.run_plan('cache-pair')
+        self.assertEqual((steps['ok']['status'], steps['bad']['status']), ('success', 'failed'))
+        self.assertEqual(steps['bad']['exit_code'], 3)
+        self.assertIn('bad-output', steps['bad']['logs'])
+        self.assertEqual(run['status'], 'failed')
+
+        # 再次运行: 成功的步骤命中自己的缓存, 失败的步骤不会借用它的结果
+        run, steps = self.run_plan('cache-pair')
+        self.assertEqual((steps['ok']['status'], steps['bad']['status']), ('cached', 'failed'))
+        self.assertIn('ok-output', steps['ok']['logs'])
+        self.assertNotIn('ok-output', steps['bad']['logs'])
+
+
+if __name__ == '__main__':
+    unittest.main()
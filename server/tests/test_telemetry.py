@@ -0,0 +1,71 @@
+"""telemetry: 降采样分层与环形覆盖"""
+
+import os
+import sqlite3
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telemetry import FIELDS, TIERS, Telemetry, pick_tier, sample_from_load
+
+SCHEMA = f'''
+    CREATE TABLE node_metrics (
+        node_id TEXT NOT NULL, tier INTEGER NOT NULL, slot INTEGER NOT NULL, ts INTEGER NOT NULL,
+        samples INTEGER, {", ".join(f"{name} REAL" for name in FIELDS)},
+        PRIMARY KEY (node_id, tier, slot)
+    ) WITHOUT ROWID
+'''
+
+
+class TelemetryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.conn = sqlite3.connect(':memory:')
+        self.conn.execute(SCHEMA)
+
+    def rows(self, tier):
+        return self.conn.execute('SELECT slot, ts, samples, cpu FROM node_metrics WHERE tier = ? '
+                                 'ORDER BY ts', (tier,)).fetchall()
+
+    def test_buckets_average_per_tier(self):
+        t = Telemetry(tiers=((10, 6), (60, 10)))
+        t.record('n1', {'cpu': 10, 'mem': None}, now=1000)
+        t.record('n1', {'cpu': 30}, now=1005)
+        t.record('n1', {'cpu': 50}, now=1012)
+        self.assertEqual(t.flush(self.conn, now=1015), 1)        # 只有 10 秒层的第一个桶结束
+        self.assertEqual(self.rows(10), [((1000 // 10) % 6, 1000, 2, 20.0)])
+
+        # 未写入的桶也出现在查询结果中
+        series = t.query(self.conn, 'n1', 60, now=1015)
+        self.assertEqual((series['ts'], series['cpu'], series['mem']), ([960], [30.0], [None]))
+        self.assertEqual(t.flush(self.conn, now=1100), 2)
+        self.assertEqual(self.rows(60), [((960 // 60) % 10, 960, 3, 30.0)])
+
+    def test_ring_overwrites_slots_a_revolution_old(self):
+        t = Telemetry(tiers=((10, 3),))
+        for ts in range(0, 60, 10):
+            t.record('n1', {'cpu': ts}, now=ts)
+        t.flush(self.conn, now=100)
+        self.assertEqual(self.rows(10), [(0, 30, 1, 30.0), (1, 40, 1, 40.0), (2, 50, 1, 50.0)])
+        self.assertEqual(t.query(self.conn, 'n1', 10, now=55)['ts'], [30, 40, 50])
+        self.assertEqual(t.query(self.conn, 'n1', 10, now=55, since=40)['ts'], [50])
+
+    def test_forget_drops_unwritten_buckets(self):
+        t = Telemetry(tiers=((10, 6),))
+        t.record('n1', {'cpu': 1}, now=0)
+        t.record('n1', {'cpu': 1}, now=10)
+        t.forget('n1')
+        self.assertEqual(t.flush(self.conn, now=100), 0)
+
+    def test_pick_tier_and_sample(self):
+        self.assertEqual(pick_tier(600), TIERS[0])
+        self.assertEqual(pick_tier(86400), TIERS[1])
+        self.assertEqual(pick_tier(10 ** 9), TIERS[-1])
+        sample = sample_from_load({'loadavg': [1.5, 1, 1], 'mem_total': 200, 'mem_free': 50, 'cpu': 12}, jobs=2)
+        self.assertEqual((sample['load'], sample['mem'], sample['cpu'], sample['jobs'], sample['busy']),
+                         (1.5, 75.0, 12, 2, None))
+
+
+if __name__ == '__main__':
+    unittest.main()
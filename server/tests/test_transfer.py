@@ -0,0 +1,86 @@
+"""transfer: 分块清单、断点续传的缺失块与落盘"""
+
+import hashlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import transfer
+
+CHUNK = 1024
+
+
+class TransferTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.data = os.urandom(CHUNK * 3 + 100)
+        self.src = self.path('src.bin')
+        with open(self.src, 'wb') as f:
+            f.write(self.data)
+        self.manifest = transfer.build_manifest(self.src, CHUNK)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def path(self, name):
+        return os.path.join(self.dir, name)
+
+    def chunk(self, index):
+        offset, length = transfer.chunk_span(self.manifest, index)
+        return self.data[offset:offset + length]
+
+    def test_manifest(self):
+        self.assertEqual(self.manifest['size'], len(self.data))
+        self.assertEqual(self.manifest['digest'], hashlib.sha256(self.data).hexdigest())
+        self.assertEqual(len(self.manifest['chunks']), 4)
+        self.assertEqual(transfer.chunk_span(self.manifest, 3), (CHUNK * 3, 100))
+        self.assertEqual(self.manifest['chunks'][3], hashlib.sha256(self.data[-100:]).hexdigest())
+
+    def test_empty_file_has_no_chunks(self):
+        empty = self.path('empty')
+        open(empty, 'wb').close()
+        manifest = transfer.build_manifest(empty, CHUNK)
+        self.assertEqual((manifest['size'], manifest['chunks']), (0, []))
+        self.assertEqual(transfer.missing_chunks(self.path('nope'), manifest), [])
+
+    def test_missing_chunks_resume(self):
+        part = self.path('dst.part')
+        self.assertEqual(transfer.missing_chunks(part, self.manifest), [0, 1, 2, 3])
+        transfer.write_chunk(part, self.manifest, 2, io.BytesIO(self.chunk(2)))
+        transfer.write_chunk(part, self.manifest, 0, io.BytesIO(self.chunk(0)))
+        # 第 1 块是写第 2 块时留下的空洞, 内容不符仍算缺失
+        self.assertEqual(transfer.missing_chunks(part, self.manifest), [1, 3])
+
+        with open(part, 'r+b') as f:
+            f.seek(5)
+            f.write(b'\0' if self.data[5] else b'\1')
+        self.assertEqual(transfer.missing_chunks(part, self.manifest), [0, 1, 3])
+
+    def test_write_chunk_rejects_bad_or_short_data(self):
+        bad = bytearray(self.chunk(1))
+        bad[0] ^= 0xff
+        for name, payload in (('bad.part', bytes(bad)), ('short.part', self.chunk(1)[:-1])):
+            part = self.path(name)
+            with self.assertRaises(ValueError):
+                transfer.write_chunk(part, self.manifest, 1, io.BytesIO(payload))
+            self.assertIn(1, transfer.missing_chunks(part, self.manifest))
+
+    def test_finalize_truncates_and_renames(self):
+        part, dest = self.path('dst.part'), self.path('dst.bin')
+        with open(part, 'wb') as f:
+            f.write(self.data + b'stale tail from a longer earlier upload')
+        self.assertEqual(transfer.missing_chunks(part, self.manifest), [])
+        transfer.finalize(part, dest, self.manifest)
+        self.assertFalse(os.path.exists(part))
+        with open(dest, 'rb') as f:
+            self.assertEqual(f.read(), self.data)
+
+
+if __name__ == '__main__':
+    unittest.main()
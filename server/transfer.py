@@ -0,0 +1,106 @@
+"""分块传输: 清单 (每块 sha256)、断点续传时的已有块校验、按偏移写入
+
+Server (HTTP Range / 上传会话)、Agent 与 SSH (SFTP) 共用, 只依赖标准库。
+"""
+
+import os
+import hashlib
+
+CHUNK_SIZE = int(os.environ.get('EZ_TRANSFER_CHUNK', 4 * 1024 * 1024))
+IO_BUFSIZE = 64 * 1024
+
+
+def build_manifest(path, chunk_size=CHUNK_SIZE):
+    """文件清单: {size, chunk_size, digest, chunks: [每块 sha256]} (流式读取)"""
+    whole = hashlib.sha256()
+    chunks = []
+    with open(path, 'rb') as f:
+        while True:
+            h = hashlib.sha256()
+            remaining = chunk_size
+            while remaining:
+                buf = f.read(min(IO_BUFSIZE, remaining))
+                if not buf:
+                    break
+                h.update(buf)
+                whole.update(buf)
+                remaining -= len(buf)
+            if remaining == chunk_size:
+                break
+            chunks.append(h.hexdigest())
+            if remaining:
+                break
+    return {'size': os.path.getsize(path), 'chunk_size': chunk_size,
+            'digest': whole.hexdigest(), 'chunks': chunks}
+
+
+def chunk_span(manifest, index):
+    """第 index 块的 (offset, length)"""
+    offset = index * manifest['chunk_size']
+    return offset, min(manifest['chunk_size'], manifest['size'] - offset)
+
+
+def present_chunks(path, manifest):
+    """path 中已与清单一致的块序号 (文件不存在返回空集)"""
+    present = set()
+    try:
+        f = open(path, 'rb')
+    except OSError:
+        return present
+    with f:
+        size = os.fstat(f.fileno()).st_size
+        for index, expected in enumerate(manifest['chunks']):
+            offset, length = chunk_span(manifest, index)
+            if offset + length > size:
+                break
+            f.seek(offset)
+            if _hash_stream(f, length)[0] == expected:
+                present.add(index)
+    return present
+
+
+def missing_chunks(path, manifest):
+    """path 中缺失或内容不符的块序号"""
+    present = present_chunks(path, manifest)
+    return [i for i in range(len(manifest['chunks'])) if i not in present]
+
+
+def write_chunk(path, manifest, index, stream):
+    """从 stream 读取第 index 块写入 path 对应偏移, 校验失败抛 ValueError
+
+    stream 需提供 read(n); 按 IO_BUFSIZE 分段读写, 不整块驻留内存。
+    """
+    offset, length = chunk_span(manifest, index)
+    h = hashlib.sha256()
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT, 0o644)
+    with os.fdopen(fd, 'wb') as f:
+        f.seek(offset)
+        remaining = length
+        while remaining:
+            buf = stream.read(min(IO_BUFSIZE, remaining))
+            if not buf:
+                break
+            h.update(buf)
+            f.write(buf)
+            remaining -= len(buf)
+        if remaining or h.hexdigest() != manifest['chunks'][index]:
+            raise ValueError(f'chunk {index} checksum mismatch')
+
+
+def finalize(part, dest, manifest):
+    """截断到清单大小并改名为 dest"""
+    with open(part, 'ab') as f:
+        f.truncate(manifest['size'])
+    os.replace(part, dest)
+
+
+def _hash_stream(f, length):
+    h = hashlib.sha256()
+    remaining = length
+    while remaining:
+        buf = f.read(min(IO_BUFSIZE, remaining))
+        if not buf:
+            break
+        h.update(buf)
+        remaining -= len(buf)
+    return h.hexdigest(), length - remaining